@@ -0,0 +1,508 @@
+import colorsys
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from history import (History, AddVertex, MoveVertex, AddPolygon, DeletePolygon,
+                     SetCurrentPolygon, SetCropRect, AddCrop, DeleteCrop, RenameCrop, SetCropAspect,
+                     ClearAnnotations, Command)
+from exporters import EXPORTERS, export
+from metadata import ExportContext, crop_metadata, crops_metadata, polygons_metadata
+from polygon_store import PolygonStore
+from spatial_index import SpatialIndex
+
+Point = Tuple[float, float]
+Rect = Tuple[float, float, float, float]
+
+# Posição relativa de cada alça no retângulo de recorte
+CROP_HANDLES = {
+    'nw': (0, 0), 'ne': (1, 0), 'se': (1, 1), 'sw': (0, 1),
+    'n': (0.5, 0), 's': (0.5, 1), 'e': (1, 0.5), 'w': (0, 0.5)
+}
+
+
+class AnnotationSession:
+    """Estado e regras das anotações de uma imagem, sem dependência do Tk
+
+    Guarda polígonos, recorte, histórico e índice espacial, e implementa
+    as operações de edição em coordenadas da imagem. A interface converte
+    os eventos em coordenadas e chama estes métodos; scripts e benchmarks
+    podem fazer o mesmo sem display.
+    """
+
+    def __init__(self, width: int = 0, height: int = 0, image_path: Optional[str] = None,
+                 history_budget: Optional[int] = None):
+        self.image_path = image_path
+        self.width = width
+        self.height = height
+        self.image: Optional[np.ndarray] = None  # Buffer RGBX da imagem, se carregada
+        self.aspect_ratio = width / height if height else 1.0
+        self.keep_aspect_ratio = True
+
+        self.polygons = PolygonStore()  # Vértices, labels, IDs e cores em arrays contíguos
+        self.spatial_index = SpatialIndex()  # Índice espacial de self.polygons para cliques
+        self.current_polygon: List[Point] = []
+        self.crops: List[Dict[str, Any]] = []  # Recortes: 'rect', 'name', 'keep_aspect_ratio', 'aspect_ratio'
+        self.selected_crop_index: Optional[int] = None
+        self.next_crop_number = 1
+        self.selected_polygon_index: Optional[int] = None
+        self.next_polygon_id = 1
+        self.next_color_index = 0
+        self.history = History(history_budget)
+
+        # Interação em andamento (arraste de ponto ou de recorte)
+        self.dragging_point: Optional[int] = None
+        self.dragging_polygon: Optional[int] = None
+        self.drag_offset = (0, 0)
+        self.drag_start_point: Optional[Point] = None
+        self.crop_rect_before: Optional[Rect] = None
+        self.crop_start_point: Optional[Point] = None
+        self.selected_handle: Optional[str] = None
+        self.original_crop_rect: Optional[Rect] = None
+        self.rect_moving = False
+        self.rect_move_offset = (0, 0)
+
+    def set_image(self, image_path: Optional[str], width: int, height: int,
+                  image: Optional[np.ndarray] = None):
+        """Troca a imagem anotada (as anotações não são apagadas)"""
+        self.image_path = image_path
+        self.width = width
+        self.height = height
+        self.image = image
+        self.aspect_ratio = width / height
+
+    # Histórico
+
+    def execute(self, command: Command) -> Command:
+        """Aplica um comando registrando-o no histórico"""
+        self.history.do(command, self)
+        return command
+
+    def undo(self) -> Optional[Command]:
+        return self.history.undo(self)
+
+    def redo(self) -> Optional[Command]:
+        return self.history.redo(self)
+
+    def clear(self):
+        """Limpa todas as anotações (pode ser desfeito)"""
+        self.execute(ClearAnnotations(self))
+        self.dragging_point = None
+        self.dragging_polygon = None
+
+    # Polígonos
+
+    def generate_distinct_color(self) -> str:
+        """Gera uma cor distinta para cada polígono usando HSL"""
+        hue = self.next_color_index * 0.618033988749895  # Ângulo dourado
+        hue = hue % 1.0
+        r, g, b = colorsys.hls_to_rgb(hue, 0.5, 0.9)
+        self.next_color_index += 1
+        return f"#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}"
+
+    def add_vertex(self, x: float, y: float):
+        """Adiciona um ponto ao polígono em construção"""
+        self.execute(AddVertex((x, y)))
+
+    def set_current(self, points: List[Point]):
+        """Substitui o polígono em construção (ex.: contorno da varinha mágica)"""
+        self.execute(SetCurrentPolygon(self.current_polygon, list(points)))
+
+    def is_near_first_point(self, x: float, y: float, tolerance: float) -> bool:
+        """Indica se o ponto fecha o polígono em construção (perto do primeiro vértice)"""
+        if len(self.current_polygon) > 2:
+            first_x, first_y = self.current_polygon[0]
+            return (x - first_x) ** 2 + (y - first_y) ** 2 < tolerance ** 2
+        return False
+
+    def polygon_near(self, x: float, y: float, radius: float) -> Optional[int]:
+        """Polígono mais acima com o contorno dentro do raio"""
+        return self.spatial_index.polygon_near(x, y, radius)
+
+    def select_at(self, x: float, y: float, radius: float) -> Optional[int]:
+        """Seleciona o polígono cujo contorno está sob o ponto; retorna seu índice ou None
+
+        Com um polígono em construção nada é selecionado: o clique é um novo ponto.
+        """
+        if self.current_polygon:
+            return None
+        idx = self.polygon_near(x, y, radius)
+        if idx is not None:
+            self.selected_polygon_index = idx
+        return idx
+
+    def begin_vertex_drag(self, x: float, y: float, radius: float) -> bool:
+        """Começa a arrastar o vértice mais próximo dentro do raio, se houver"""
+        hit = self.spatial_index.nearest_vertex(x, y, radius)
+        if hit is not None:
+            poly_idx, point_idx = hit
+            self.dragging_polygon = poly_idx
+            self.dragging_point = point_idx
+            self.drag_start_point = tuple(self.polygons[poly_idx].points[point_idx].tolist())
+            self.drag_offset = (x - self.drag_start_point[0], y - self.drag_start_point[1])
+            return True
+
+        # Polígono em construção (poucos pontos, busca linear)
+        for point_idx, (px, py) in enumerate(self.current_polygon):
+            if (px - x) ** 2 + (py - y) ** 2 <= radius ** 2:
+                self.dragging_point = point_idx
+                self.drag_start_point = (px, py)
+                self.drag_offset = (x - px, y - py)
+                return True
+        return False
+
+    def drag_vertex(self, x: float, y: float):
+        """Move o vértice em arraste para acompanhar o ponto (sem registrar no histórico)"""
+        new_point = (x - self.drag_offset[0], y - self.drag_offset[1])
+        if self.dragging_polygon is not None:
+            self.polygons.move_vertex(self.dragging_polygon, self.dragging_point, new_point)
+            self.spatial_index.move_vertex(self.dragging_polygon, self.dragging_point, new_point)
+        elif self.current_polygon:
+            self.current_polygon[self.dragging_point] = new_point
+
+    def end_vertex_drag(self) -> bool:
+        """Termina o arraste, registrando o movimento; retorna se o ponto mudou"""
+        if self.dragging_polygon is not None:
+            end_point = tuple(self.polygons[self.dragging_polygon].points[self.dragging_point].tolist())
+        else:
+            end_point = self.current_polygon[self.dragging_point]
+        moved = end_point != self.drag_start_point
+        if moved:
+            self.history.record(MoveVertex(self.dragging_polygon, self.dragging_point,
+                                           self.drag_start_point, end_point))
+        self.dragging_point = None
+        self.dragging_polygon = None
+        return moved
+
+    def finalize_polygon(self, label: str, poly_id: int) -> Dict[str, Any]:
+        """Transforma o polígono em construção em um polígono finalizado (e o seleciona)"""
+        if len(self.current_polygon) < 3:
+            raise ValueError("Um polígono precisa de pelo menos 3 pontos")
+        polygon = {
+            'points': self.current_polygon.copy(),
+            'label': label,
+            'id': poly_id,
+            'color': self.generate_distinct_color()
+        }
+        self.execute(AddPolygon(polygon, self))
+        return polygon
+
+    def cancel_current(self) -> bool:
+        """Descarta o polígono em construção; retorna se havia algum"""
+        if not self.current_polygon:
+            return False
+        self.execute(SetCurrentPolygon(self.current_polygon, []))
+        return True
+
+    def delete_polygon(self, index: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Remove o polígono dado (padrão: o selecionado, ou o último) e retorna seus dados"""
+        if index is None:
+            index = self.selected_polygon_index
+            if index is None or index >= len(self.polygons):
+                index = len(self.polygons) - 1
+        if not 0 <= index < len(self.polygons):
+            return None
+        return self.execute(DeletePolygon(index, self)).polygon
+
+    # Recorte
+
+    @property
+    def crop_rect(self) -> Optional[Rect]:
+        """Retângulo do recorte selecionado (None se nenhum)"""
+        if self.selected_crop_index is None:
+            return None
+        return self.crops[self.selected_crop_index]['rect']
+
+    @crop_rect.setter
+    def crop_rect(self, rect: Rect):
+        # Durante o arraste: altera o recorte selecionado ou cria um novo (registrado ao soltar)
+        if self.selected_crop_index is None:
+            self.crops.append(self.new_crop(rect))
+            self.selected_crop_index = len(self.crops) - 1
+        else:
+            self.crops[self.selected_crop_index]['rect'] = rect
+
+    def new_crop(self, rect: Rect) -> Dict[str, Any]:
+        """Novo recorte com nome sequencial e a proporção atual"""
+        crop = {
+            'rect': rect,
+            'name': f"recorte_{self.next_crop_number}",
+            'keep_aspect_ratio': self.keep_aspect_ratio,
+            'aspect_ratio': self.aspect_ratio
+        }
+        self.next_crop_number += 1
+        return crop
+
+    def set_crop_rect(self, rect: Optional[Rect]):
+        """Define o retângulo do recorte selecionado (cria um, se nenhum; remove, com None)"""
+        index = self.selected_crop_index
+        if rect is None:
+            self.delete_crop()
+        elif index is None:
+            self.execute(AddCrop(self.new_crop(rect), len(self.crops), None))
+        elif rect != self.crops[index]['rect']:
+            self.execute(SetCropRect(index, self.crops[index]['rect'], rect))
+
+    def crop_at(self, x: float, y: float) -> Optional[int]:
+        """Recorte mais acima que contém o ponto"""
+        for index in range(len(self.crops) - 1, -1, -1):
+            x1, y1, x2, y2 = self.crops[index]['rect']
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                return index
+        return None
+
+    def delete_crop(self, index: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Remove o recorte dado (padrão: o selecionado) e retorna seus dados"""
+        if index is None:
+            index = self.selected_crop_index
+        if index is None or not 0 <= index < len(self.crops):
+            return None
+        return self.execute(DeleteCrop(index, self)).crop
+
+    def rename_crop(self, index: int, name: str):
+        old = self.crops[index]['name']
+        if name != old:
+            self.execute(RenameCrop(index, old, name))
+
+    def set_aspect_lock(self, keep: bool, ratio: Optional[float] = None):
+        """Trava de proporção dos próximos recortes e do selecionado (no histórico)"""
+        self.keep_aspect_ratio = keep
+        if ratio is not None:
+            self.aspect_ratio = ratio
+        index = self.selected_crop_index
+        if index is not None:
+            old = self.crop_aspect()
+            new = (keep, old[1] if ratio is None else ratio)
+            if new != old:
+                self.execute(SetCropAspect(index, old, new))
+
+    def crop_aspect(self) -> Tuple[bool, float]:
+        """Trava e proporção do recorte selecionado (ou as padrão, para um novo)"""
+        if self.selected_crop_index is None:
+            return self.keep_aspect_ratio, self.aspect_ratio
+        crop = self.crops[self.selected_crop_index]
+        return crop['keep_aspect_ratio'], crop['aspect_ratio']
+
+    def crop_handles(self) -> Dict[str, Point]:
+        """Posição de cada alça do recorte selecionado, em coordenadas da imagem"""
+        if not self.crop_rect:
+            return {}
+        x1, y1, x2, y2 = self.crop_rect
+        return {name: (x1 + (x2 - x1) * hx, y1 + (y2 - y1) * hy) for name, (hx, hy) in CROP_HANDLES.items()}
+
+    def handle_at(self, x: float, y: float, radius: float) -> Optional[str]:
+        """Nome da alça do recorte selecionado sob o ponto (tolerância `radius`), se houver"""
+        for name, (hx, hy) in self.crop_handles().items():
+            if abs(x - hx) <= radius and abs(y - hy) <= radius:
+                return name
+        return None
+
+    def begin_crop(self, x: float, y: float, handle_radius: float):
+        """Clique no modo recorte: alça do selecionado, movimento de outro recorte ou novo recorte"""
+        handle = self.handle_at(x, y, handle_radius)
+        if handle is not None:
+            # Guarda o recorte atual para registrar a alteração ao soltar
+            self.crop_rect_before = self.crop_rect
+            self.selected_handle = handle
+            self.crop_start_point = (x, y)
+            self.original_crop_rect = self.crop_rect
+            return
+
+        index = self.crop_at(x, y)
+        if index is not None:
+            self.selected_crop_index = index
+            self.begin_move_crop(x, y)
+        else:
+            # Novo recorte: só é criado no primeiro arraste
+            self.selected_crop_index = None
+            self.crop_rect_before = None
+            self.crop_start_point = (x, y)
+
+    def drag_crop(self, x: float, y: float) -> bool:
+        """Redimensiona, move ou desenha o recorte durante o arraste; retorna se mudou"""
+        if self.rect_moving:
+            self.move_crop(x, y)
+            return True
+        if not self.crop_start_point:
+            return False
+        if self.selected_handle is not None:
+            self.resize_crop(x, y)
+        else:
+            self.stretch_crop(x, y)
+        return True
+
+    def resize_crop(self, new_x: float, new_y: float):
+        """Redimensiona o recorte pela alça selecionada"""
+        x1, y1, x2, y2 = self.original_crop_rect
+        hx, hy = CROP_HANDLES.get(self.selected_handle, (0, 0))
+        keep_aspect_ratio, aspect_ratio = self.crop_aspect()
+
+        if keep_aspect_ratio:
+            dx = new_x - self.crop_start_point[0]
+            dy = new_y - self.crop_start_point[1]
+
+            # Mantém a proporção
+            if abs(dx) > abs(dy):
+                dy = dx / aspect_ratio
+            else:
+                dx = dy * aspect_ratio
+
+            new_x = self.crop_start_point[0] + dx
+            new_y = self.crop_start_point[1] + dy
+
+        # Atualiza as coordenadas baseadas na alça selecionada (0.5 = centro, não muda)
+        if hx == 0:   # Lado esquerdo
+            x1 = min(new_x, x2)
+        elif hx == 1: # Lado direito
+            x2 = max(new_x, x1)
+
+        if hy == 0:   # Topo
+            y1 = min(new_y, y2)
+        elif hy == 1: # Fundo
+            y2 = max(new_y, y1)
+
+        self.crop_rect = (x1, y1, x2, y2)
+
+    def stretch_crop(self, x2: float, y2: float):
+        """Desenha o recorte do ponto inicial até o ponto dado"""
+        x1, y1 = self.crop_start_point
+        keep_aspect_ratio, aspect_ratio = self.crop_aspect()
+
+        if keep_aspect_ratio:
+            dx = x2 - x1
+            dy = y2 - y1
+
+            # Mantém a proporção
+            if abs(dx) > abs(dy):
+                y2 = y1 + dx / aspect_ratio
+            else:
+                x2 = x1 + dy * aspect_ratio
+
+        self.crop_rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def end_crop(self) -> bool:
+        """Solta o botão no modo recorte: ajusta à imagem e registra; retorna se havia recorte"""
+        self.crop_start_point = None
+        self.selected_handle = None
+        if self.rect_moving:
+            self.end_move_crop()
+            return True
+        if not self.crop_rect:
+            return False
+        self.clamp_crop_rect()
+        x1, y1, x2, y2 = self.crop_rect
+        if self.crop_rect_before is None and (x2 - x1 < 1 or y2 - y1 < 1):
+            # Arraste sem área: descarta o recorte novo
+            self.crops.pop(self.selected_crop_index)
+            self.selected_crop_index = None
+            self.next_crop_number -= 1
+            return False
+        self.record_crop_change()
+        return True
+
+    def clamp_crop_rect(self):
+        """Ajusta coordenadas finais do recorte aos limites da imagem"""
+        x1, y1, x2, y2 = self.crop_rect
+        self.crop_rect = (
+            max(0, min(x1, x2)),
+            max(0, min(y1, y2)),
+            min(self.width, max(x1, x2)),
+            min(self.height, max(y1, y2))
+        )
+
+    def contains_crop(self, x: float, y: float) -> bool:
+        if not self.crop_rect:
+            return False
+        x1, y1, x2, y2 = self.crop_rect
+        return x1 <= x <= x2 and y1 <= y <= y2
+
+    def begin_move_crop(self, x: float, y: float):
+        """Seleciona o recorte sob o ponto e começa a movê-lo"""
+        index = self.crop_at(x, y)
+        if index is None:
+            return
+        self.selected_crop_index = index
+        self.crop_rect_before = self.crop_rect
+        self.rect_moving = True
+        self.rect_move_offset = (x - self.crop_rect[0], y - self.crop_rect[1])
+
+    def move_crop(self, x: float, y: float):
+        """Move o recorte mantendo o tamanho e sem sair da imagem"""
+        offset_x, offset_y = self.rect_move_offset
+        rect_width = self.crop_rect[2] - self.crop_rect[0]
+        rect_height = self.crop_rect[3] - self.crop_rect[1]
+
+        x1 = max(0, min(x - offset_x, self.width - rect_width))
+        y1 = max(0, min(y - offset_y, self.height - rect_height))
+        self.crop_rect = (x1, y1, x1 + rect_width, y1 + rect_height)
+
+    def end_move_crop(self):
+        """Termina o movimento do recorte, registrando-o no histórico"""
+        if self.rect_moving:
+            self.record_crop_change()
+        self.rect_moving = False
+
+    def record_crop_change(self):
+        """Registra no histórico a criação ou alteração do recorte desde o último clique"""
+        index = self.selected_crop_index
+        if index is None:
+            return
+        if self.crop_rect_before is None:
+            # Recorte desenhado neste arraste (já está na lista)
+            self.history.record(AddCrop(self.crops[index], index, None))
+        elif self.crop_rect != self.crop_rect_before:
+            self.history.record(SetCropRect(index, self.crop_rect_before, self.crop_rect))
+        self.crop_rect_before = self.crop_rect
+
+    # Exportação
+
+    def polygons_metadata(self) -> Dict[str, Any]:
+        """Estrutura completa do JSON de polígonos, com coordenadas normalizadas"""
+        return polygons_metadata(self.image_path, self.width, self.height, self.polygons)
+
+    def crop_metadata(self) -> Dict[str, Any]:
+        """Metadados do recorte selecionado"""
+        x1, y1, x2, y2 = self.crop_rect
+        return crop_metadata(self.width, self.height, x1, y1, x2, y2, image_path=self.image_path)
+
+    def crops_metadata(self, files: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Metadados de todos os recortes (absolutos, relativos e YOLO), em um só arquivo"""
+        return crops_metadata(self.width, self.height, self.crops, image_path=self.image_path, files=files)
+
+    def crop_file_names(self, extension: str) -> List[str]:
+        """Nome do arquivo de cada recorte: `<imagem>_<nome><ext>`, sem repetições"""
+        stem = os.path.splitext(os.path.basename(self.image_path or "imagem"))[0]
+        names, used = [], set()
+        for crop in self.crops:
+            safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in crop['name']) or "recorte"
+            name, n = f"{stem}_{safe}", 2
+            while name.lower() in used:
+                name, n = f"{stem}_{safe}_{n}", n + 1
+            used.add(name.lower())
+            names.append(name + extension)
+        return names
+
+    def export_context(self, polygons: bool = True, crops: bool = True,
+                       crop_files: Optional[List[str]] = None) -> ExportContext:
+        """Cópia das anotações, com as coordenadas normalizadas, para os formatos de exportação"""
+        return ExportContext(self.image_path, self.width, self.height,
+                             self.polygons if polygons else (), self.crops if crops else (), crop_files)
+
+    def save_polygons(self, path: str, masks: bool = False, formats: Sequence[str] = ()) -> List[str]:
+        """Grava o JSON de polígonos (e os outros formatos pedidos, em paralelo) e retorna os arquivos"""
+        formats = [*formats, "masks"] if masks else formats
+        written = export(self.export_context(crops=False), os.path.splitext(path)[0], formats)
+        return [output for outputs in written.values() for output in outputs]
+
+    def save_masks(self, json_path: str) -> List[str]:
+        """Grava as máscaras semântica e de instâncias ao lado do JSON de polígonos"""
+        return EXPORTERS["masks"].write(self.export_context(crops=False), os.path.splitext(json_path)[0])
+
+    def save_crop_metadata(self, path: str) -> str:
+        """Grava os metadados do recorte ao lado da imagem recortada"""
+        json_path = os.path.splitext(path)[0] + ".json"
+        with open(json_path, 'w') as f:
+            json.dump(self.crop_metadata(), f, indent=4)
+        return json_path
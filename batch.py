@@ -0,0 +1,294 @@
+"""Processamento em lote, sem interface gráfica, dos JSONs de recorte e polígonos
+
+Uso:
+    python main.py batch <pasta_json> <pasta_saida> [--images PASTA] [--workers N] [--memory-mb MB]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, Dict, List, Optional
+
+import cv2
+
+from image_io import estimate_nbytes, image_size
+from metadata import crop_metadata, crops_metadata, denormalize_polygons, polygons_metadata, relative_crop_to_absolute
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif")
+# Memória das imagens de origem decodificadas ao mesmo tempo por todos os processos (em MB)
+DEFAULT_MEMORY_MB = int(os.environ.get("MAPGEN_BATCH_MEMORY_MB", "4096"))
+
+
+def sidecar_kind(metadata: Dict[str, Any]) -> Optional[str]:
+    """Identifica se um JSON é de recorte ('crop'), de vários recortes ('crops') ou de polígonos ('polygons')"""
+    if "polygons_normalized" in metadata:
+        return "polygons"
+    if "crop_coordinates_relative" in metadata:
+        return "crop"
+    if "crops" in metadata:
+        return "crops"
+    return None
+
+
+def find_sidecars(directory: str, exclude: Optional[str] = None) -> List[str]:
+    """Lista recursivamente os JSONs da pasta, em ordem, ignorando a pasta `exclude`"""
+    exclude = os.path.abspath(exclude) if exclude else None
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        if exclude:
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude]
+        for name in files:
+            if name.lower().endswith(".json"):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def resolve_source(image_path: Optional[str], images_dir: Optional[str]) -> Optional[str]:
+    """Acha a imagem de origem, preferindo uma nova digitalização em `images_dir`"""
+    if not image_path:
+        return None
+    if images_dir:
+        candidate = os.path.join(images_dir, os.path.basename(image_path))
+        if os.path.exists(candidate):
+            return candidate
+    return image_path if os.path.exists(image_path) else None
+
+
+@lru_cache(maxsize=64)
+def images_by_stem(directory: str) -> Dict[str, str]:
+    """Imagens da pasta (sem subpastas) pelo nome sem extensão (lista guardada por processo)"""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return {}
+    return {os.path.splitext(n)[0]: os.path.join(directory, n)
+            for n in names if n.lower().endswith(IMAGE_EXTENSIONS)}
+
+
+def match_legacy_image(sidecar: str, width: int, height: int, images: Dict[str, str]) -> Optional[str]:
+    """Imagem de origem de um JSON de recorte antigo, que não guarda `image_path`
+
+    O nome do recorte costuma começar pelo nome da imagem (ex.:
+    `mapa_recorte.json` de `mapa.tif`): vale a imagem de nome mais longo que
+    seja prefixo do nome do JSON e tenha o tamanho registrado nele.
+    `images` mapeia o nome sem extensão de cada imagem para o caminho.
+    """
+    stem = os.path.splitext(os.path.basename(sidecar))[0]
+    for name in sorted((n for n in images if stem.startswith(n)), key=len, reverse=True):
+        if image_size(images[name]) == (width, height):
+            return images[name]
+    return None
+
+
+def sidecar_source(json_path: str, metadata: Dict[str, Any], images_dir: Optional[str]) -> Optional[str]:
+    """Imagem de origem de um JSON do editor
+
+    Recortes antigos não têm `image_path`: a origem é procurada pelo nome e
+    por `original_size` em `images_dir` e, se não estiver lá, na pasta do
+    próprio JSON (onde uma digitalização com o mesmo nome em `images_dir`
+    ainda tem preferência).
+    """
+    image_path = metadata.get("image_path")
+    if image_path or "original_size" not in metadata:
+        return resolve_source(image_path, images_dir)
+    width, height = metadata["original_size"]["width"], metadata["original_size"]["height"]
+    if images_dir:
+        match = match_legacy_image(json_path, width, height, images_by_stem(os.path.abspath(images_dir)))
+        if match is not None:
+            return match
+    folder = os.path.dirname(os.path.abspath(json_path))
+    return resolve_source(match_legacy_image(json_path, width, height, images_by_stem(folder)), images_dir)
+
+
+def crop_extension(json_path: str, default: str = ".png") -> str:
+    """Reaproveita a extensão do recorte original salvo ao lado do JSON"""
+    stem = os.path.splitext(json_path)[0]
+    for ext in IMAGE_EXTENSIONS:
+        if os.path.exists(stem + ext):
+            return ext
+    return default
+
+
+def plan_sidecar(json_path: str, images_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Memória que processar o JSON vai ocupar, lendo só cabeçalhos (roda em um processo do pool)
+
+    Recortes decodificam a imagem de origem inteira; polígonos só leem o
+    tamanho. JSONs que nem chegariam a ser processados voltam com o status
+    final, como em `process_sidecar`.
+    """
+    try:
+        with open(json_path) as f:
+            metadata = json.load(f)
+        kind = sidecar_kind(metadata)
+        if kind is None:
+            return {"path": json_path, "status": "skipped", "reason": "formato desconhecido"}
+        source = sidecar_source(json_path, metadata, images_dir)
+    except Exception as e:  # Um arquivo inválido não interrompe o lote
+        return {"path": json_path, "status": "error", "reason": str(e)}
+    if source is None:
+        return {"path": json_path, "status": "error", "reason": "imagem de origem não encontrada"}
+    nbytes = 0 if kind == "polygons" else estimate_nbytes(source) or 0
+    return {"path": json_path, "nbytes": nbytes}
+
+
+def process_sidecar(json_path: str, output_dir: str, images_dir: Optional[str] = None,
+                    image_format: Optional[str] = None) -> Dict[str, Any]:
+    """Reaplica um JSON à sua imagem de origem e grava o resultado (roda em um processo do pool)"""
+    with open(json_path) as f:
+        metadata = json.load(f)
+
+    kind = sidecar_kind(metadata)
+    if kind is None:
+        return {"path": json_path, "status": "skipped", "reason": "formato desconhecido"}
+
+    source = sidecar_source(json_path, metadata, images_dir)
+    if source is None:
+        return {"path": json_path, "status": "error", "reason": "imagem de origem não encontrada"}
+
+    name = os.path.splitext(os.path.basename(json_path))[0]
+    out_json = os.path.join(output_dir, name + ".json")
+
+    if kind == "polygons":
+        # Só o cabeçalho é lido para obter o tamanho; não há decodificação
+        size = image_size(source)
+        if size is None:
+            return {"path": json_path, "status": "error", "reason": f"não foi possível ler {source}"}
+        width, height = size
+        polygons = denormalize_polygons(metadata["polygons_normalized"], width, height)
+        result = polygons_metadata(source, width, height, polygons)
+        outputs = [out_json]
+    elif kind == "crops":
+        image = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return {"path": json_path, "status": "error", "reason": f"não foi possível ler {source}"}
+        height, width = image.shape[:2]
+        crops, files, outputs = [], [], []
+        for entry in metadata["crops"]:
+            x1, y1, x2, y2 = relative_crop_to_absolute(entry["crop_coordinates_relative"], width, height)
+            file = entry.get("file") or f"{name}_{entry['name']}.png"
+            if image_format:
+                file = os.path.splitext(file)[0] + "." + image_format.lstrip(".")
+            out_image = os.path.join(output_dir, file)
+            params = [cv2.IMWRITE_JPEG_QUALITY, 95] if file.lower().endswith((".jpg", ".jpeg")) else []
+            if not cv2.imwrite(out_image, image[y1:y2, x1:x2], params):
+                return {"path": json_path, "status": "error", "reason": f"falha ao gravar {out_image}"}
+            crops.append({"rect": (x1, y1, x2, y2), "name": entry["name"]})
+            files.append(file)
+            outputs.append(out_image)
+        result = crops_metadata(width, height, crops, image_path=source, files=files)
+        outputs.append(out_json)
+    else:
+        image = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return {"path": json_path, "status": "error", "reason": f"não foi possível ler {source}"}
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = relative_crop_to_absolute(metadata["crop_coordinates_relative"], width, height)
+
+        ext = "." + image_format.lstrip(".") if image_format else crop_extension(json_path)
+        out_image = os.path.join(output_dir, name + ext)
+        params = [cv2.IMWRITE_JPEG_QUALITY, 95] if ext.lower() in (".jpg", ".jpeg") else []
+        if not cv2.imwrite(out_image, image[y1:y2, x1:x2], params):
+            return {"path": json_path, "status": "error", "reason": f"falha ao gravar {out_image}"}
+        result = crop_metadata(width, height, x1, y1, x2, y2, image_path=source)
+        outputs = [out_image, out_json]
+
+    with open(out_json, 'w') as f:
+        json.dump(result, f, indent=4)
+    return {"path": json_path, "status": "ok", "kind": kind, "outputs": outputs}
+
+
+def run_batch(input_dir: str, output_dir: str, images_dir: Optional[str] = None,
+              workers: Optional[int] = None, image_format: Optional[str] = None,
+              progress=print, memory_mb: int = DEFAULT_MEMORY_MB) -> Dict[str, Any]:
+    """Processa todos os JSONs de uma pasta em paralelo e retorna um resumo
+
+    Cada recorte decodifica a imagem de origem inteira no seu processo, então
+    só entram em execução ao mesmo tempo JSONs cujas imagens decodificadas
+    cabem em `memory_mb` (um JSON maior que o limite roda sozinho).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    sidecars = find_sidecars(input_dir, exclude=output_dir)
+    total = len(sidecars)
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    budget_bytes = memory_mb * 1024 * 1024
+    start = time.perf_counter()
+    done = 0
+
+    def report(result: Dict[str, Any]):
+        nonlocal done
+        done += 1
+        counts[result["status"]] += 1
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = f"[{done}/{total}] {result['status']}: {os.path.basename(result['path'])} ({rate:.1f} img/s)"
+        if result["status"] != "ok":
+            line += f" - {result['reason']}"
+        progress(line)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        queue = deque()
+        for plan in pool.map(plan_sidecar, sidecars, repeat(images_dir), chunksize=16):
+            if "status" in plan:
+                report(plan)
+            else:
+                queue.append(plan)
+
+        running = {}
+        reserved = 0
+        while queue or running:
+            # Sem espaço no orçamento, os seguintes esperam um processo terminar
+            while queue and (not running or reserved + queue[0]["nbytes"] <= budget_bytes):
+                plan = queue.popleft()
+                future = pool.submit(process_sidecar, plan["path"], output_dir, images_dir, image_format)
+                running[future] = plan
+                reserved += plan["nbytes"]
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                plan = running.pop(future)
+                reserved -= plan["nbytes"]
+                try:
+                    result = future.result()
+                except Exception as e:  # Um arquivo inválido não interrompe o lote
+                    result = {"path": plan["path"], "status": "error", "reason": str(e)}
+                report(result)
+
+    elapsed = time.perf_counter() - start
+    summary = dict(counts, total=total, seconds=elapsed,
+                   images_per_second=counts["ok"] / elapsed if elapsed > 0 else 0.0)
+    progress(f"Concluído: {counts['ok']} ok, {counts['skipped']} ignorados, {counts['error']} erros "
+             f"em {elapsed:.1f}s ({summary['images_per_second']:.1f} img/s)")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Reaplica recortes e polígonos salvos em JSON a pastas inteiras de imagens"
+    )
+    parser.add_argument("input_dir", help="pasta com os JSONs gerados pelo editor")
+    parser.add_argument("output_dir", help="pasta onde os resultados serão gravados")
+    parser.add_argument("--images", dest="images_dir",
+                        help="pasta com as imagens de origem (ex.: digitalizações em maior resolução)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos (padrão: número de CPUs); cada recorte decodifica a "
+                             "imagem de origem inteira (~largura x altura x 4 bytes) no seu processo")
+    parser.add_argument("--memory-mb", type=int, default=DEFAULT_MEMORY_MB,
+                        help="memória total das imagens decodificadas ao mesmo tempo; limita quantos "
+                             f"processos trabalham em paralelo com mapas grandes (padrão: {DEFAULT_MEMORY_MB})")
+    parser.add_argument("--format", dest="image_format", choices=["png", "jpg"],
+                        help="formato dos recortes (padrão: o mesmo do recorte original)")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.input_dir, args.output_dir, args.images_dir, args.workers, args.image_format,
+                        memory_mb=args.memory_mb)
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
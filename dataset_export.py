@@ -0,0 +1,289 @@
+"""Exportação dos JSONs de polígonos para um dataset COCO e/ou YOLO de segmentação
+
+Uso:
+    python main.py export <pasta_json> <pasta_saida> [--format coco yolo] [--classes ARQUIVO] [--workers N]
+
+Os JSONs são lidos em um pool de processos e os resultados são gravados
+à medida que chegam, na ordem dos arquivos; a memória usada não depende
+do número de imagens.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from batch import find_sidecars, sidecar_kind
+from metadata import ExportContext
+
+FORMATS = ("coco", "yolo")
+
+
+class CategoryMap:
+    """Mapeia labels para IDs de categoria estáveis
+
+    Com uma lista de classes fixa, labels desconhecidos são rejeitados;
+    sem ela, cada label novo recebe o próximo ID na ordem de aparição.
+    """
+
+    def __init__(self, labels: Optional[Iterable[str]] = None):
+        self.labels: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self.frozen = labels is not None
+        for label in labels or ():
+            self._add(label)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def index(self, label: str) -> Optional[int]:
+        """Índice da classe (base 0, como no YOLO); None se o label não for aceito"""
+        index = self._ids.get(label)
+        if index is None and not self.frozen:
+            index = self._add(label)
+        return index
+
+    def coco_categories(self) -> List[Dict[str, Any]]:
+        """Lista de categorias do COCO (IDs a partir de 1)"""
+        return [{"id": i + 1, "name": label, "supercategory": "none"} for i, label in enumerate(self.labels)]
+
+    def _add(self, label: str) -> int:
+        index = self._ids.setdefault(label, len(self.labels))
+        if index == len(self.labels):
+            self.labels.append(label)
+        return index
+
+
+def read_classes(path: str) -> List[str]:
+    """Lê uma lista de classes, uma por linha (formato classes.txt do YOLO)"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_sidecar(json_path: str) -> Optional[Dict[str, Any]]:
+    """Lê um JSON de polígonos e prepara os dados de exportação (roda em um processo do pool)
+
+    Retorna None para JSONs que não são de polígonos. Área, caixa e
+    coordenadas normalizadas são calculadas aqui, fora do processo principal.
+    """
+    with open(json_path) as f:
+        metadata = json.load(f)
+    if sidecar_kind(metadata) != "polygons":
+        return None
+
+    image_path = metadata.get("image_path") or os.path.splitext(json_path)[0]
+    context = ExportContext.from_metadata(metadata, image_path)
+    polygons = context.polygon_entries()
+    for i, polygon in enumerate(polygons):
+        polygon["yolo"] = context.yolo_coordinates(i)
+    return {"path": json_path, "image_path": image_path, "width": context.width, "height": context.height,
+            "polygons": polygons}
+
+
+def ordered_results(pool: ProcessPoolExecutor, fn: Callable, items: List[Any],
+                    window: int) -> Iterator[Any]:
+    """Como `pool.map`, mas com no máximo `window` tarefas em andamento
+
+    Mantém a ordem de entrada sem acumular os resultados de todo o lote.
+    """
+    pending = deque()
+    items = iter(items)
+    for item in items:
+        pending.append((item, pool.submit(fn, item)))
+        if len(pending) >= window:
+            break
+    while pending:
+        item, future = pending.popleft()
+        next_item = next(items, None)
+        if next_item is not None:
+            pending.append((next_item, pool.submit(fn, next_item)))
+        try:
+            yield item, future.result(), None
+        except Exception as e:  # Um arquivo inválido não interrompe a exportação
+            yield item, None, e
+
+
+class CocoWriter:
+    """Grava um `annotations.json` do COCO de forma incremental
+
+    As imagens vão direto para o arquivo final e as anotações para um
+    arquivo temporário, que é concatenado no fim junto com as categorias.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._annotations = tempfile.TemporaryFile("w+", encoding="utf-8", dir=os.path.dirname(path) or None)
+        self._file.write('{"info": {"description": "MapGen"}, "images": [\n')
+        self.images = 0
+        self.annotations = 0
+
+    def add(self, parsed: Dict[str, Any], category_ids: List[int]):
+        self.images += 1
+        image_id = self.images
+        image = {"id": image_id, "file_name": os.path.basename(parsed["image_path"]),
+                 "path": parsed["image_path"], "width": parsed["width"], "height": parsed["height"]}
+        self._file.write((",\n" if image_id > 1 else "") + json.dumps(image))
+
+        for polygon, category_id in zip(parsed["polygons"], category_ids):
+            self.annotations += 1
+            annotation = {
+                "id": self.annotations,
+                "image_id": image_id,
+                "category_id": category_id,
+                "segmentation": [polygon["segmentation"]],
+                "area": polygon["area"],
+                "bbox": polygon["bbox"],
+                "iscrowd": 0,
+                "polygon_id": polygon["id"],
+            }
+            self._annotations.write((",\n" if self.annotations > 1 else "") + json.dumps(annotation))
+
+    def close(self, categories: CategoryMap):
+        self._file.write('\n], "annotations": [\n')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._file)
+        self._annotations.close()
+        self._file.write('\n], "categories": ' + json.dumps(categories.coco_categories()) + "}\n")
+        self._file.close()
+
+
+class YoloWriter:
+    """Grava um `.txt` de segmentação YOLO por imagem, mais o `classes.txt`
+
+    O arquivo leva o nome da imagem. Imagens de mesmo nome em pastas
+    diferentes não se sobrescrevem: a partir da segunda, o nome ganha o da
+    pasta como prefixo (e um hash do caminho, se ainda colidir), e a
+    correspondência fica em `renamed.txt`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, "labels")
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = 0
+        self.names: Dict[str, str] = {}  # Nome do arquivo -> imagem
+        self.renamed: List[Tuple[str, str]] = []  # (arquivo de labels, imagem)
+
+    def label_name(self, image_path: str) -> str:
+        """Nome (sem extensão) do arquivo de labels da imagem, único no dataset"""
+        image_path = os.path.abspath(image_path)
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        folder = os.path.basename(os.path.dirname(image_path))
+        digest = hashlib.sha1(image_path.encode("utf-8")).hexdigest()[:8]
+        for name in (stem, f"{folder}_{stem}", f"{folder}_{stem}_{digest}"):
+            owner = self.names.setdefault(name, image_path)
+            if owner == image_path:
+                if name != stem:
+                    self.renamed.append((name, image_path))
+                return name
+        raise ValueError(f"nome de labels repetido para {image_path}")
+
+    def add(self, parsed: Dict[str, Any], class_indices: List[int]):
+        name = self.label_name(parsed["image_path"])
+        with open(os.path.join(self.directory, name + ".txt"), "w") as f:
+            for polygon, index in zip(parsed["polygons"], class_indices):
+                f.write(f"{index} {polygon['yolo']}\n")
+        self.files += 1
+
+    def close(self, categories: CategoryMap):
+        with open(os.path.join(os.path.dirname(self.directory), "classes.txt"), "w", encoding="utf-8") as f:
+            f.writelines(label + "\n" for label in categories.labels)
+        if self.renamed:
+            with open(os.path.join(os.path.dirname(self.directory), "renamed.txt"), "w", encoding="utf-8") as f:
+                f.writelines(f"{name}.txt\t{path}\n" for name, path in self.renamed)
+
+
+def run_export(input_dir: str, output_dir: str, formats: Iterable[str] = FORMATS,
+               classes: Optional[List[str]] = None, workers: Optional[int] = None,
+               progress=print) -> Dict[str, Any]:
+    """Exporta todos os JSONs de polígonos de uma pasta e retorna um resumo"""
+    os.makedirs(output_dir, exist_ok=True)
+    formats = set(formats)
+    sidecars = find_sidecars(input_dir, exclude=output_dir)
+    total = len(sidecars)
+    categories = CategoryMap(classes)
+    writers = []
+    if "coco" in formats:
+        writers.append(CocoWriter(os.path.join(output_dir, "annotations.json")))
+    if "yolo" in formats:
+        writers.append(YoloWriter(output_dir))
+
+    counts = {"images": 0, "polygons": 0, "skipped": 0, "unknown_label": 0, "error": 0}
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, (path, parsed, error) in enumerate(
+                ordered_results(pool, parse_sidecar, sidecars, window=4 * workers), 1):
+            if error is not None:
+                counts["error"] += 1
+                progress(f"[{done}/{total}] error: {os.path.basename(path)} - {error}")
+                continue
+            if parsed is None:
+                counts["skipped"] += 1
+                continue
+
+            indices = [categories.index(polygon["label"]) for polygon in parsed["polygons"]]
+            if None in indices:
+                counts["unknown_label"] += indices.count(None)
+                parsed["polygons"] = [p for p, i in zip(parsed["polygons"], indices) if i is not None]
+                indices = [i for i in indices if i is not None]
+
+            for writer in writers:
+                if isinstance(writer, CocoWriter):
+                    writer.add(parsed, [i + 1 for i in indices])
+                else:
+                    writer.add(parsed, indices)
+            counts["images"] += 1
+            counts["polygons"] += len(indices)
+
+            if done % 100 == 0 or done == total:
+                elapsed = time.perf_counter() - start
+                progress(f"[{done}/{total}] {done / elapsed if elapsed > 0 else 0.0:.1f} arquivos/s")
+
+    for writer in writers:
+        writer.close(categories)
+
+    elapsed = time.perf_counter() - start
+    summary = dict(counts, total=total, categories=len(categories), seconds=elapsed)
+    progress(f"Concluído: {counts['images']} imagens, {counts['polygons']} polígonos, "
+             f"{len(categories)} categorias, {counts['skipped']} ignorados, {counts['error']} erros "
+             f"em {elapsed:.1f}s")
+    if counts["unknown_label"]:
+        progress(f"{counts['unknown_label']} polígonos com labels fora da lista de classes foram ignorados")
+    renamed = sum(len(writer.renamed) for writer in writers if isinstance(writer, YoloWriter))
+    if renamed:
+        progress(f"{renamed} arquivo(s) YOLO renomeados por imagens de mesmo nome em outras pastas "
+                 "(ver renamed.txt)")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py export",
+        description="Junta os JSONs de polígonos em um dataset COCO e/ou YOLO de segmentação"
+    )
+    parser.add_argument("input_dir", help="pasta com os JSONs gerados pelo editor")
+    parser.add_argument("output_dir", help="pasta onde o dataset será gravado")
+    parser.add_argument("--format", dest="formats", nargs="+", choices=FORMATS, default=list(FORMATS),
+                        help="formatos de saída (padrão: coco e yolo)")
+    parser.add_argument("--classes",
+                        help="arquivo com uma classe por linha; fixa a ordem dos IDs e ignora outros labels")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+
+    classes = read_classes(args.classes) if args.classes else None
+    summary = run_export(args.input_dir, args.output_dir, args.formats, classes, args.workers)
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""Cache em disco das imagens decodificadas, para reabrir mapas grandes sem decodificá-los
+
+Uso:
+    python main.py cache [--dir PASTA] stats|purge
+
+Cada imagem vira uma pasta com o buffer RGBX e os níveis da pirâmide de
+tiles em arquivos `.npy`, abertos com `np.load(mmap_mode="r")`: reabrir a
+imagem custa só o mapeamento e as leituras do cache de páginas. As
+entradas são identificadas pelo caminho e validadas pelo mtime e pelo
+tamanho do arquivo; o total é limitado e as entradas usadas há mais tempo
+são removidas primeiro.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from image_io import load_rgbx, shared_views
+from tiles import TilePyramid
+
+DEFAULT_CACHE_DIR = os.environ.get("MAPGEN_DECODE_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".mapgen", "decode_cache"))
+# Espaço máximo do cache em disco (em MB); 0 desativa
+DEFAULT_BUDGET_MB = int(os.environ.get("MAPGEN_DECODE_CACHE_MB", "8192"))
+CACHE_VERSION = 1
+META_FILE = "meta.json"
+PARTIAL_SUFFIX = ".partial-"
+# Gravações incompletas mais antigas que isso (s) são de um processo interrompido
+STALE_PARTIAL_SECONDS = 3600
+
+
+def source_signature(path: str) -> Dict[str, Any]:
+    """Identificação do arquivo de origem: caminho absoluto, mtime e tamanho"""
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+            "version": CACHE_VERSION}
+
+
+def level_file(entry: str, level: int) -> str:
+    return os.path.join(entry, f"level{level}.npy")
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+class DecodeCache:
+    """Buffers RGBX decodificados, guardados em disco e mapeados em memória
+
+    `load` devolve o buffer mapeado do cache quando a entrada é válida; do
+    contrário decodifica a imagem e grava a entrada (com os níveis da
+    pirâmide) em uma thread de fundo. Os buffers mapeados são somente
+    leitura, como o editor já os trata.
+    """
+
+    def __init__(self, directory: Optional[str] = None, budget_bytes: Optional[int] = None,
+                 decoder: Callable[[str], Optional[np.ndarray]] = load_rgbx):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.budget_bytes = budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_MB * 2**20
+        self.decoder = decoder
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decode-cache")
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    def entry_dir(self, path: str) -> str:
+        """Pasta da entrada de uma imagem (hash do caminho absoluto)"""
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, digest)
+
+    def load(self, path: str) -> Optional[np.ndarray]:
+        """Buffer RGBX da imagem, do cache ou decodificado (None se não puder ser lido)"""
+        if self.enabled:
+            buffer = self.lookup(path)
+            if buffer is not None:
+                self.hits += 1
+                return buffer
+        self.misses += 1
+        buffer = self.decoder(path)
+        if buffer is not None and self.enabled:
+            self._executor.submit(self._store, path, buffer)
+        return buffer
+
+    def lookup(self, path: str) -> Optional[np.ndarray]:
+        """Buffer mapeado da entrada, se ela corresponder ao arquivo atual"""
+        meta = self._valid_meta(path)
+        if meta is None:
+            return None
+        entry = self.entry_dir(path)
+        try:
+            buffer = np.load(level_file(entry, 0), mmap_mode="r")
+            os.utime(entry)  # Usada agora: última na fila de remoção
+        except (OSError, ValueError):
+            return None
+        return buffer
+
+    def levels(self, path: str) -> List[np.ndarray]:
+        """Níveis 1 em diante da pirâmide de tiles, mapeados (vazio se não houver no cache)"""
+        meta = self._valid_meta(path)
+        if meta is None:
+            return []
+        entry = self.entry_dir(path)
+        levels = []
+        for level in range(1, meta["levels"]):
+            try:
+                levels.append(np.load(level_file(entry, level), mmap_mode="r"))
+            except (OSError, ValueError):
+                break
+        return levels
+
+    def store(self, path: str, buffer: np.ndarray) -> Optional[str]:
+        """Grava a entrada da imagem com todos os níveis da pirâmide; retorna sua pasta
+
+        A entrada é montada em uma pasta temporária e só então colocada no
+        lugar, então uma gravação interrompida nunca é lida.
+        """
+        signature = source_signature(path)
+        pyramid = TilePyramid(shared_views(buffer)[1])
+        nbytes = buffer.nbytes * 4 // 3  # Níveis somam no máximo 1/3 do buffer
+        if nbytes > self.budget_bytes:
+            return None
+        self.evict(self.budget_bytes - nbytes)
+
+        entry = self.entry_dir(path)
+        partial = entry + PARTIAL_SUFFIX + str(os.getpid())
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        try:
+            np.save(level_file(partial, 0), buffer)
+            for level in range(1, pyramid.max_level + 1):
+                np.save(level_file(partial, level), np.asarray(pyramid.level(level)))
+            with open(os.path.join(partial, META_FILE), "w") as f:
+                json.dump({"source": signature, "shape": list(buffer.shape),
+                           "levels": pyramid.max_level + 1}, f)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(partial, entry)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+        self.stores += 1
+        return entry
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """Entradas completas: (último uso, bytes, pasta), da usada há mais tempo à mais recente"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            entry = os.path.join(self.directory, name)
+            if PARTIAL_SUFFIX in name:
+                try:
+                    if time.time() - os.path.getmtime(entry) > STALE_PARTIAL_SECONDS:
+                        shutil.rmtree(entry, ignore_errors=True)  # Sobra de uma gravação interrompida
+                except OSError:
+                    pass
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), directory_size(entry), entry))
+            except OSError:
+                continue
+        entries.sort()
+        return entries
+
+    def evict(self, target_bytes: int) -> int:
+        """Remove as entradas usadas há mais tempo até o total caber em `target_bytes`"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in entries:
+            if total <= target_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)  # Entradas mapeadas no Windows ficam até fechar
+            total -= size
+            removed += 1
+        self.evictions += removed
+        return removed
+
+    def purge(self) -> int:
+        """Remove todas as entradas; retorna quantas foram removidas"""
+        return self.evict(0)
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def shutdown(self, wait: bool = False):
+        """Encerra a thread de gravação (com `wait`, termina a gravação em andamento)"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _valid_meta(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.entry_dir(path), META_FILE)) as f:
+                meta = json.load(f)
+            signature = source_signature(path)
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("source") == signature else None
+
+    def _store(self, path: str, buffer: np.ndarray):
+        try:
+            self.store(path, buffer)
+        except OSError as e:
+            self.error = str(e)  # Cache cheio ou sem permissão: a imagem continua aberta normalmente
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py cache",
+        description="Cache em disco das imagens decodificadas"
+    )
+    parser.add_argument("--dir", default=None, help=f"pasta do cache (padrão: {DEFAULT_CACHE_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="entradas e espaço ocupado")
+    commands.add_parser("purge", help="remove todas as entradas")
+    args = parser.parse_args(argv)
+
+    cache = DecodeCache(args.dir)
+    if args.command == "purge":
+        print(f"{cache.purge()} entrada(s) removida(s) de {cache.directory}")
+        return 0
+
+    stats = cache.stats()
+    print(f"{cache.directory}: {stats['entries']} entrada(s), {stats['bytes'] / 2**20:.0f} MB "
+          f"de {stats['budget_bytes'] / 2**20:.0f} MB")
+    for _, size, entry in reversed(cache.entries()):
+        try:
+            with open(os.path.join(entry, META_FILE)) as f:
+                source = json.load(f)["source"]["path"]
+        except (OSError, ValueError, KeyError):
+            source = "?"
+        print(f"{size / 2**20:>10.0f} MB  {source}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Taxa padrão de quadros para processar eventos de movimento
+DEFAULT_TARGET_FPS = int(os.environ.get("MAPGEN_TARGET_FPS", "60"))
+
+
+class EventCoalescer:
+    """Agrupa eventos de movimento e processa no máximo um por quadro
+
+    O Tk entrega muito mais eventos de movimento do que a tela consegue
+    exibir; aqui só o último evento de cada manipulador é guardado e o
+    processamento é agendado com `root.after` no ritmo da taxa de quadros.
+    """
+
+    def __init__(self, root, target_fps: Optional[int] = None):
+        self.root = root
+        self.target_fps = target_fps or DEFAULT_TARGET_FPS
+        self._pending: Dict[Callable, Any] = {}
+        self._after_id: Optional[str] = None
+        self._last_flush = 0.0
+        self.received = 0
+        self.dropped = 0
+        self.frames = 0
+
+    @property
+    def frame_interval(self) -> float:
+        """Intervalo mínimo entre quadros, em segundos"""
+        return 1.0 / self.target_fps
+
+    def submit(self, handler: Callable, event):
+        """Guarda o evento mais recente para o manipulador e agenda um quadro"""
+        self.received += 1
+        if handler in self._pending:
+            self.dropped += 1
+        self._pending[handler] = event
+        if self._after_id is None:
+            elapsed = time.perf_counter() - self._last_flush
+            delay = max(0, int((self.frame_interval - elapsed) * 1000))
+            self._after_id = self.root.after(delay, self._on_frame)
+
+    def bind(self, handler: Callable) -> Callable:
+        """Retorna um callback para `bind` que passa pelo agrupador"""
+        return lambda event: self.submit(handler, event)
+
+    def _on_frame(self):
+        self._after_id = None
+        self.flush()
+
+    def flush(self):
+        """Processa imediatamente os eventos pendentes (ex.: antes de um clique)"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.perf_counter()
+        if pending:
+            self.frames += 1
+        for handler, pending_event in pending.items():
+            handler(pending_event)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de eventos recebidos, descartados e quadros processados"""
+        return {
+            "target_fps": self.target_fps,
+            "received": self.received,
+            "dropped": self.dropped,
+            "frames": self.frames,
+        }
@@ -0,0 +1,204 @@
+"""Formatos de exportação das anotações de uma imagem, como plugins
+
+Cada formato é uma função `write(context, base)` registrada com `register`:
+recebe o `ExportContext` (polígonos e recortes, com as coordenadas
+normalizadas já calculadas) e o caminho base sem extensão, grava seus
+arquivos e retorna os caminhos. Os formatos escolhidos são gravados em
+paralelo, em threads.
+
+Formatos de terceiros podem ser carregados listando seus módulos em
+`MAPGEN_EXPORT_PLUGINS` (separados por vírgula); ao serem importados, eles
+chamam `register`.
+"""
+import importlib
+import os
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from masks import class_ids_for, render_masks, update_classes_file, write_masks
+from metadata import ExportContext
+from save_queue import write_json
+
+NATIVE_FORMAT = "mapgen"
+# Formatos gravados além do nativo quando nada for escolhido na interface
+DEFAULT_FORMATS = [f.strip() for f in os.environ.get("MAPGEN_EXPORT_FORMATS", "").split(",") if f.strip()]
+PLUGIN_MODULES = [m.strip() for m in os.environ.get("MAPGEN_EXPORT_PLUGINS", "").split(",") if m.strip()]
+
+
+class Exporter(NamedTuple):
+    name: str
+    description: str
+    kinds: Tuple[str, ...]  # "polygons" e/ou "crops"
+    write: Callable[[ExportContext, str], List[str]]
+
+
+EXPORTERS: Dict[str, Exporter] = {}
+_classes_lock = threading.Lock()
+
+
+def register(name: str, description: str, kinds: Iterable[str] = ("polygons",)):
+    """Decorador que registra `write(context, base) -> arquivos` como formato de exportação"""
+    def decorator(write):
+        EXPORTERS[name] = Exporter(name, description, tuple(kinds), write)
+        return write
+    return decorator
+
+
+def load_plugins(modules: Iterable[str] = PLUGIN_MODULES) -> List[str]:
+    """Importa os módulos de formatos externos; retorna os que falharam"""
+    failed = []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Plugin de exportação {module} não carregado: {e}")
+            failed.append(module)
+    return failed
+
+
+def applicable(context: ExportContext, formats: Iterable[str]) -> List[Exporter]:
+    """Formatos pedidos que têm o que gravar neste contexto (o nativo sempre incluído)"""
+    present = {kind for kind, items in (("polygons", context.store), ("crops", context.crops)) if len(items)}
+    names = dict.fromkeys([NATIVE_FORMAT, *formats])
+    return [EXPORTERS[name] for name in names if name in EXPORTERS and present & set(EXPORTERS[name].kinds)]
+
+
+def submit_exports(submit: Callable[..., Future], context: ExportContext, base: str,
+                   formats: Iterable[str]) -> List[Future]:
+    """Envia cada formato a um executor (`submit(descrição, fn, *args)`, como o da `SaveQueue`)"""
+    return [submit(f"{exporter.name}: {base}", exporter.write, context, base)
+            for exporter in applicable(context, formats)]
+
+
+def export(context: ExportContext, base: str, formats: Iterable[str] = (),
+           workers: Optional[int] = None) -> Dict[str, List[str]]:
+    """Grava os formatos em paralelo e espera; retorna os arquivos de cada um"""
+    exporters = applicable(context, formats)
+    with ThreadPoolExecutor(max_workers=workers or len(exporters) or 1, thread_name_prefix="export") as pool:
+        futures = {exporter.name: pool.submit(exporter.write, context, base) for exporter in exporters}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def shared_classes(context: ExportContext, directory: str) -> List[str]:
+    """Classes do `classes.txt` da pasta, completado com os labels do contexto
+
+    Calculadas uma vez por contexto e pasta, e compartilhadas pelos formatos
+    que numeram classes (YOLO, COCO e máscaras), que podem rodar ao mesmo tempo.
+    """
+    directory = os.path.abspath(directory)
+    with _classes_lock:
+        classes = context.classes.get(directory)
+        if classes is None:
+            classes = context.classes[directory] = update_classes_file(directory, context.labels)
+        return classes
+
+
+def _image_name(context: ExportContext, base: str) -> str:
+    return os.path.basename(context.image_path or base)
+
+
+@register(NATIVE_FORMAT, "JSON do editor", kinds=("polygons", "crops"))
+def write_native(context: ExportContext, base: str) -> List[str]:
+    outputs = []
+    if len(context.store):
+        outputs.append(write_json(base + ".json", context.polygons_metadata()))
+    if context.crops:
+        suffix = "_crops.json" if len(context.store) else ".json"
+        outputs.append(write_json(base + suffix, context.crops_metadata()))
+    return outputs
+
+
+@register("coco", "COCO (segmentação)")
+def write_coco(context: ExportContext, base: str) -> List[str]:
+    classes = shared_classes(context, os.path.dirname(base))
+    category_ids = {label: i + 1 for i, label in enumerate(classes)}
+    annotations = [
+        {"id": i + 1, "image_id": 1, "category_id": category_ids[entry["label"]],
+         "segmentation": [entry["segmentation"]], "area": entry["area"], "bbox": entry["bbox"],
+         "iscrowd": 0, "polygon_id": entry["id"]}
+        for i, entry in enumerate(context.polygon_entries())
+    ]
+    data = {
+        "info": {"description": "MapGen"},
+        "images": [{"id": 1, "file_name": _image_name(context, base), "path": context.image_path,
+                    "width": context.width, "height": context.height}],
+        "annotations": annotations,
+        "categories": [{"id": i + 1, "name": label, "supercategory": "none"} for i, label in enumerate(classes)],
+    }
+    return [write_json(base + "_coco.json", data)]
+
+
+@register("yolo", "YOLO (segmentação)")
+def write_yolo(context: ExportContext, base: str) -> List[str]:
+    classes = shared_classes(context, os.path.dirname(base))
+    index = {label: i for i, label in enumerate(classes)}
+    path = base + ".txt"
+    with open(path, "w") as f:
+        for i, polygon in enumerate(context.store):
+            f.write(f"{index[polygon.label]} {context.yolo_coordinates(i)}\n")
+    return [path]
+
+
+@register("voc", "Pascal VOC (XML)", kinds=("polygons", "crops"))
+def write_voc(context: ExportContext, base: str) -> List[str]:
+    root = ET.Element("annotation")
+    ET.SubElement(root, "folder").text = os.path.basename(os.path.dirname(context.image_path or base))
+    ET.SubElement(root, "filename").text = _image_name(context, base)
+    if context.image_path:
+        ET.SubElement(root, "path").text = context.image_path
+    size = ET.SubElement(root, "size")
+    for tag, value in (("width", context.width), ("height", context.height), ("depth", 3)):
+        ET.SubElement(size, tag).text = str(value)
+    ET.SubElement(root, "segmented").text = "1" if len(context.store) else "0"
+
+    # Polígonos pela caixa delimitadora; recortes pelo retângulo, com o nome do recorte
+    objects = [(polygon.label, box) for polygon, box in zip(context.store, context.bboxes.tolist())]
+    objects += [(crop["name"], crop["rect"]) for crop in context.crops]
+    for name, (x0, y0, x1, y1) in objects:
+        obj = ET.SubElement(root, "object")
+        ET.SubElement(obj, "name").text = name
+        ET.SubElement(obj, "pose").text = "Unspecified"
+        ET.SubElement(obj, "truncated").text = "0"
+        ET.SubElement(obj, "difficult").text = "0"
+        bndbox = ET.SubElement(obj, "bndbox")
+        for tag, value in (("xmin", x0), ("ymin", y0), ("xmax", x1), ("ymax", y1)):
+            ET.SubElement(bndbox, tag).text = str(int(round(value)))
+
+    ET.indent(root)
+    path = base + ".xml"
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+    return [path]
+
+
+@register("geojson", "GeoJSON (coordenadas em pixels)", kinds=("polygons", "crops"))
+def write_geojson(context: ExportContext, base: str) -> List[str]:
+    features = []
+    vertices = context.store.vertices.tolist()
+    for polygon, start, end, area in zip(context.store, context.offsets[:-1], context.offsets[1:],
+                                         context.areas.tolist()):
+        ring = vertices[start:end]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring + ring[:1]]},
+            "properties": {"kind": "polygon", "label": polygon.label, "id": polygon.id,
+                           "color": polygon.color, "area": area},
+        })
+    for crop in context.crops:
+        x0, y0, x1, y1 = crop["rect"]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]},
+            "properties": {"kind": "crop", "name": crop["name"]},
+        })
+    data = {"type": "FeatureCollection", "image_path": context.image_path,
+            "image_size": {"width": context.width, "height": context.height}, "features": features}
+    return [write_json(base + ".geojson", data)]
+
+
+@register("masks", "Máscaras PNG")
+def write_mask_pngs(context: ExportContext, base: str) -> List[str]:
+    classes = shared_classes(context, os.path.dirname(base))
+    semantic, instance = render_masks(context.store, context.width, context.height, class_ids_for(classes))
+    return write_masks(base + ".json", semantic, instance)
@@ -0,0 +1,311 @@
+import os
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from PIL import Image, ImageTk
+
+from render_cache import RenderCache
+from thumbnails import ThumbnailService
+
+# Memória das miniaturas já convertidas para o Tk (em MB)
+PHOTO_BUDGET_MB = 64
+POLL_MS = 100
+
+
+class FolderBrowser:
+    """Painel acoplável com as imagens da pasta em uma grade de miniaturas
+
+    A grade é virtualizada: o canvas tem a altura da pasta inteira, mas só
+    as células das linhas visíveis (e de uma linha a mais em cada lado)
+    existem como itens; ao rolar, as células que saem são apagadas e as que
+    entram são criadas. Só as miniaturas visíveis são pedidas ao
+    `ThumbnailService`, e os pedidos das que saíram da tela são cancelados.
+    """
+
+    CELL_PAD = 6
+    LABEL_HEIGHT = 16
+    BADGE_RADIUS = 6
+
+    def __init__(self, parent: tk.Misc, on_open: Callable[[str], None],
+                 thumbnails: Optional[ThumbnailService] = None, columns: int = 2,
+                 dock_before: Optional[tk.Misc] = None):
+        self.dock_before = dock_before  # Widget à direita do painel acoplado
+        self.on_open = on_open
+        self.thumbnails = thumbnails or ThumbnailService()
+        self.columns = columns
+        self.cell_size = self.thumbnails.size + 2 * self.CELL_PAD
+        self.cell_height = self.cell_size + self.LABEL_HEIGHT
+        self.paths: List[str] = []
+        self.path_set: Set[str] = set()
+        self.annotated: Set[str] = set()
+        self.current: Optional[str] = None
+        self.directory: Optional[str] = None
+        self.docked = True
+        self.shown = False
+        self.photos = RenderCache(PHOTO_BUDGET_MB * 2**20)  # PhotoImages por miniatura
+        self.cells: Dict[int, List[int]] = {}  # Índice da imagem -> itens do canvas
+        self._render_pending = False
+        self._polling = False
+
+        # tk.Frame (e não ttk): só frames comuns podem virar janela com `wm manage`
+        self.frame = tk.Frame(parent)
+        header = ttk.Frame(self.frame)
+        header.pack(side=tk.TOP, fill=tk.X)
+        self.title = ttk.Label(header, text="", anchor=tk.W)
+        self.title.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.dock_button = ttk.Button(header, text="Desacoplar", width=11, command=self.toggle_dock)
+        self.dock_button.pack(side=tk.RIGHT, padx=2, pady=2)
+
+        width = self.columns * self.cell_size
+        self.canvas = tk.Canvas(self.frame, width=width, bg="white", highlightthickness=0)
+        self.scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.on_scrolled)
+        self.scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", self.on_resize)
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units"))  # Linux
+        self.canvas.bind("<Button-5>", lambda event: self.canvas.yview_scroll(1, "units"))
+
+    # Conteúdo
+
+    def set_folder(self, directory: str, paths: Sequence[str], annotated: Set[str],
+                   current: Optional[str] = None):
+        """Mostra as imagens de uma pasta, com as anotadas marcadas"""
+        self.directory = directory
+        self.paths = list(paths)
+        self.path_set = {os.path.abspath(p) for p in self.paths}
+        self.annotated = {os.path.abspath(p) for p in annotated}
+        self.current = current
+        self.photos.invalidate()
+        self.thumbnails.retain(())
+        self.canvas.delete("all")
+        self.cells = {}
+        self.update_title()
+        self.layout()
+        if current is not None:
+            self.show(current)
+
+    def set_current(self, path: Optional[str]):
+        """Destaca a imagem aberta no editor"""
+        previous, self.current = self.current, path
+        self.refresh_paths([p for p in (previous, path) if p is not None])
+        if path is not None:
+            self.show(path)
+
+    def mark(self, path: str, annotated: bool = True):
+        """Atualiza a marca de anotada de uma imagem (ex.: depois de salvar)"""
+        if annotated:
+            self.annotated.add(os.path.abspath(path))
+        else:
+            self.annotated.discard(os.path.abspath(path))
+        self.update_title()
+        self.refresh_paths([path])
+
+    def update_title(self):
+        count = len(self.annotated & self.path_set)
+        name = os.path.basename(self.directory or "") or (self.directory or "")
+        self.title.config(text=f"{name}: {len(self.paths)} imagens, {count} anotadas")
+
+    def show(self, path: str):
+        """Rola a grade até a imagem, se ela não estiver visível"""
+        try:
+            index = self.paths.index(path)
+        except ValueError:
+            return
+        row = index // self.columns
+        first, last = self.visible_rows()
+        if not first <= row < last - 1:
+            total = self.rows() * self.cell_height
+            if total > 0:
+                self.canvas.yview_moveto(row * self.cell_height / total)
+
+    # Grade virtualizada
+
+    def rows(self) -> int:
+        return (len(self.paths) + self.columns - 1) // self.columns
+
+    def layout(self):
+        """Recalcula colunas e a altura total; as células são recriadas"""
+        width = max(self.canvas.winfo_width(), self.cell_size)
+        columns = max(1, width // self.cell_size)
+        if columns != self.columns:
+            self.columns = columns
+            self.canvas.delete("all")
+            self.cells = {}
+        self.canvas.configure(scrollregion=(0, 0, self.columns * self.cell_size,
+                                            max(1, self.rows() * self.cell_height)),
+                              yscrollincrement=self.cell_height // 4)
+        self.schedule_render()
+
+    def visible_rows(self):
+        """Linhas visíveis (início, fim exclusivo), com uma linha de margem de cada lado"""
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, int(top // self.cell_height) - 1)
+        last = min(self.rows(), int(bottom // self.cell_height) + 2)
+        return first, last
+
+    def schedule_render(self):
+        """Agrupa as rolagens de um mesmo ciclo em um único `render`"""
+        if not self._render_pending:
+            self._render_pending = True
+            self.frame.after_idle(self.render)
+
+    def render(self):
+        """Cria as células visíveis e apaga as que saíram da tela"""
+        self._render_pending = False
+        first, last = self.visible_rows()
+        visible = range(first * self.columns, min(len(self.paths), last * self.columns))
+        for index in [i for i in self.cells if i not in visible]:
+            self.canvas.delete(*self.cells.pop(index))
+        for index in visible:
+            if index not in self.cells:
+                self.cells[index] = self.draw_cell(index)
+
+        self.thumbnails.retain(self.paths[i] for i in visible)
+        if len(self.thumbnails) and not self._polling:
+            self._polling = True
+            self.frame.after(POLL_MS, self.poll)
+
+    def draw_cell(self, index: int) -> List[int]:
+        path = self.paths[index]
+        row, col = divmod(index, self.columns)
+        x0, y0 = col * self.cell_size, row * self.cell_height
+        size = self.thumbnails.size
+        cx, cy = x0 + self.cell_size / 2, y0 + self.CELL_PAD + size / 2
+        canvas = self.canvas
+        items = []
+        if path == self.current:
+            items.append(canvas.create_rectangle(x0 + 1, y0 + 1, x0 + self.cell_size - 1,
+                                                 y0 + self.cell_height - 1, outline="#3b82f6", width=2))
+
+        photo = self.photo(path)
+        if photo is not None:
+            items.append(canvas.create_image(cx, cy, image=photo))
+        else:
+            half = size / 2 - 4
+            items.append(canvas.create_rectangle(cx - half, cy - half, cx + half, cy + half,
+                                                 outline="#d0d0d0", fill="#f2f2f2"))
+
+        # Marca de anotação: cheia (verde) para anotada, vazia para não anotada
+        annotated = os.path.abspath(path) in self.annotated
+        r = self.BADGE_RADIUS
+        bx, by = x0 + self.cell_size - self.CELL_PAD - r, y0 + self.CELL_PAD + r
+        items.append(canvas.create_oval(bx - r, by - r, bx + r, by + r, width=2,
+                                        outline="#16a34a" if annotated else "#9ca3af",
+                                        fill="#16a34a" if annotated else "white"))
+
+        name = os.path.basename(path)
+        if len(name) > 20:
+            name = name[:9] + "…" + name[-10:]
+        items.append(canvas.create_text(cx, y0 + self.cell_size + self.LABEL_HEIGHT / 2 - 2,
+                                        text=name, font=("TkDefaultFont", 8)))
+        return items
+
+    def photo(self, path: str) -> Optional[ImageTk.PhotoImage]:
+        """PhotoImage da miniatura (pedindo sua geração se ainda não existir)"""
+        thumb = self.thumbnails.request(path)
+        if thumb is None:
+            return None
+        # Pelo arquivo da miniatura: uma imagem alterada não reaproveita a PhotoImage antiga
+        photo = self.photos.get((thumb,))
+        if photo is not None:
+            return photo
+        try:
+            with Image.open(thumb) as img:
+                photo = ImageTk.PhotoImage(img)
+        except OSError:
+            return None
+        self.photos.put((thumb,), photo, photo.width() * photo.height() * 4)
+        return photo
+
+    def refresh_paths(self, paths: Sequence[str]):
+        """Redesenha as células visíveis das imagens dadas"""
+        for path in paths:
+            try:
+                index = self.paths.index(path)
+            except ValueError:
+                continue
+            items = self.cells.pop(index, None)
+            if items is not None:
+                self.canvas.delete(*items)
+                self.cells[index] = self.draw_cell(index)
+
+    def poll(self):
+        """Troca os espaços vazios pelas miniaturas que ficaram prontas"""
+        done = self.thumbnails.poll()
+        visible = {self.paths[i]: i for i in self.cells}
+        for path, thumb in done:
+            index = visible.get(path)
+            if thumb is not None and index is not None:
+                self.canvas.delete(*self.cells.pop(index))
+                self.cells[index] = self.draw_cell(index)
+        if len(self.thumbnails):
+            self.frame.after(POLL_MS, self.poll)
+        else:
+            self._polling = False
+
+    # Eventos
+
+    def on_scrolled(self, first, last):
+        self.scroll.set(first, last)
+        self.schedule_render()
+
+    def on_resize(self, event):
+        self.layout()
+
+    def on_wheel(self, event):
+        self.canvas.yview_scroll(-1 if event.delta > 0 else 1, "units")
+
+    def on_click(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        col, row = int(x // self.cell_size), int(y // self.cell_height)
+        index = row * self.columns + col
+        if 0 <= col < self.columns and 0 <= index < len(self.paths):
+            self.on_open(self.paths[index])
+
+    # Acoplamento
+
+    def pack(self):
+        """Mostra o painel acoplado à esquerda da janela"""
+        self.shown = True
+        if self.dock_before is not None:
+            self.frame.pack(side=tk.LEFT, fill=tk.Y, before=self.dock_before)
+        else:
+            self.frame.pack(side=tk.LEFT, fill=tk.Y)
+
+    def hide(self):
+        self.shown = False
+        if self.docked:
+            self.frame.pack_forget()
+        else:
+            self.frame.winfo_toplevel().wm_forget(self.frame)
+            self.docked = True
+            self.dock_button.config(text="Desacoplar")
+
+    @property
+    def visible(self) -> bool:
+        return self.shown
+
+    def toggle_dock(self):
+        """Transforma o painel em janela própria, ou o devolve à janela principal"""
+        if self.docked:
+            self.frame.pack_forget()
+            self.frame.winfo_toplevel().wm_manage(self.frame)
+            tk.Wm.wm_title(self.frame, "Imagens da pasta")
+            tk.Wm.wm_protocol(self.frame, "WM_DELETE_WINDOW", self.toggle_dock)
+            self.docked = False
+            self.dock_button.config(text="Acoplar")
+        else:
+            self.frame.winfo_toplevel().wm_forget(self.frame)
+            self.docked = True
+            self.dock_button.config(text="Desacoplar")
+            self.pack()
+        self.schedule_render()
+
+    def shutdown(self):
+        self.thumbnails.shutdown()
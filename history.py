@@ -0,0 +1,434 @@
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from polygon_store import PolygonStore
+
+Point = Tuple[int, int]
+
+# Orçamento padrão de memória do histórico de desfazer/refazer (em MB)
+DEFAULT_BUDGET_MB = int(os.environ.get("MAPGEN_HISTORY_MB", "64"))
+
+# Estimativa de custo de um ponto (tupla + dois inteiros) e de um comando vazio
+POINT_BYTES = 72
+COMMAND_BYTES = 128
+
+
+class Command(ABC):
+    """Operação reversível que guarda apenas a diferença que ela causa
+
+    `target` é o objeto que guarda o estado das anotações (a `AnnotationSession`):
+    precisa ter `polygons` (um `PolygonStore`), `current_polygon`, `crops`,
+    `selected_crop_index`, `next_crop_number`, `spatial_index`,
+    `selected_polygon_index`, `next_polygon_id` e `next_color_index`.
+    """
+
+    label = "Ação"
+    kind = ""  # Nome do comando no diário (journal)
+
+    @abstractmethod
+    def apply(self, target):
+        """Aplica a operação ao estado"""
+
+    @abstractmethod
+    def revert(self, target):
+        """Desfaz a operação"""
+
+    def nbytes(self) -> int:
+        """Estimativa de memória ocupada pelo comando"""
+        return COMMAND_BYTES
+
+    @abstractmethod
+    def to_record(self) -> Dict[str, Any]:
+        """Dados mínimos para recriar o comando com `command_from_record`"""
+
+
+class AddVertex(Command):
+    """Adiciona um ponto ao polígono em construção"""
+
+    label = "Ponto adicionado"
+    kind = "add_vertex"
+
+    def __init__(self, point: Point):
+        self.point = point
+
+    def apply(self, target):
+        target.current_polygon.append(self.point)
+
+    def revert(self, target):
+        target.current_polygon.pop()
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"point": self.point}
+
+
+class MoveVertex(Command):
+    """Move um vértice de um polígono finalizado (ou do atual, se `polygon_index` é None)"""
+
+    label = "Ponto movido"
+    kind = "move_vertex"
+
+    def __init__(self, polygon_index: Optional[int], vertex_index: int, old: Point, new: Point):
+        self.polygon_index = polygon_index
+        self.vertex_index = vertex_index
+        self.old = old
+        self.new = new
+
+    def _set(self, target, point: Point):
+        if self.polygon_index is None:
+            target.current_polygon[self.vertex_index] = point
+            return
+        target.polygons.move_vertex(self.polygon_index, self.vertex_index, point)
+        target.spatial_index.move_vertex(self.polygon_index, self.vertex_index, point)
+
+    def apply(self, target):
+        self._set(target, self.new)
+
+    def revert(self, target):
+        self._set(target, self.old)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"polygon": self.polygon_index, "vertex": self.vertex_index, "old": self.old, "new": self.new}
+
+
+class AddPolygon(Command):
+    """Finaliza o polígono em construção como um novo polígono"""
+
+    label = "Polígono adicionado"
+    kind = "add_polygon"
+
+    def __init__(self, polygon: Dict[str, Any], target):
+        self.polygon = polygon
+        self.index = len(target.polygons)
+        self.previous_current = target.current_polygon
+        self.previous_selection = target.selected_polygon_index
+        self.previous_next_id = target.next_polygon_id
+
+    def apply(self, target):
+        target.polygons.insert(self.index, self.polygon)
+        target.spatial_index.insert(self.index, self.polygon['points'])
+        target.current_polygon = []
+        target.next_polygon_id = self.polygon['id'] + 1
+        target.selected_polygon_index = self.index
+
+    def revert(self, target):
+        target.polygons.pop(self.index)
+        target.spatial_index.delete(self.index)
+        target.current_polygon = self.previous_current
+        target.next_polygon_id = self.previous_next_id
+        target.selected_polygon_index = self.previous_selection
+
+    def nbytes(self) -> int:
+        points = len(self.polygon['points']) + len(self.previous_current)
+        return COMMAND_BYTES + POINT_BYTES * points
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"polygon": self.polygon}
+
+
+class DeletePolygon(Command):
+    """Remove um polígono finalizado"""
+
+    label = "Polígono deletado"
+    kind = "delete_polygon"
+
+    def __init__(self, index: int, target):
+        self.index = index
+        self.polygon = target.polygons.record(index)
+        self.previous_selection = target.selected_polygon_index
+
+    def apply(self, target):
+        target.polygons.pop(self.index)
+        target.spatial_index.delete(self.index)
+        target.selected_polygon_index = None
+
+    def revert(self, target):
+        target.polygons.insert(self.index, self.polygon)
+        target.spatial_index.insert(self.index, self.polygon['points'])
+        target.selected_polygon_index = self.previous_selection
+
+    def nbytes(self) -> int:
+        return COMMAND_BYTES + POINT_BYTES * len(self.polygon['points'])
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"index": self.index}
+
+
+class SetCurrentPolygon(Command):
+    """Substitui o polígono em construção (ex.: cancelar)"""
+
+    label = "Polígono em construção alterado"
+    kind = "set_current_polygon"
+
+    def __init__(self, old: List[Point], new: List[Point]):
+        self.old = list(old)
+        self.new = list(new)
+
+    def apply(self, target):
+        target.current_polygon = list(self.new)
+
+    def revert(self, target):
+        target.current_polygon = list(self.old)
+
+    def nbytes(self) -> int:
+        return COMMAND_BYTES + POINT_BYTES * (len(self.old) + len(self.new))
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"old": self.old, "new": self.new}
+
+
+class SetCropRect(Command):
+    """Move ou redimensiona um retângulo de recorte"""
+
+    label = "Recorte alterado"
+    kind = "set_crop_rect"
+
+    def __init__(self, index: int, old, new):
+        self.index = index
+        self.old = old
+        self.new = new
+
+    def apply(self, target):
+        target.crops[self.index]['rect'] = self.new
+        target.selected_crop_index = self.index
+
+    def revert(self, target):
+        target.crops[self.index]['rect'] = self.old
+        target.selected_crop_index = self.index
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"index": self.index, "old": self.old, "new": self.new}
+
+
+class AddCrop(Command):
+    """Adiciona um retângulo de recorte (com nome e proporção) e o seleciona"""
+
+    label = "Recorte adicionado"
+    kind = "add_crop"
+
+    def __init__(self, crop: Dict[str, Any], index: int, previous_selection: Optional[int]):
+        self.crop = crop
+        self.index = index
+        self.previous_selection = previous_selection
+
+    def apply(self, target):
+        target.crops.insert(self.index, self.crop)
+        target.selected_crop_index = self.index
+
+    def revert(self, target):
+        target.crops.pop(self.index)
+        target.selected_crop_index = self.previous_selection
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"crop": dict(self.crop), "index": self.index, "selection": self.previous_selection}
+
+
+class DeleteCrop(Command):
+    """Remove um retângulo de recorte"""
+
+    label = "Recorte deletado"
+    kind = "delete_crop"
+
+    def __init__(self, index: int, target):
+        self.index = index
+        self.crop = target.crops[index]
+        self.previous_selection = target.selected_crop_index
+
+    def apply(self, target):
+        target.crops.pop(self.index)
+        target.selected_crop_index = None
+
+    def revert(self, target):
+        target.crops.insert(self.index, self.crop)
+        target.selected_crop_index = self.previous_selection
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"index": self.index}
+
+
+class RenameCrop(Command):
+    """Troca o nome de um recorte (usado nos arquivos exportados)"""
+
+    label = "Recorte renomeado"
+    kind = "rename_crop"
+
+    def __init__(self, index: int, old: str, new: str):
+        self.index = index
+        self.old = old
+        self.new = new
+
+    def apply(self, target):
+        target.crops[self.index]['name'] = self.new
+
+    def revert(self, target):
+        target.crops[self.index]['name'] = self.old
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"index": self.index, "old": self.old, "new": self.new}
+
+
+class SetCropAspect(Command):
+    """Liga/desliga a trava de proporção de um recorte ou troca a proporção"""
+
+    label = "Proporção do recorte alterada"
+    kind = "set_crop_aspect"
+
+    def __init__(self, index: int, old: Tuple[bool, float], new: Tuple[bool, float]):
+        self.index = index
+        self.old = old
+        self.new = new
+
+    def apply(self, target):
+        target.crops[self.index]['keep_aspect_ratio'], target.crops[self.index]['aspect_ratio'] = self.new
+
+    def revert(self, target):
+        target.crops[self.index]['keep_aspect_ratio'], target.crops[self.index]['aspect_ratio'] = self.old
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"index": self.index, "old": self.old, "new": self.new}
+
+
+class ClearAnnotations(Command):
+    """Limpa todas as anotações, guardando o que existia para desfazer"""
+
+    label = "Anotações limpas"
+    kind = "clear"
+
+    def __init__(self, target):
+        self.polygons = target.polygons
+        self.current_polygon = target.current_polygon
+        self.crops = target.crops
+        self.crop_selection = target.selected_crop_index
+        self.next_crop_number = target.next_crop_number
+        self.selection = target.selected_polygon_index
+        self.next_polygon_id = target.next_polygon_id
+        self.next_color_index = target.next_color_index
+
+    def apply(self, target):
+        target.polygons = PolygonStore()
+        target.spatial_index.clear()
+        target.current_polygon = []
+        target.crops = []
+        target.selected_crop_index = None
+        target.next_crop_number = 1
+        target.selected_polygon_index = None
+        target.next_polygon_id = 1
+        target.next_color_index = 0
+
+    def revert(self, target):
+        target.polygons = self.polygons
+        target.spatial_index.rebuild(poly.points for poly in self.polygons)
+        target.current_polygon = self.current_polygon
+        target.crops = self.crops
+        target.selected_crop_index = self.crop_selection
+        target.next_crop_number = self.next_crop_number
+        target.selected_polygon_index = self.selection
+        target.next_polygon_id = self.next_polygon_id
+        target.next_color_index = self.next_color_index
+
+    def nbytes(self) -> int:
+        return COMMAND_BYTES + self.polygons.nbytes + POINT_BYTES * len(self.current_polygon)
+
+    def to_record(self) -> Dict[str, Any]:
+        return {}
+
+
+def _point(value) -> Optional[Point]:
+    return tuple(value) if value is not None else None
+
+
+def command_from_record(record: Dict[str, Any], target) -> Command:
+    """Recria um comando a partir de `to_record` (com `"kind"`), no estado atual de `target`"""
+    kind = record["kind"]
+    if kind == AddVertex.kind:
+        return AddVertex(_point(record["point"]))
+    if kind == MoveVertex.kind:
+        return MoveVertex(record["polygon"], record["vertex"], _point(record["old"]), _point(record["new"]))
+    if kind == AddPolygon.kind:
+        polygon = dict(record["polygon"])
+        polygon["points"] = [tuple(p) for p in polygon["points"]]
+        return AddPolygon(polygon, target)
+    if kind == DeletePolygon.kind:
+        return DeletePolygon(record["index"], target)
+    if kind == SetCurrentPolygon.kind:
+        return SetCurrentPolygon([tuple(p) for p in record["old"]], [tuple(p) for p in record["new"]])
+    if kind == SetCropRect.kind:
+        return SetCropRect(record["index"], tuple(record["old"]), tuple(record["new"]))
+    if kind == AddCrop.kind:
+        crop = dict(record["crop"])
+        crop["rect"] = tuple(crop["rect"])
+        return AddCrop(crop, record["index"], record["selection"])
+    if kind == DeleteCrop.kind:
+        return DeleteCrop(record["index"], target)
+    if kind == RenameCrop.kind:
+        return RenameCrop(record["index"], record["old"], record["new"])
+    if kind == SetCropAspect.kind:
+        return SetCropAspect(record["index"], tuple(record["old"]), tuple(record["new"]))
+    if kind == ClearAnnotations.kind:
+        return ClearAnnotations(target)
+    raise ValueError(f"comando desconhecido: {kind}")
+
+
+class History:
+    """Pilhas de desfazer/refazer limitadas por memória, não por quantidade"""
+
+    def __init__(self, budget_bytes: Optional[int] = None):
+        self.budget_bytes = budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_MB * 1024 * 1024
+        self.undo_stack: Deque[Tuple[Command, int]] = deque()
+        self.redo_stack: List[Tuple[Command, int]] = []
+        self.bytes_used = 0
+        # Chamado com ("do", comando), ("undo", None) ou ("redo", None) a cada alteração
+        self.observer: Optional[Callable[[str, Optional[Command]], None]] = None
+
+    def __len__(self) -> int:
+        return len(self.undo_stack)
+
+    def do(self, command: Command, target):
+        """Aplica o comando e o registra"""
+        command.apply(target)
+        self.record(command)
+
+    def record(self, command: Command):
+        """Registra um comando já aplicado (ex.: ao fim de um arraste)"""
+        if self.observer is not None:
+            self.observer("do", command)
+        for _, size in self.redo_stack:
+            self.bytes_used -= size
+        self.redo_stack.clear()
+
+        size = command.nbytes()
+        self.undo_stack.append((command, size))
+        self.bytes_used += size
+        # Descarta os comandos mais antigos até caber no orçamento
+        while self.bytes_used > self.budget_bytes and len(self.undo_stack) > 1:
+            _, old_size = self.undo_stack.popleft()
+            self.bytes_used -= old_size
+
+    def undo(self, target) -> Optional[Command]:
+        """Desfaz o último comando; retorna-o ou None se não houver"""
+        if not self.undo_stack:
+            return None
+        entry = self.undo_stack.pop()
+        entry[0].revert(target)
+        self.redo_stack.append(entry)
+        if self.observer is not None:
+            self.observer("undo", None)
+        return entry[0]
+
+    def redo(self, target) -> Optional[Command]:
+        """Refaz o último comando desfeito; retorna-o ou None se não houver"""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        entry[0].apply(target)
+        self.undo_stack.append(entry)
+        if self.observer is not None:
+            self.observer("redo", None)
+        return entry[0]
+
+    def clear(self):
+        """Esvazia as duas pilhas"""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.bytes_used = 0
@@ -0,0 +1,93 @@
+import sys
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+try:
+    import resource  # Indisponível no Windows
+except ImportError:
+    resource = None
+
+
+def load_rgbx(path: str) -> Optional[np.ndarray]:
+    """Decodifica uma imagem em um único buffer RGBX (H, W, 4) uint8
+
+    O BGR decodificado pelo OpenCV é convertido direto para o buffer final
+    e descartado em seguida, sem cópias RGB intermediárias. Retorna None se
+    o arquivo não puder ser lido.
+    """
+    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    height, width = bgr.shape[:2]
+    rgbx = np.empty((height, width, 4), dtype=np.uint8)
+    cv2.cvtColor(bgr, cv2.COLOR_BGR2RGBA, dst=rgbx)
+    return rgbx
+
+
+def image_size(path: str) -> Optional[Tuple[int, int]]:
+    """Largura e altura da imagem, lendo só o cabeçalho (None se não der)
+
+    Mapas grandes passam do limite anti "decompression bomb" do PIL, que
+    `Image.open` verifica depois de ler o cabeçalho; nesse caso o cabeçalho
+    é lido direto pelo plugin do formato. O limite global não é alterado:
+    outras threads podem estar abrindo imagens ao mesmo tempo.
+    """
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        return header_size(path)
+    except Exception:
+        return None
+
+
+def estimate_nbytes(path: str) -> Optional[int]:
+    """Tamanho do buffer RGBX decodificado, lendo só o cabeçalho (None se não der)"""
+    size = image_size(path)
+    if size is None:
+        return None
+    width, height = size
+    return width * height * 4
+
+
+def header_size(path: str) -> Optional[Tuple[int, int]]:
+    """Tamanho pelo primeiro plugin do PIL que reconhecer o arquivo, sem o limite de pixels"""
+    Image.init()
+    try:
+        with open(path, "rb") as fp:
+            prefix = fp.read(16)
+            for name in Image.ID:
+                factory, accept = Image.OPEN[name]
+                if accept is not None and not accept(prefix):
+                    continue
+                fp.seek(0)
+                try:
+                    return factory(fp, path).size
+                except Exception:
+                    continue  # Não é deste formato
+    except OSError:
+        pass
+    return None
+
+
+def shared_views(rgbx: np.ndarray) -> Tuple[np.ndarray, Image.Image]:
+    """Cria a visão RGB em NumPy e a imagem PIL sobre o mesmo buffer, sem copiar
+
+    A imagem PIL mapeia a memória do array (modo RGBX, somente leitura).
+    """
+    height, width = rgbx.shape[:2]
+    rgb = rgbx[..., :3]
+    image = Image.frombuffer("RGBX", (width, height), rgbx, "raw", "RGBX", 0, 1)
+    return rgb, image
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Pico de memória residente do processo até agora (None se não disponível)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,149 @@
+import functools
+import json
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Ativa a instrumentação; o valor é o caminho do JSON gravado ao sair ("1" usa o padrão)
+PROFILE_ENV = "MAPGEN_PROFILE"
+DEFAULT_PROFILE_PATH = "mapgen_profile.json"
+
+# Histograma logarítmico: 20 faixas por década, de 1 us a 100 s
+BUCKETS_PER_DECADE = 20
+MIN_SECONDS = 1e-6
+BUCKET_COUNT = 8 * BUCKETS_PER_DECADE
+
+
+def profile_path_from_env() -> Optional[str]:
+    """Caminho do relatório se a instrumentação estiver ativada por variável de ambiente"""
+    value = os.environ.get(PROFILE_ENV, "").strip()
+    if not value or value == "0":
+        return None
+    return DEFAULT_PROFILE_PATH if value == "1" else value
+
+
+class LatencyHistogram:
+    """Histograma de latências com faixas logarítmicas de tamanho fixo
+
+    Registrar uma amostra custa um logaritmo e um incremento; os percentis
+    são interpolados dentro da faixa (erro de no máximo 12%).
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = min(BUCKET_COUNT - 1, int(math.log10(seconds / MIN_SECONDS) * BUCKETS_PER_DECADE))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Latência (s) abaixo da qual estão `q`% das amostras"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                # Interpola dentro da faixa
+                lower = MIN_SECONDS * 10 ** (bucket / BUCKETS_PER_DECADE)
+                upper = MIN_SECONDS * 10 ** ((bucket + 1) / BUCKETS_PER_DECADE)
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Contagem e latências em milissegundos"""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+            "total_ms": self.total * 1000,
+        }
+
+
+class Profiler:
+    """Cronometra métodos de um objeto e guarda histogramas e contadores"""
+
+    def __init__(self, output_path: Optional[str] = None):
+        self.output_path = output_path
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.gauges: Dict[str, float] = {}
+        self.started = time.time()
+
+    def instrument(self, obj, names: Iterable[str], prefix: str = ""):
+        """Substitui os métodos `names` da instância por versões cronometradas
+
+        Deve ser chamado antes de os métodos serem registrados como callbacks
+        (ex.: `bind`), pois os callbacks guardam o método da época.
+        """
+        for name in names:
+            method = getattr(obj, name)
+            setattr(obj, name, self.timed(prefix + name, method))
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        """Envolve `fn` registrando a duração de cada chamada em `name`"""
+        histogram = self.histograms.setdefault(name, LatencyHistogram())
+        perf_counter = time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.add(perf_counter() - start)
+        return wrapper
+
+    def gauge(self, name: str, value: float):
+        """Registra o valor atual (e o máximo) de uma medida, ex.: itens no canvas"""
+        self.gauges[name] = value
+        peak = name + "_max"
+        self.gauges[peak] = max(self.gauges.get(peak, value), value)
+
+    def count(self, name: str) -> int:
+        histogram = self.histograms.get(name)
+        return histogram.count if histogram else 0
+
+    def status_text(self, names: Iterable[str]) -> str:
+        """Resumo curto para a barra de status (p95 dos manipuladores dados)"""
+        parts = []
+        for name in names:
+            histogram = self.histograms.get(name)
+            if histogram and histogram.count:
+                parts.append(f"{name} p95 {histogram.percentile(95) * 1000:.1f}ms")
+        return " | ".join(parts)
+
+    def report(self, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Relatório completo: latências por método e medidas"""
+        report = {
+            "duration_s": time.time() - self.started,
+            "handlers": {name: h.summary() for name, h in sorted(self.histograms.items()) if h.count},
+            "gauges": dict(self.gauges),
+        }
+        if extra:
+            report.update(extra)
+        return report
+
+    def dump(self, extra: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Grava o relatório em JSON no caminho configurado"""
+        if not self.output_path:
+            return None
+        with open(self.output_path, "w") as f:
+            json.dump(self.report(extra), f, indent=4)
+        return self.output_path
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from history import AddPolygon, Command, command_from_record
+
+# Pasta dos diários de anotação (um arquivo por imagem)
+DEFAULT_JOURNAL_DIR = os.environ.get("MAPGEN_JOURNAL_DIR", os.path.join(os.path.expanduser("~"), ".mapgen", "journal"))
+# Intervalo máximo (s) entre uma operação e sua gravação com fsync
+FLUSH_INTERVAL = 0.5
+JOURNAL_VERSION = 2  # 2: vários recortes por imagem
+
+
+def journal_path(image_path: str, directory: Optional[str] = None) -> str:
+    """Arquivo do diário de uma imagem (nome + hash do caminho absoluto)"""
+    absolute = os.path.abspath(image_path)
+    digest = hashlib.sha1(absolute.encode("utf-8")).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(absolute))[0]
+    return os.path.join(directory or DEFAULT_JOURNAL_DIR, f"{name}-{digest}.jsonl")
+
+
+def read_journal(path: str, width: int, height: int) -> List[Dict[str, Any]]:
+    """Operações gravadas no diário, se ele for da imagem com este tamanho
+
+    Uma última linha incompleta (queda no meio da gravação) é ignorada.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    if not lines:
+        return []
+    try:
+        header = json.loads(lines[0])
+    except ValueError:
+        return []
+    if header.get("journal") != JOURNAL_VERSION or header.get("size") != [width, height]:
+        return []
+
+    records = []
+    for line in lines[1:]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            break
+    return records
+
+
+def replay(session, records: List[Dict[str, Any]]) -> int:
+    """Reaplica as operações do diário na sessão; retorna quantas foram aplicadas
+
+    O observador do histórico é desligado durante a reprodução, para que as
+    operações não sejam gravadas de novo.
+    """
+    history = session.history
+    observer, history.observer = history.observer, None
+    applied = 0
+    try:
+        for record in records:
+            op = record.get("op")
+            if op == "do":
+                command = command_from_record(record, session)
+                history.do(command, session)
+                if isinstance(command, AddPolygon):
+                    session.next_color_index += 1  # Mesma sequência de cores da edição original
+            elif op == "undo":
+                history.undo(session)
+            elif op == "redo":
+                history.redo(session)
+            else:
+                continue
+            applied += 1
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass  # Diário inconsistente: mantém o que foi possível restaurar
+    finally:
+        history.observer = observer
+    session.selected_polygon_index = None
+    return applied
+
+
+class Journal:
+    """Diário de operações de anotação de uma imagem, gravado em segundo plano
+
+    `append` apenas enfileira a operação; uma thread agrupa as operações
+    pendentes e grava em lote com `fsync`, sem bloquear a interface.
+    Use `attach` para gravar tudo o que passar pelo histórico da sessão.
+    """
+
+    def __init__(self, image_path: str, width: int, height: int, directory: Optional[str] = None,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.path = journal_path(image_path, directory)
+        self.header = {"journal": JOURNAL_VERSION, "image": os.path.abspath(image_path), "size": [width, height]}
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.written = 0
+        self.enqueued = 0  # Operações enfileiradas (thread do Tk)
+        self.processed = 0  # Operações já tratadas pela thread de gravação
+        self.error: Optional[str] = None
+        self._closed = False
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(target=self._run, name="mapgen-journal", daemon=True)
+        self._thread.start()
+
+    def read(self) -> List[Dict[str, Any]]:
+        """Operações já gravadas no diário desta imagem"""
+        width, height = self.header["size"]
+        return read_journal(self.path, width, height)
+
+    def attach(self, session):
+        """Grava as operações do histórico da sessão a partir de agora"""
+        session.history.observer = self.on_history
+
+    def detach(self, session):
+        if session.history.observer == self.on_history:
+            session.history.observer = None
+
+    def on_history(self, op: str, command: Optional[Command]):
+        record = {"op": op}
+        if command is not None:
+            record["kind"] = command.kind
+            record.update(command.to_record())
+        self.append(record)
+
+    def append(self, record: Dict[str, Any]):
+        """Enfileira uma operação (retorna imediatamente)"""
+        self.enqueued += 1
+        self._idle.clear()
+        self.queue.put(("record", record))
+
+    def reset(self):
+        """Descarta o diário (ex.: após salvar as anotações)"""
+        self._idle.clear()
+        self.queue.put(("reset", None))
+
+    def checkpoint(self) -> int:
+        """Marca o ponto atual do diário, para `discard` depois (ex.: ao enviar um salvamento)"""
+        return self.enqueued
+
+    def discard(self, checkpoint: int):
+        """Apaga do diário as operações até `checkpoint`, mantendo as posteriores
+
+        Usado quando um salvamento termina: o que foi feito depois dele
+        continua protegido. Com o diário já fechado (outra imagem aberta), o
+        arquivo é reescrito aqui mesmo.
+        """
+        if not self._closed:
+            self._idle.clear()
+            self.queue.put(("discard", checkpoint))
+            return
+        self._thread.join()
+        try:
+            self._discard(None, checkpoint)
+        except OSError as e:
+            self.error = str(e)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera a gravação do que já foi enfileirado"""
+        self.queue.put(("flush", None))
+        return self._idle.wait(timeout)
+
+    def close(self, wait: bool = True, timeout: Optional[float] = 5.0):
+        """Grava as operações pendentes e encerra a thread (sem esperar, com `wait=False`)"""
+        self._closed = True
+        self.queue.put(None)
+        if wait:
+            self._thread.join(timeout)
+
+    def _run(self):
+        file = None
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            # Junta o que chegar até o fim do intervalo (ou até fechar)
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None and item[0] == "record":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            try:
+                file = self._write(file, batch)
+            except OSError as e:
+                self.error = str(e)
+            if self.queue.empty():
+                self._idle.set()
+            if batch[-1] is None:
+                break
+        if file is not None:
+            file.close()
+
+    def _write(self, file, batch: List[Optional[tuple]]):
+        lines = []
+        for item in batch:
+            if item is None or item[0] == "flush":
+                continue
+            kind, record = item
+            if kind == "discard":
+                file = self._write_lines(file, lines)
+                lines = []
+                file = self._discard(file, record)
+                continue
+            if kind == "reset":
+                lines.clear()
+                if file is not None:
+                    file.close()
+                    file = None
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                continue
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+            self.processed += 1
+        return self._write_lines(file, lines)
+
+    def _write_lines(self, file, lines: List[str]):
+        if not lines:
+            return file
+
+        if file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            file = open(self.path, "a", encoding="utf-8")
+            if file.tell() == 0:
+                file.write(json.dumps(self.header) + "\n")
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+        self.written += len(lines)
+        return file
+
+    def _discard(self, file, checkpoint: int):
+        """Reescreve o arquivo só com as operações posteriores a `checkpoint`"""
+        keep = self.processed - checkpoint  # Últimas linhas do arquivo que continuam valendo
+        if file is not None:
+            file.close()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+        records = lines[1:]
+        if keep >= len(records):
+            return None  # Nada a apagar (o diário já foi zerado depois do ponto)
+        if keep <= 0:
+            os.remove(self.path)
+            return None
+        partial = self.path + ".partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            f.writelines([lines[0], *records[-keep:]])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, self.path)
+        return None
@@ -0,0 +1,91 @@
+import math
+import os
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from render_cache import RenderCache
+
+# Erro máximo do contorno simplificado, em pixels de tela
+DEFAULT_TOLERANCE_PX = float(os.environ.get("MAPGEN_LOD_TOLERANCE", "0.75"))
+# Distância mínima na tela entre vértices vizinhos para mostrar suas alças
+HANDLE_SPACING_PX = 12.0
+# Níveis de zoom por oitava: a simplificação é refeita só ao mudar de nível
+LEVELS_PER_OCTAVE = 4
+# Memória dos contornos simplificados em cache (em MB)
+DEFAULT_BUDGET_MB = int(os.environ.get("MAPGEN_LOD_CACHE_MB", "32"))
+# Polígonos pequenos são desenhados sem simplificação
+MIN_SIMPLIFY_VERTICES = 16
+
+
+def zoom_level(scale: float) -> int:
+    """Nível de zoom discreto do fator de escala"""
+    return round(math.log2(scale) * LEVELS_PER_OCTAVE)
+
+
+def level_scale(level: int) -> float:
+    return 2.0 ** (level / LEVELS_PER_OCTAVE)
+
+
+def simplify(points: np.ndarray, epsilon: float) -> np.ndarray:
+    """Contorno fechado simplificado por Douglas-Peucker (subconjunto dos vértices)"""
+    contour = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    approx = cv2.approxPolyDP(contour, epsilon, True)
+    if len(approx) < 3:
+        return points
+    return approx.reshape(-1, 2)
+
+
+def neighbor_spacing(points: np.ndarray) -> np.ndarray:
+    """Distância de cada vértice ao vizinho mais próximo no contorno (em pixels da imagem)"""
+    if len(points) < 2:
+        return np.full(len(points), np.inf)
+    edges = np.hypot(*(np.roll(points, -1, axis=0) - points).T)  # Aresta i -> i+1
+    return np.minimum(edges, np.roll(edges, 1))
+
+
+class PolygonLod:
+    """Nível de detalhe dos polígonos para o desenho
+
+    Contornos são simplificados para o zoom atual e guardados por nível de
+    zoom; alças de vértices só aparecem quando os vizinhos estão longe o
+    bastante na tela para serem clicados. A geometria armazenada não muda:
+    as entradas são identificadas pela revisão do polígono no `PolygonStore`,
+    então um acerto custa O(1) e um polígono editado simplesmente gera uma
+    entrada nova.
+    """
+
+    def __init__(self, tolerance_px: float = DEFAULT_TOLERANCE_PX,
+                 handle_spacing_px: float = HANDLE_SPACING_PX,
+                 budget_bytes: Optional[int] = None):
+        self.tolerance_px = tolerance_px
+        self.handle_spacing_px = handle_spacing_px
+        self.cache = RenderCache(budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_MB * 1024 * 1024)
+
+    def outline(self, points: np.ndarray, revision: int, scale: float) -> np.ndarray:
+        """Vértices do contorno a desenhar no zoom `scale` (coordenadas da imagem)
+
+        `revision` é o selo do polígono no store (`PolygonView.revision`).
+        """
+        if len(points) < MIN_SIMPLIFY_VERTICES:
+            return points
+        level = zoom_level(scale)
+        key = ("outline", level, revision)
+        simplified = self.cache.get(key)
+        if simplified is None:
+            simplified = simplify(points, self.tolerance_px / level_scale(level))
+            self.cache.put(key, simplified, simplified.nbytes + 128)
+        return simplified
+
+    def handles(self, points: np.ndarray, revision: int, scale: float) -> np.ndarray:
+        """Índices dos vértices cujas alças podem ser clicadas no zoom `scale`"""
+        key = ("spacing", revision)
+        spacing = self.cache.get(key)
+        if spacing is None:
+            spacing = neighbor_spacing(points)
+            self.cache.put(key, spacing, spacing.nbytes + 128)
+        return np.flatnonzero(spacing * scale >= self.handle_spacing_px)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
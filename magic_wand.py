@@ -0,0 +1,133 @@
+import math
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Diferença máxima de cor (por canal) em relação ao pixel clicado
+DEFAULT_TOLERANCE = int(os.environ.get("MAPGEN_WAND_TOLERANCE", "20"))
+# Maior lado do nível reduzido onde a região é encontrada
+LEVEL_MAX_SIDE = 2048
+# Pixels máximos do refinamento; regiões maiores são refinadas com passo > 1
+REFINE_MAX_PIXELS = 2_000_000
+# Erro máximo do contorno simplificado, em pixels do refinamento
+CONTOUR_EPSILON = 1.0
+# Regiões do nível reduzido com até esta área (em pixels do nível) podem ser detalhes finos
+MIN_LEVEL_AREA = 4
+# Janela inicial e pixels máximos do preenchimento direto em resolução cheia
+WINDOW_SIDE = 1024
+WINDOW_MAX_PIXELS = 25_000_000
+# Vizinhança 8, só máscara, tolerância em relação ao pixel clicado
+FLOOD_FLAGS = 8 | cv2.FLOODFILL_MASK_ONLY | cv2.FLOODFILL_FIXED_RANGE
+
+
+class MagicWand:
+    """Varinha mágica: região de cor parecida com a do ponto clicado, como polígono
+
+    O preenchimento (`cv2.floodFill`) roda primeiro em um nível reduzido da
+    imagem, gerado uma única vez; depois é refeito em resolução cheia só
+    dentro da caixa da região encontrada, limitado a ela (dilatada), e o
+    contorno vira polígono com `findContours`/`approxPolyDP`.
+
+    Detalhes finos (uma estrada de 2 pixels) somem na média do nível
+    reduzido: se a região reduzida for minúscula ou a cor do nível no ponto
+    não corresponder à do pixel clicado, o preenchimento roda direto em
+    resolução cheia, em uma janela em volta do clique que cresce na direção
+    das bordas em que a região encosta (até `WINDOW_MAX_PIXELS`).
+    """
+
+    def __init__(self, image: np.ndarray, max_side: int = LEVEL_MAX_SIDE,
+                 refine_max_pixels: int = REFINE_MAX_PIXELS):
+        self.image = image  # Buffer RGBX (altura, largura, 4), sem cópia
+        self.height, self.width = image.shape[:2]
+        self.factor = max(1, math.ceil(max(self.width, self.height) / max_side))
+        self.refine_max_pixels = refine_max_pixels
+        self._level: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def level(self) -> np.ndarray:
+        """Nível reduzido (RGB contíguo), gerado na primeira chamada"""
+        with self._lock:
+            if self._level is None:
+                size = (math.ceil(self.width / self.factor), math.ceil(self.height / self.factor))
+                reduced = cv2.resize(self.image, size, interpolation=cv2.INTER_AREA)
+                self._level = np.ascontiguousarray(reduced[:, :, :3])
+            return self._level
+
+    def warm(self):
+        """Gera o nível reduzido em segundo plano (o OpenCV libera o GIL)"""
+        threading.Thread(target=self.level, name="magic-wand", daemon=True).start()
+
+    def select(self, x: float, y: float, tolerance: int = DEFAULT_TOLERANCE) -> Optional[List[Tuple[float, float]]]:
+        """Polígono (coordenadas da imagem) da região em volta de (x, y), ou None"""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        level = self.level()
+        f = self.factor
+        level_h, level_w = level.shape[:2]
+        lx, ly = min(int(x // f), level_w - 1), min(int(y // f), level_h - 1)
+        diff = (tolerance,) * 3
+
+        # 1. Região no nível reduzido
+        mask = np.zeros((level_h + 2, level_w + 2), dtype=np.uint8)
+        area, _, _, (rx, ry, rw, rh) = cv2.floodFill(level, mask, (lx, ly), 0, diff, diff, FLOOD_FLAGS | (1 << 8))
+        seed = self.image[int(y), int(x), :3].astype(np.int16)
+        if area <= MIN_LEVEL_AREA or np.any(np.abs(level[ly, lx].astype(np.int16) - seed) > tolerance):
+            return self._select_window(x, y, diff)
+
+        # 2. Caixa da região (com um pixel do nível de margem) em resolução cheia
+        lx0, ly0 = max(0, rx - 1), max(0, ry - 1)
+        lx1, ly1 = min(level_w, rx + rw + 1), min(level_h, ry + rh + 1)
+        x0, y0 = lx0 * f, ly0 * f
+        x1, y1 = min(self.width, lx1 * f), min(self.height, ly1 * f)
+        step = max(1, math.ceil(math.sqrt((x1 - x0) * (y1 - y0) / self.refine_max_pixels)))
+        roi = np.ascontiguousarray(self.image[y0:y1:step, x0:x1:step, :3])
+        roi_h, roi_w = roi.shape[:2]
+
+        # Só pode crescer dentro da região reduzida dilatada (máscara != 0 bloqueia)
+        allowed = cv2.dilate(mask[1 + ly0:1 + ly1, 1 + lx0:1 + lx1], np.ones((3, 3), np.uint8))
+        allowed = cv2.resize(allowed, (roi_w, roi_h), interpolation=cv2.INTER_NEAREST)
+        refine = np.ones((roi_h + 2, roi_w + 2), dtype=np.uint8)
+        refine[1:-1, 1:-1] = allowed == 0
+
+        point = (min(int((x - x0) // step), roi_w - 1), min(int((y - y0) // step), roi_h - 1))
+        refine[point[1] + 1, point[0] + 1] = 0
+        cv2.floodFill(roi, refine, point, 0, diff, diff, FLOOD_FLAGS | (2 << 8))
+        return region_polygon(refine[1:-1, 1:-1] == 2, step, x0, y0)
+
+    def _select_window(self, x: float, y: float, diff: Tuple[int, int, int]) -> Optional[List[Tuple[float, float]]]:
+        """Preenchimento em resolução cheia, sem o nível reduzido, em uma janela em volta do clique"""
+        half = WINDOW_SIDE // 2
+        x0, y0 = max(0, int(x) - half), max(0, int(y) - half)
+        x1, y1 = min(self.width, int(x) + half), min(self.height, int(y) + half)
+        while True:
+            roi = np.ascontiguousarray(self.image[y0:y1, x0:x1, :3])
+            mask = np.zeros((y1 - y0 + 2, x1 - x0 + 2), dtype=np.uint8)
+            _, _, _, (rx, ry, rw, rh) = cv2.floodFill(roi, mask, (int(x) - x0, int(y) - y0), 0, diff, diff,
+                                                      FLOOD_FLAGS | (1 << 8))
+            # A janela cresce só para os lados em que a região encosta (e a imagem continua)
+            width, height = x1 - x0, y1 - y0
+            nx0 = max(0, x0 - width) if rx == 0 else x0
+            ny0 = max(0, y0 - height) if ry == 0 else y0
+            nx1 = min(self.width, x1 + width) if rx + rw == width else x1
+            ny1 = min(self.height, y1 + height) if ry + rh == height else y1
+            if (nx0, ny0, nx1, ny1) == (x0, y0, x1, y1) or (nx1 - nx0) * (ny1 - ny0) > WINDOW_MAX_PIXELS:
+                return region_polygon(mask[1:-1, 1:-1] == 1, 1, x0, y0)
+            x0, y0, x1, y1 = nx0, ny0, nx1, ny1
+
+
+def region_polygon(region: np.ndarray, step: int, x0: int, y0: int) -> Optional[List[Tuple[float, float]]]:
+    """Contorno externo simplificado da maior região da máscara, em coordenadas da imagem"""
+    contours, _ = cv2.findContours(region.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    largest = max(contours, key=cv2.contourArea)
+    contour = cv2.approxPolyDP(largest, CONTOUR_EPSILON, True).reshape(-1, 2)
+    if len(contour) < 3:
+        contour = largest.reshape(-1, 2)  # Região com 1 ou 2 pixels de largura: sem simplificar
+    if len(contour) < 3:
+        return None
+    points = contour.astype(np.float64) * step + (x0, y0)
+    return [tuple(p) for p in np.round(points, 1).tolist()]
@@ -0,0 +1,85 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageTk
+
+# Ampliação e tamanho (em pixels de tela) da lupa
+DEFAULT_ZOOM = float(os.environ.get("MAPGEN_MAGNIFIER_ZOOM", "2.0"))
+DEFAULT_SIZE = int(os.environ.get("MAPGEN_MAGNIFIER_SIZE", "200"))
+
+BACKGROUND = 255  # Cor de fundo fora da imagem (branco)
+
+
+def sample_indices(center: int, size: int, zoom: float, limit: int) -> Tuple[np.ndarray, slice]:
+    """Índices (vizinho mais próximo) da imagem para cada pixel da lupa em um eixo
+
+    Retorna os índices já limitados a [0, limit) e o trecho da lupa que cai
+    dentro da imagem; o resto é preenchido com o fundo.
+    """
+    offsets = np.floor((np.arange(size) + 0.5 - size / 2) / zoom).astype(np.intp)
+    indices = center + offsets
+    inside = np.flatnonzero((indices >= 0) & (indices < limit))
+    valid = slice(inside[0], inside[-1] + 1) if len(inside) else slice(0, 0)
+    np.clip(indices, 0, limit - 1, out=indices)
+    return indices, valid
+
+
+def magnify_into(image: np.ndarray, x: int, y: int, zoom: float, out: np.ndarray) -> np.ndarray:
+    """Amplia a região de `image` centrada em (x, y) para dentro de `out`
+
+    Só a janela de origem necessária é lida da imagem (fatia sem cópia); a
+    ampliação é feita por vizinho mais próximo, direto no buffer de saída.
+    """
+    out_h, out_w = out.shape[:2]
+    height, width = image.shape[:2]
+    rows, valid_rows = sample_indices(y, out_h, zoom, height)
+    cols, valid_cols = sample_indices(x, out_w, zoom, width)
+
+    top, left = rows[0], cols[0]
+    window = image[top:rows[-1] + 1, left:cols[-1] + 1]
+    np.take(window.take(rows - top, axis=0), cols - left, axis=1, out=out)
+
+    out[:valid_rows.start] = BACKGROUND
+    out[valid_rows.stop:] = BACKGROUND
+    out[:, :valid_cols.start] = BACKGROUND
+    out[:, valid_cols.stop:] = BACKGROUND
+    return out
+
+
+class Magnifier:
+    """Lupa sobre um canvas de overlay que reaproveita imagem, buffer e itens
+
+    A PhotoImage, o buffer RGBX de saída e a cruz são criados uma única vez;
+    cada atualização só reamostra a região e faz `paste` na mesma PhotoImage.
+    """
+
+    def __init__(self, canvas, size: Optional[int] = None, zoom: Optional[float] = None):
+        self.canvas = canvas
+        self.zoom = zoom or DEFAULT_ZOOM
+        self.size = 0
+        self.photo: Optional[ImageTk.PhotoImage] = None
+        self.resize(size or DEFAULT_SIZE)
+
+    def resize(self, size: int):
+        """Recria os buffers e itens para um novo tamanho de janela"""
+        self.size = size
+        self.canvas.config(width=size, height=size)
+        self.canvas.delete("all")
+        self.buffer = np.full((size, size, 4), BACKGROUND, dtype=np.uint8)
+        # Imagem PIL mapeada sobre o buffer: o paste lê direto do array
+        self.frame = Image.frombuffer("RGBX", (size, size), self.buffer, "raw", "RGBX", 0, 1)
+        self.photo = ImageTk.PhotoImage("RGB", (size, size))
+        self.image_item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+        center = size // 2
+        self.cross_h = self.canvas.create_line(0, center, size, center, fill="red", width=1)
+        self.cross_v = self.canvas.create_line(center, 0, center, size, fill="red", width=1)
+
+    def set_zoom(self, zoom: float):
+        """Altera o fator de ampliação"""
+        self.zoom = max(1.0, zoom)
+
+    def update(self, image: np.ndarray, x: int, y: int):
+        """Mostra a região da imagem (H, W, 4) centrada no ponto (x, y) da imagem"""
+        magnify_into(image, x, y, self.zoom, self.buffer)
+        self.photo.paste(self.frame)
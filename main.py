@@ -1,19 +1,52 @@
-import cv2
-import json
 import os
+import sqlite3
+import sys
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
 from tkinter import ttk
 from ttkthemes import ThemedTk
 from PIL import Image, ImageTk, ImageOps
 import numpy as np
-from typing import List, Tuple, Optional, Dict, Any, Deque
-from collections import deque
-import colorsys
+from typing import Callable, List, Set, Tuple, Optional, Dict, Any
+from concurrent.futures import Future
+
+from annotation_session import AnnotationSession
+from scene import CanvasScene
+from decode_cache import DecodeCache
+from events import EventCoalescer
+from folder_browser import FolderBrowser
+from exporters import DEFAULT_FORMATS, EXPORTERS, NATIVE_FORMAT, load_plugins, submit_exports
+from instrumentation import DEFAULT_PROFILE_PATH, Profiler, profile_path_from_env
+from journal import Journal, replay
+from image_io import shared_views, peak_rss_bytes
+from lod import PolygonLod
+from magic_wand import MagicWand
+from magnifier import Magnifier
+from prefetch import FolderSession, Prefetcher, list_images
+from project_index import ProjectIndex, crop_rows, polygon_rows
+from render_cache import RenderCache
+from save_queue import SaveQueue, write_crop
+from tiles import TilePyramid
 
 class ImageEditor:
-    def __init__(self, root: ThemedTk):
+    HIT_RADIUS = 10  # Tolerância de clique em vértices e contornos, em pixels de tela
+    CULL_MARGIN = 64  # Polígonos até esta distância (pixels de tela) da área visível também são desenhados
+
+    # Métodos cronometrados quando a instrumentação está ativa
+    HOT_PATHS = (
+        "redraw", "display_image_on_canvas", "draw_polygons", "draw_current_polygon",
+        "draw_crop_rectangle", "draw_temp_line", "show_zoom_preview",
+        "on_mouse_move", "on_mouse_drag", "on_left_click", "on_mouse_release",
+        "on_mouse_wheel", "on_pan", "open_image", "save_crop", "save_polygons",
+    )
+    SESSION_HOT_PATHS = ("export_context", "save_polygons", "save_masks", "save_crop_metadata")
+    # Manipuladores resumidos na barra de status
+    STATUS_PATHS = ("redraw", "on_mouse_drag", "show_zoom_preview")
+
+    def __init__(self, root: ThemedTk, profiler: Optional[Profiler] = None):
         self.root = root
+        self.profiler = profiler
         self.root.title("Map Editor")
         self.style = ttk.Style()
         self.style.theme_use('clam')
@@ -24,48 +57,77 @@ class ImageEditor:
         
         # Canvas com fundo branco
         self.canvas = tk.Canvas(self.frame, width=1200, height=800, bg="white")
-        self.h_scroll = ttk.Scrollbar(self.frame, orient="horizontal", command=self.canvas.xview)
-        self.v_scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self.canvas.yview)
+        self.h_scroll = ttk.Scrollbar(self.frame, orient="horizontal", command=self.on_xview)
+        self.v_scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_yview)
         self.canvas.configure(xscrollcommand=self.h_scroll.set, yscrollcommand=self.v_scroll.set)
         
         self.h_scroll.pack(side=tk.BOTTOM, fill=tk.X)
         self.v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scene = CanvasScene(self.canvas)  # Itens persistentes do canvas
+        # Miniaturas da pasta, acopladas à esquerda do canvas (ocultas até F3)
+        self.browser = FolderBrowser(self.frame, self.open_from_browser, dock_before=self.h_scroll)
         
         # Configuração do overlay para zoom
         self.overlay = tk.Canvas(root, width=200, height=200, bg="white", bd=2, relief="solid")
+        self.magnifier = Magnifier(self.overlay)  # Reaproveita a mesma PhotoImage a cada movimento
         self.overlay.place(relx=1.0, rely=0.0, anchor="ne", x=-10, y=10)
         self.overlay.place_forget()  # Inicialmente oculto
         self.overlay_visible = False
 
         # Estados e variáveis de controle
         self.mode = None
-        self.original_image: Optional[np.ndarray] = None
+        self.original_image: Optional[np.ndarray] = None  # Visão RGB de image_buffer
+        self.image_buffer: Optional[np.ndarray] = None  # Único buffer RGBX da imagem carregada
         self.display_image: Optional[Image.Image] = None
         self.filepath: Optional[str] = None
-        self.polygons: List[Dict] = []  # Armazena dicionários com 'points', 'label', 'id' e 'color'
-        self.current_polygon: List[Tuple[int, int]] = []
-        self.crop_rect: Optional[Tuple[int, int, int, int]] = None
-        self.crop_start_point: Optional[Tuple[int, int]] = None
-        self.rect_moving = False
+        self.session = AnnotationSession()  # Anotações, histórico e regras de edição (sem Tk)
         self.keep_aspect_ratio = tk.BooleanVar(value=True)
+        self.keep_aspect_ratio.trace_add("write", self.on_keep_aspect_ratio)
         self.initial_load = True
-        self.rect_move_offset = (0, 0)
         self.scale_factor = 1.0
         self.zoom_state = False
         self.pan_start = None
         self.last_save_dir = os.getcwd()
-        self.aspect_ratio = 1.0
         self.temp_line = None
-        self.action_history: Deque = deque(maxlen=50)  # Histórico de ações para Ctrl+Z
-        self.dragging_point = None  # Ponto sendo arrastado (polygon_index, point_index)
-        self.dragging_polygon = None  # Polígono sendo arrastado (polygon_index)
-        self.drag_offset = (0, 0)  # Offset para arrastar polígono
-        self.next_polygon_id = 1  # Contador para IDs de polígonos
-        self.next_color_index = 0  # Índice para cores de polígonos
-        self.selected_polygon_index = None  # Polígono selecionado para remoção
+        self.motion = EventCoalescer(root)  # Eventos de movimento processados uma vez por quadro
+        self.pyramid: Optional[TilePyramid] = None  # Pirâmide de tiles da imagem atual
+        self.tile_images: Dict[Tuple, ImageTk.PhotoImage] = {}  # Tiles atualmente no canvas
+        self.tile_cache = RenderCache()  # PhotoImages prontas, por (imagem, zoom, tile)
+        self.visible_counts = (0, 0)  # Polígonos desenhados / total (barra de status)
+        self.status_message = ""
+        self.lod = PolygonLod()  # Contornos simplificados e alças visíveis, por nível de zoom
+        self.image_key = None  # Identifica a imagem atual nas chaves do cache
+        self.image_generation = 0
+        load_plugins()
+        # Formatos gravados junto com o JSON do editor (em paralelo, na fila de gravação)
+        self.export_formats = {name: tk.BooleanVar(value=name in DEFAULT_FORMATS)
+                               for name in EXPORTERS if name != NATIVE_FORMAT}
+        self.wand_mode = tk.BooleanVar(value=False)  # Clique cria o polígono da região (varinha mágica)
+        self.wand: Optional[MagicWand] = None
+        self.folder_mode = tk.BooleanVar(value=False)  # Navega pelas imagens da pasta sem diálogo
+        self.folder_session: Optional[FolderSession] = None
+        self.decode_cache = DecodeCache()  # Imagens já decodificadas, mapeadas do disco
+        self.prefetcher = Prefetcher(self.decode_cache.load)  # Decodifica as próximas imagens em segundo plano
+        self.save_queue = SaveQueue()  # Recortes codificados e gravados em segundo plano
+        # Gravações de cada salvamento e o que fazer quando todas derem certo
+        self.pending_saves: List[Tuple[List[Future], Tuple[Callable[[], None], ...]]] = []
+        self._polling_saves = False  # `poll_saves` já está agendado
+        try:
+            self.project: Optional[ProjectIndex] = ProjectIndex()  # Índice SQLite das anotações salvas
+        except (OSError, sqlite3.Error) as e:
+            self.root.after_idle(messagebox.showwarning, "Aviso", f"Índice do projeto desativado: {e}")
+            self.project = None
+        self.journal: Optional[Journal] = None  # Diário das operações da imagem atual (gravado em segundo plano)
+        self.pending_journal: List[Dict[str, Any]] = []  # Operações não salvas a restaurar
+        self.warned_errors: Set[str] = set()  # Componentes em segundo plano cuja falha já foi avisada
 
         self.setup_ui()
+        if self.profiler is not None:
+            # Antes dos bindings, que guardam os métodos já cronometrados
+            self.profiler.instrument(self, self.HOT_PATHS)
+            self.profiler.instrument(self.session, self.SESSION_HOT_PATHS, prefix="session.")
+            self.refresh_profile()
         self.setup_bindings()
         
         # Mostrar mensagem de boas-vindas
@@ -74,23 +136,16 @@ class ImageEditor:
         # Agendar carregamento da imagem para depois da UI estar pronta
         self.root.after(100, self.load_image)
 
-    def generate_distinct_color(self):
-        """Gera uma cor distinta para cada polígono usando HSL"""
-        hue = self.next_color_index * 0.618033988749895  # Ângulo dourado
-        hue = hue % 1.0
-        r, g, b = colorsys.hls_to_rgb(hue, 0.5, 0.9)
-        self.next_color_index += 1
-        return f"#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}"
-
     def show_welcome_message(self):
         """Exibe uma mensagem de boas-vindas no canvas"""
-        self.canvas.delete("all")
-        self.canvas.create_text(400, 300, text="Map Editor", 
-                              font=("Arial", 24), fill="navy")
-        self.canvas.create_text(400, 350, text="Selecione uma imagem para começar", 
-                              font=("Arial", 14), fill="gray")
-        self.canvas.create_text(400, 400, text="Use Ctrl+O para abrir uma imagem", 
-                              font=("Arial", 12), fill="gray")
+        self.scene.clear()
+        with self.scene.layer("welcome") as layer:
+            layer.item("title", "text", (400, 300), text="Map Editor",
+                       font=("Arial", 24), fill="navy")
+            layer.item("hint", "text", (400, 350), text="Selecione uma imagem para começar",
+                       font=("Arial", 14), fill="gray")
+            layer.item("shortcut", "text", (400, 400), text="Use Ctrl+O para abrir uma imagem",
+                       font=("Arial", 12), fill="gray")
         self.update_status("Pronto para carregar uma imagem")
 
     def setup_ui(self):
@@ -98,6 +153,15 @@ class ImageEditor:
         # Barra de status
         self.status_bar = ttk.Label(self.root, text="Ready | Mode: None | Image: None", anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        # Andamento das gravações em segundo plano (só visível com gravações pendentes)
+        self.save_indicator = ttk.Frame(self.root)
+        self.save_label = ttk.Label(self.save_indicator, text="", anchor=tk.W)
+        self.save_label.pack(side=tk.LEFT, padx=5)
+        self.save_progress = ttk.Progressbar(self.save_indicator, mode="indeterminate", length=120)
+        self.save_progress.pack(side=tk.LEFT, padx=5)
+        if self.profiler is not None:
+            self.profile_bar = ttk.Label(self.root, text="", anchor=tk.W, foreground="gray")
+            self.profile_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
         # Barra de ferramentas
         self.toolbar = ttk.Frame(self.root)
@@ -118,6 +182,27 @@ class ImageEditor:
             width=8
         ).pack(side=tk.LEFT, padx=5, pady=2)
         
+        ttk.Checkbutton(
+            self.toolbar,
+            text="Sessão de Pasta",
+            variable=self.folder_mode,
+            command=self.toggle_folder_mode
+        ).pack(side=tk.LEFT, padx=5, pady=2)
+
+        ttk.Button(
+            self.toolbar,
+            text="Miniaturas (F3)",
+            command=self.toggle_browser,
+            width=14
+        ).pack(side=tk.LEFT, padx=5, pady=2)
+
+        formats_button = ttk.Menubutton(self.toolbar, text="Formatos")
+        formats_menu = tk.Menu(formats_button, tearoff=False)
+        for name, var in self.export_formats.items():
+            formats_menu.add_checkbutton(label=EXPORTERS[name].description, variable=var)
+        formats_button["menu"] = formats_menu
+        formats_button.pack(side=tk.LEFT, padx=5, pady=2)
+
         # Checkbutton só aparece no modo recorte
         self.aspect_check = ttk.Checkbutton(
             self.toolbar,
@@ -125,6 +210,13 @@ class ImageEditor:
             variable=self.keep_aspect_ratio
         )
         
+        # Checkbutton só aparece no modo polígono
+        self.wand_check = ttk.Checkbutton(
+            self.toolbar,
+            text="Varinha Mágica",
+            variable=self.wand_mode
+        )
+        
         ttk.Button(
             self.toolbar,
             text="Desfazer (Ctrl+Z)",
@@ -132,6 +224,13 @@ class ImageEditor:
             width=15
         ).pack(side=tk.LEFT, padx=5, pady=2)
         
+        ttk.Button(
+            self.toolbar,
+            text="Refazer (Ctrl+Y)",
+            command=self.redo_action,
+            width=15
+        ).pack(side=tk.LEFT, padx=5, pady=2)
+        
         ttk.Button(
             self.toolbar,
             text="Limpar Tudo",
@@ -150,29 +249,105 @@ class ImageEditor:
 
     def setup_bindings(self):
         """Configura todos os bindings de eventos"""
-        self.canvas.bind("<Button-1>", self.on_left_click)
-        self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
-        self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
-        self.canvas.bind("<Button-3>", self.on_right_click)
-        self.canvas.bind("<B3-Motion>", self.on_right_drag)
-        self.canvas.bind("<ButtonRelease-3>", self.on_right_release)
+        # Eventos de movimento passam pelo agrupador; cliques e solturas
+        # processam antes o que estiver pendente para manter a ordem
+        self.canvas.bind("<Button-1>", self.after_motion(self.on_left_click))
+        self.canvas.bind("<B1-Motion>", self.motion.bind(self.on_mouse_drag))
+        self.canvas.bind("<ButtonRelease-1>", self.after_motion(self.on_mouse_release))
+        self.canvas.bind("<Button-3>", self.after_motion(self.on_right_click))
+        self.canvas.bind("<B3-Motion>", self.motion.bind(self.on_right_drag))
+        self.canvas.bind("<ButtonRelease-3>", self.after_motion(self.on_right_release))
         self.root.bind("<Control-s>", self.save_and_restart)
         self.root.bind("<Escape>", self.cancel_operation)
         self.root.bind("<Return>", self.finalize_polygon)
         self.root.bind("<Delete>", self.delete_selected)
+        self.root.bind("<F2>", self.rename_crop)
+        self.canvas.bind("<Double-Button-1>", self.after_motion(self.rename_crop))
         self.root.bind("<Control-z>", self.undo_action)
+        self.root.bind("<Control-y>", self.redo_action)
+        self.root.bind("<Control-Z>", self.redo_action)  # Ctrl+Shift+Z
         self.root.bind("<Control-o>", self.load_image)
+        self.root.bind("<Next>", self.next_image)  # Page Down
+        self.root.bind("<Prior>", self.previous_image)  # Page Up
+        self.root.bind("<F3>", self.toggle_browser)
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
-        self.canvas.bind("<Motion>", self.on_mouse_move)
-        self.canvas.bind("<Button-2>", self.start_pan)  # Botão do meio do mouse
-        self.canvas.bind("<B2-Motion>", self.on_pan)
+        self.canvas.bind("<Motion>", self.motion.bind(self.on_mouse_move))
+        self.canvas.bind("<Button-2>", self.after_motion(self.start_pan))  # Botão do meio do mouse
+        self.canvas.bind("<B2-Motion>", self.motion.bind(self.on_pan))
+        self.canvas.bind("<Configure>", lambda event: self.display_image_on_canvas())
+
+    def after_motion(self, handler):
+        """Envolve um manipulador para processar antes os movimentos pendentes"""
+        def wrapper(event):
+            self.motion.flush()
+            return handler(event)
+        return wrapper
+
+    def event_to_image(self, event) -> Tuple[int, int]:
+        """Converte a posição do evento (janela) em coordenadas da imagem original"""
+        x = self.canvas.canvasx(event.x) / self.scale_factor
+        y = self.canvas.canvasy(event.y) / self.scale_factor
+        return int(round(x)), int(round(y))
+
+    def to_canvas(self, points) -> List[List[float]]:
+        """Converte pontos da imagem em coordenadas do canvas com o zoom atual"""
+        return (np.asarray(points, dtype=np.float64).reshape(-1, 2) * self.scale_factor).tolist()
 
     def update_status(self, message: str):
         """Atualiza a barra de status"""
+        self.status_message = message
         mode_text = f"Modo: {self.mode.capitalize()}" if self.mode else "Modo: Nenhum"
         img_text = f"Imagem: {os.path.basename(self.filepath)}" if self.filepath else "Imagem: Nenhuma"
-        self.status_bar.config(text=f"{message} | {mode_text} | {img_text}")
+        visible, total = self.visible_counts
+        count_text = f" | Polígonos visíveis: {visible}/{total}" if total else ""
+        self.status_bar.config(text=f"{message} | {mode_text} | {img_text}{count_text}")
+        self.check_background_errors()
+
+    def check_background_errors(self):
+        """Avisa, uma vez por componente, quando uma gravação em segundo plano falha"""
+        checks = [
+            ("journal", self.journal,
+             "O diário de recuperação não pôde ser gravado: {error}\n"
+             "As anotações não estão protegidas contra falhas; salve com frequência."),
+            ("project", self.project,
+             "O índice do projeto não pôde ser atualizado: {error}\n"
+             "Os arquivos foram salvos; use `main.py index import` para reconstruí-lo."),
+            ("decode_cache", self.decode_cache,
+             "O cache de imagens decodificadas não pôde ser gravado: {error}\n"
+             "As imagens continuam abrindo normalmente, só sem o cache."),
+        ]
+        for name, component, message in checks:
+            error = getattr(component, "error", None)
+            if error and name not in self.warned_errors:
+                self.warned_errors.add(name)
+                # Fora do handler atual: o aviso é modal
+                self.root.after_idle(messagebox.showwarning, "Aviso", message.format(error=error))
+
+    def refresh_profile(self):
+        """Atualiza o resumo da instrumentação uma vez por segundo"""
+        profiler = self.profiler
+        profiler.gauge("canvas_items", len(self.scene))
+        profiler.gauge("polygons", len(self.session.polygons))
+        profiler.gauge("visible_polygons", self.visible_counts[0])
+        profiler.gauge("vertices", self.session.polygons.vertex_count)
+        summary = profiler.status_text(self.STATUS_PATHS)
+        self.profile_bar.config(text=f"Perf: redraws {profiler.count('redraw')} | "
+                                     f"itens {len(self.scene)} | {summary}")
+        self.root.after(1000, self.refresh_profile)
+
+    def profile_extra(self) -> Dict[str, Any]:
+        """Estatísticas de outros componentes incluídas no relatório de instrumentação"""
+        return {
+            "motion_events": self.motion.stats(),
+            "tile_cache": self.tile_cache.stats(),
+            "lod_cache": self.lod.stats(),
+            "prefetch": self.prefetcher.stats(),
+            "thumbnails": self.browser.thumbnails.stats(),
+            "decode_cache": self.decode_cache.stats(),
+            "saves": self.save_queue.stats(),
+            "history_bytes": self.session.history.bytes_used,
+        }
 
     def toggle_zoom(self):
         """Ativa/desativa o modo zoom"""
@@ -199,17 +374,18 @@ class ImageEditor:
         if ratio:
             try:
                 w, h = map(float, ratio.split(':'))
-                self.aspect_ratio = w / h
+                self.session.set_aspect_lock(True, w / h)
                 self.keep_aspect_ratio.set(True)
+                self.draw_crop_rectangle()
                 self.update_status(f"Proporção definida: {w}:{h}")
             except (ValueError, ZeroDivisionError):
                 messagebox.showerror("Erro", "Formato de proporção inválido. Use 'largura:altura'")
 
-    def update_aspect_ratio(self):
-        """Atualiza a proporção de aspecto quando a imagem é carregada"""
-        if self.original_image is not None:
-            self.height, self.width, _ = self.original_image.shape
-            self.aspect_ratio = self.width / self.height
+    def on_keep_aspect_ratio(self, *args):
+        """Repassa a opção "Manter Proporção" para a sessão (e o recorte selecionado)"""
+        self.session.set_aspect_lock(self.keep_aspect_ratio.get())
+        if self.mode == 'crop':
+            self.draw_crop_rectangle()
 
     def load_image(self, event=None):
         """Carrega uma imagem do sistema de arquivos"""
@@ -228,27 +404,141 @@ class ImageEditor:
                 self.update_status("Nenhuma imagem selecionada")
             return
 
+        self.folder_session = FolderSession.from_file(filepath) if self.folder_mode.get() else None
+        self.open_image(filepath)
+
+    def open_image(self, filepath: str):
+        """Abre uma imagem, usando a versão pré-carregada quando houver"""
+        # Libera a imagem anterior (e seus tiles) antes de decodificar a próxima
+        self.original_image = None
+        self.display_image = None
+        self.image_buffer = None
+        self.session.image = None
+        self.pyramid = None
+        self.wand = None
+        self.tile_images = {}
+        self.tile_cache.invalidate(self.image_key)
+        self.scene.clear_layer("image")
+        if self.journal is not None:
+            self.journal.detach(self.session)
+            self.journal.close(wait=False)
+            self.journal = None
+
+        buffer = self.prefetcher.take(filepath)
+        if buffer is None:
+            buffer = self.decode_cache.load(filepath)
+        if buffer is None:
+            messagebox.showerror("Erro", f"Não foi possível ler o arquivo: {filepath}")
+            return
+
         self.filepath = filepath
         self.last_save_dir = os.path.dirname(filepath)
         self.initial_load = False
-        self.original_image = cv2.imread(self.filepath)
-        
-        if self.original_image is None:
-            messagebox.showerror("Erro", f"Não foi possível ler o arquivo: {self.filepath}")
-            return
 
-        self.original_image = cv2.cvtColor(self.original_image, cv2.COLOR_BGR2RGB)
-        self.height, self.width, _ = self.original_image.shape
-        self.display_image = Image.fromarray(self.original_image)
+        # original_image e display_image compartilham o mesmo buffer
+        self.image_buffer = buffer
+        self.original_image, self.display_image = shared_views(buffer)
+        height, width, _ = self.original_image.shape
+        self.session.set_image(filepath, width, height, buffer)
+        if self.project is not None:
+            self.project.submit(self.project.register_images, [filepath], [(width, height)])
+        self.journal = Journal(filepath, width, height)
+        self.pending_journal = self.journal.read()
+        if not self.pending_journal:
+            self.journal.reset()  # Diário vazio ou de outra versão da imagem
+        # Níveis da pirâmide também vêm do cache, quando a imagem já foi aberta antes
+        levels = [shared_views(level)[1] for level in self.decode_cache.levels(filepath)]
+        self.pyramid = TilePyramid(self.display_image, levels=levels)
+        self.wand = MagicWand(buffer)
+        self.wand.warm()  # Nível reduzido pronto antes do primeiro clique
+        self.image_generation += 1
+        self.image_key = (self.filepath, self.image_generation)
         
         # Resetar estado de zoom e pan
         self.scale_factor = 1.0
         self.canvas.xview_moveto(0)
         self.canvas.yview_moveto(0)
         
-        self.update_aspect_ratio()
+        self.schedule_prefetch()
+        if self.browser.visible:
+            self.refresh_browser()
         self.show_mode_selection()
-        self.update_status(f"Carregado: {os.path.basename(self.filepath)}")
+        loaded = f"Carregado: {os.path.basename(self.filepath)}"
+        if self.folder_session is not None:
+            loaded += f" ({self.folder_session.position()})"
+        self.update_status(f"{loaded} | {self.memory_summary()}")
+
+    def schedule_prefetch(self):
+        """Pré-carrega em segundo plano as próximas imagens da sessão de pasta"""
+        if self.folder_session is None:
+            self.prefetcher.clear()
+        else:
+            self.prefetcher.schedule(self.folder_session.upcoming(self.prefetcher.depth))
+
+    def toggle_browser(self, event=None):
+        """Mostra/oculta o painel de miniaturas da pasta da imagem atual"""
+        if self.browser.visible:
+            self.browser.hide()
+            return
+        self.browser.pack()
+        self.refresh_browser()
+
+    def refresh_browser(self):
+        """Lista a pasta da imagem atual no painel (só relê a pasta quando ela muda)"""
+        directory = os.path.dirname(os.path.abspath(self.filepath)) if self.filepath else self.last_save_dir
+        current = os.path.abspath(self.filepath) if self.filepath else None
+        if directory == self.browser.directory:
+            self.browser.set_current(current)
+            return
+        annotated = set()
+        if self.project is not None:
+            try:
+                annotated = self.project.annotated_in(directory)
+            except sqlite3.Error as e:
+                self.update_status(f"Índice do projeto indisponível: {e}")
+        self.browser.set_folder(directory, list_images(directory), annotated, current)
+
+    def open_from_browser(self, filepath: str):
+        """Abre a imagem clicada no painel de miniaturas"""
+        if os.path.abspath(filepath) == os.path.abspath(self.filepath or ""):
+            return
+        self.folder_session = FolderSession.from_file(filepath) if self.folder_mode.get() else None
+        self.open_image(filepath)
+
+    def toggle_folder_mode(self):
+        """Liga/desliga a sessão de pasta a partir da imagem atual"""
+        if self.folder_mode.get() and self.filepath:
+            self.folder_session = FolderSession.from_file(self.filepath)
+            self.update_status(f"Sessão de pasta: {self.folder_session.position()}")
+        else:
+            self.folder_session = None
+            self.update_status("Sessão de pasta desativada")
+        self.schedule_prefetch()
+
+    def next_image(self, event=None, step: int = 1):
+        """Abre a imagem seguinte (ou anterior) da sessão de pasta"""
+        if self.folder_session is None:
+            self.load_image()
+            return
+        filepath = self.folder_session.move(step)
+        if filepath is None:
+            self.update_status("Fim da pasta" if step > 0 else "Início da pasta")
+            return
+        self.open_image(filepath)
+
+    def previous_image(self, event=None):
+        """Abre a imagem anterior da sessão de pasta"""
+        self.next_image(step=-1)
+
+    def memory_summary(self) -> str:
+        """Resumo de memória da imagem carregada e do pico do processo"""
+        text = f"Buffer: {self.image_buffer.nbytes / 2**20:.0f} MB"
+        if isinstance(self.image_buffer, np.memmap):
+            text += " (cache em disco)"
+        peak = peak_rss_bytes()
+        if peak is not None:
+            text += f" | Pico de memória: {peak / 2**20:.0f} MB"
+        return text
 
     def show_mode_selection(self):
         """Mostra a janela de seleção de modo de operação"""
@@ -293,9 +583,12 @@ class ImageEditor:
         """Define o modo de operação e fecha a janela de seleção"""
         self.mode = mode
         window.destroy()
-        self.reset_annotations()
+        self.restore_journal()
         self.mode_indicator.config(text=f"Modo Atual: {mode.capitalize()}")
-        self.update_status(f"Modo definido para: {mode}")
+        status = f"Modo definido para: {mode}"
+        if self.session.polygons or self.session.current_polygon or self.session.crops:
+            status += " | Anotações não salvas restauradas do diário"
+        self.update_status(status)
         
         # Mostrar/ocultar controles de proporção conforme o modo
         if mode == 'crop':
@@ -304,6 +597,12 @@ class ImageEditor:
         else:
             self.aspect_check.pack_forget()
 
+        # Varinha mágica só no modo polígono
+        if mode == 'polygon':
+            self.wand_check.pack(side=tk.LEFT, padx=5, pady=2)
+        else:
+            self.wand_check.pack_forget()
+
     def ask_for_aspect_ratio(self):
         """Pergunta se deve manter a proporção no modo de recorte"""
         if not self.keep_aspect_ratio.get():
@@ -317,88 +616,119 @@ class ImageEditor:
 
     def reset_annotations(self):
         """Reseta todas as anotações e redesenha a imagem"""
-        # Salvar estado atual no histórico
-        self.save_state_to_history()
-        
-        self.polygons = []
-        self.current_polygon = []
-        self.crop_rect = None
+        # A limpeza fica no histórico e pode ser desfeita
+        self.session.clear()
         self.temp_line = None
-        self.dragging_point = None
-        self.dragging_polygon = None
-        self.selected_polygon_index = None
-        self.next_polygon_id = 1
-        self.next_color_index = 0
         self.redraw()
         self.update_status("Anotações limpas")
 
-    def save_state_to_history(self):
-        """Salva o estado atual no histórico para desfazer"""
-        state = {
-            'polygons': [poly.copy() for poly in self.polygons],
-            'current_polygon': self.current_polygon.copy(),
-            'crop_rect': self.crop_rect,
-            'mode': self.mode,
-            'next_polygon_id': self.next_polygon_id,
-            'next_color_index': self.next_color_index,
-            'selected_polygon_index': self.selected_polygon_index
-        }
-        self.action_history.append(state)
+    def restore_journal(self):
+        """Limpa as anotações, reaplica o diário da imagem e passa a gravar as novas operações"""
+        if self.journal is None:
+            self.reset_annotations()
+            return
+        self.journal.detach(self.session)
+        self.reset_annotations()
+        records, self.pending_journal = self.pending_journal, []
+        if records:
+            replay(self.session, records)
+            self.redraw()
+        self.journal.attach(self.session)
+
+    def journal_discarder(self) -> Callable[[], None]:
+        """Função que apaga do diário atual as operações feitas até agora
+
+        Chamada só quando o salvamento termina com sucesso: até lá (ou se a
+        gravação falhar), as anotações continuam recuperáveis pelo diário.
+        """
+        journal = self.journal
+        if journal is None:
+            return lambda: None
+        checkpoint = journal.checkpoint()
+        return lambda: journal.discard(checkpoint)
 
     def undo_action(self, event=None):
         """Desfaz a última ação"""
-        if not self.action_history:
+        command = self.session.undo()
+        if command is None:
             self.update_status("Nada para desfazer")
             return
-            
-        # Restaura o estado anterior
-        previous_state = self.action_history.pop()
         
-        self.polygons = previous_state['polygons']
-        self.current_polygon = previous_state['current_polygon']
-        self.crop_rect = previous_state['crop_rect']
-        self.next_polygon_id = previous_state['next_polygon_id']
-        self.next_color_index = previous_state['next_color_index']
-        self.selected_polygon_index = previous_state['selected_polygon_index']
+        if self.mode == 'crop':
+            self.sync_aspect_lock()
+        self.redraw()
+        self.update_status(f"Ação desfeita: {command.label}")
+
+    def redo_action(self, event=None):
+        """Refaz a última ação desfeita"""
+        command = self.session.redo()
+        if command is None:
+            self.update_status("Nada para refazer")
+            return
         
+        if self.mode == 'crop':
+            self.sync_aspect_lock()
         self.redraw()
-        self.update_status("Ação desfeita")
+        self.update_status(f"Ação refeita: {command.label}")
 
     def cancel_operation(self, event=None):
         """Cancela a operação atual"""
-        # Salvar estado atual no histórico
-        self.save_state_to_history()
-        
-        if self.mode == 'polygon' and self.current_polygon:
-            self.current_polygon = []
+        if self.mode == 'polygon' and self.session.cancel_current():
             self.redraw()
             self.update_status("Polígono cancelado")
-        elif self.mode == 'crop' and self.crop_rect:
-            self.crop_rect = None
+        elif self.mode == 'crop' and self.session.crop_rect:
+            self.session.delete_crop()
             self.redraw()
             self.update_status("Recorte cancelado")
 
     def display_image_on_canvas(self):
-        """Exibe a imagem atual no canvas com suporte a zoom"""
-        if self.display_image is None:
+        """Exibe no canvas apenas os tiles visíveis da imagem, no zoom atual"""
+        if self.pyramid is None:
             return
-            
-        # Aplica zoom se necessário
-        if self.scale_factor != 1.0:
-            img = self.display_image.copy()
-            new_size = (int(img.width * self.scale_factor), int(img.height * self.scale_factor))
-            resized_img = img.resize(new_size, Image.LANCZOS)
-            self.tk_image = ImageTk.PhotoImage(resized_img)
-        else:
-            self.tk_image = ImageTk.PhotoImage(self.display_image)
-        
+
         # Configura a região de rolagem
-        self.canvas.config(scrollregion=(0, 0, self.tk_image.width(), self.tk_image.height()))
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_image)
+        canvas_w, canvas_h = self.pyramid.canvas_size(self.scale_factor)
+        self.canvas.config(scrollregion=(0, 0, canvas_w, canvas_h))
+
+        tiles = self.pyramid.visible_tiles(self.scale_factor, self.visible_region())
+        # Mantém referência aos tiles exibidos mesmo que saiam do cache
+        self.tile_images = {}
+        with self.scene.layer("image") as layer:
+            for tile in tiles:
+                key = (self.image_key, self.scale_factor, tile.level, tile.col, tile.row)
+                tk_tile = self.tile_cache.get(key)
+                if tk_tile is None:
+                    tile_image = self.pyramid.render_tile(tile, self.scale_factor)
+                    tk_tile = ImageTk.PhotoImage(tile_image)
+                    # O Tk guarda 4 bytes por pixel
+                    self.tile_cache.put(key, tk_tile, tile_image.width * tile_image.height * 4)
+                self.tile_images[key] = tk_tile
+                layer.item(("tile", tile.col, tile.row), "image", tile.box[:2],
+                           anchor=tk.NW, image=tk_tile)
+
+    def visible_region(self) -> Tuple[float, float, float, float]:
+        """Área do canvas atualmente visível (x0, y0, x1, y1)"""
+        width = max(self.canvas.winfo_width(), int(self.canvas.cget("width")))
+        height = max(self.canvas.winfo_height(), int(self.canvas.cget("height")))
+        x0 = self.canvas.canvasx(0)
+        y0 = self.canvas.canvasy(0)
+        return x0, y0, x0 + width, y0 + height
+
+    def on_xview(self, *args):
+        """Rola horizontalmente e exibe os tiles e polígonos que entraram na área visível"""
+        self.canvas.xview(*args)
+        self.display_image_on_canvas()
+        self.draw_polygons()
+
+    def on_yview(self, *args):
+        """Rola verticalmente e exibe os tiles e polígonos que entraram na área visível"""
+        self.canvas.yview(*args)
+        self.display_image_on_canvas()
+        self.draw_polygons()
 
     def redraw(self):
-        """Redesenha todos os elementos na interface"""
-        self.canvas.delete("all")
+        """Sincroniza todos os elementos da interface com o estado atual"""
+        self.scene.clear_layer("welcome")
         self.display_image_on_canvas()
         self.draw_polygons()
         self.draw_crop_rectangle()
@@ -406,117 +736,149 @@ class ImageEditor:
 
     def draw_temp_line(self):
         """Desenha uma linha temporária para o próximo ponto do polígono"""
-        if self.mode == 'polygon' and self.current_polygon and self.temp_line:
-            x1, y1 = self.current_polygon[-1]
-            x2, y2 = self.temp_line
-            self.canvas.create_line(x1, y1, x2, y2, fill="#FF0000", width=2, dash=(4, 2))
+        with self.scene.layer("temp") as layer:
+            current = self.session.current_polygon
+            if self.mode == 'polygon' and current and self.temp_line:
+                coords = self.to_canvas([current[-1], self.temp_line])
+                layer.item("temp_line", "line", coords, fill="#FF0000", width=2, dash=(4, 2))
 
     def draw_polygons(self):
-        """Desenha todos os polígonos armazenados com cores distintas"""
-        # Desenha polígonos completos
-        for idx, polygon_data in enumerate(self.polygons):
-            points = polygon_data['points']
-            label = polygon_data['label']
-            poly_id = polygon_data['id']
-            color = polygon_data['color']
-            
-            # Destaca o polígono selecionado
-            outline_width = 4 if idx == self.selected_polygon_index else 2
-            outline_color = "#FFFF00" if idx == self.selected_polygon_index else color
-            
-            # Desenha o polígono
-            self.canvas.create_polygon(
-                points, 
-                outline=outline_color, 
-                fill='', 
-                width=outline_width,
-                tags=f"polygon_{idx}"
+        """Desenha os polígonos visíveis com cores distintas
+
+        Só os polígonos cuja caixa delimitadora cruza a área visível (com uma
+        margem) viram itens do canvas; os demais são criados ao rolar a tela.
+        """
+        polygons = self.session.polygons
+        x0, y0, x1, y1 = self.visible_region()
+        margin = self.CULL_MARGIN
+        scale = self.scale_factor
+        visible = polygons.visible((x0 - margin) / scale, (y0 - margin) / scale,
+                                   (x1 + margin) / scale, (y1 + margin) / scale)
+        with self.scene.layer("polygons") as layer:
+            for idx in visible.tolist():
+                self.draw_polygon(layer, idx)
+
+        counts = (len(visible), len(polygons))
+        if counts != self.visible_counts:
+            self.visible_counts = counts
+            self.update_status(self.status_message)
+        self.draw_current_polygon()
+
+    def draw_polygon(self, layer, idx: int, center=None):
+        """Sincroniza contorno, pontos de controle e label de um polígono"""
+        polygon = self.session.polygons[idx]
+        exact = polygon.points
+        # Contorno simplificado para o zoom atual; a geometria armazenada não muda
+        points = self.to_canvas(self.lod.outline(exact, polygon.revision, self.scale_factor))
+        label = polygon.label
+        poly_id = polygon.id
+        color = polygon.color
+
+        # Destaca o polígono selecionado
+        selected = idx == self.session.selected_polygon_index
+        outline_width = 4 if selected else 2
+        outline_color = "#FFFF00" if selected else color
+
+        # Desenha o polígono
+        layer.item(
+            ("polygon", idx), "polygon", points,
+            outline=outline_color,
+            fill='',
+            width=outline_width,
+            tags="polygon"
+        )
+
+        # Desenha os pontos de controle que estão afastados o bastante para serem clicados
+        closing = len(self.session.current_polygon) > 2
+        handles = self.lod.handles(exact, polygon.revision, self.scale_factor)
+        for p_idx, (x, y) in zip(handles.tolist(), self.to_canvas(exact[handles])):
+            fill_color = "red" if p_idx == 0 and closing else color
+            layer.item(
+                ("vertex", idx, p_idx), "oval", (x-5, y-5, x+5, y+5),
+                fill=fill_color,
+                outline="white",
+                tags="control_point"
             )
-            
-            # Desenha os pontos de controle
-            for p_idx, (x, y) in enumerate(points):
-                fill_color = "red" if p_idx == 0 and self.current_polygon and len(self.current_polygon) > 2 else color
-                point = self.canvas.create_oval(
-                    x-5, y-5, x+5, y+5,
-                    fill=fill_color,
-                    outline="white",
-                    tags=f"poly_{idx}_point_{p_idx}"
-                )
-                # Armazena dados do ponto para manipulação
-                self.canvas.itemconfig(point, tags=(f"poly_{idx}_point_{p_idx}", "control_point"))
-            
-            # Desenha o label no centro do polígono
-            if points:
-                center_x = sum(p[0] for p in points) / len(points)
-                center_y = sum(p[1] for p in points) / len(points)
-                self.canvas.create_text(
-                    center_x, center_y, 
-                    text=f"{label} ({poly_id})", 
-                    fill="white",
-                    font=("Arial", 10, "bold"),
-                    tags="polygon_label"
-                )
-        
-        # Desenha polígono atual em construção
-        if self.current_polygon:
+
+        # Desenha o label no centro do polígono
+        if points:
+            center_x, center_y = center if center is not None else self.to_canvas([polygon.centroid])[0]
+            layer.item(
+                ("label", idx), "text", (center_x, center_y),
+                text=f"{label} ({poly_id})",
+                fill="white",
+                font=("Arial", 10, "bold"),
+                tags="polygon_label"
+            )
+
+    def draw_current_polygon(self):
+        """Desenha o polígono atual em construção"""
+        points = self.to_canvas(self.session.current_polygon)
+        with self.scene.layer("current") as layer:
             # Desenha linhas entre pontos
-            if len(self.current_polygon) > 1:
-                for i in range(1, len(self.current_polygon)):
-                    self.canvas.create_line(
-                        self.current_polygon[i-1][0], self.current_polygon[i-1][1],
-                        self.current_polygon[i][0], self.current_polygon[i][1],
-                        fill="#FF0000",
-                        width=2,
-                        tags="current_polygon"
-                    )
-            
+            for i in range(1, len(points)):
+                layer.item(
+                    ("segment", i), "line",
+                    (points[i-1], points[i]),
+                    fill="#FF0000",
+                    width=2,
+                    tags="current_polygon"
+                )
+
             # Desenha pontos de controle
-            for p_idx, (x, y) in enumerate(self.current_polygon):
-                fill_color = "red" if p_idx == 0 and len(self.current_polygon) > 2 else "#FF0000"
-                self.canvas.create_oval(
-                    x-5, y-5, x+5, y+5,
+            for p_idx, (x, y) in enumerate(points):
+                fill_color = "red" if p_idx == 0 and len(points) > 2 else "#FF0000"
+                layer.item(
+                    ("point", p_idx), "oval", (x-5, y-5, x+5, y+5),
                     fill=fill_color,
                     outline="white",
                     tags=f"current_point_{p_idx}"
                 )
-                
-                # Conectar ao primeiro ponto se estiver próximo
-                if p_idx == 0 and len(self.current_polygon) > 2:
-                    # Desenha linha de conexão ao primeiro ponto
-                    self.canvas.create_line(
-                        self.current_polygon[-1][0], self.current_polygon[-1][1],
-                        x, y,
-                        fill="#FF0000",
-                        width=2,
-                        dash=(4, 2),
-                        tags="closing_line"
-                    )
+
+            # Desenha linha de conexão ao primeiro ponto
+            if len(points) > 2:
+                layer.item(
+                    "closing_line", "line", (points[-1], points[0]),
+                    fill="#FF0000",
+                    width=2,
+                    dash=(4, 2),
+                    tags="closing_line"
+                )
 
     def draw_crop_rectangle(self):
-        """Desenha o retângulo de recorte se existir"""
-        if self.mode == 'crop' and self.crop_rect:
-            x1, y1, x2, y2 = self.crop_rect
-            self.canvas.create_rectangle(
-                x1, y1, x2, y2, 
-                outline="#00FF00", 
-                width=3,
-                dash=(4, 2) if self.rect_moving else None,
-                tags="crop_rect"
-            )
-            
-            # Desenha alças de redimensionamento
-            handles = [
-                (x1, y1), (x2, y1), (x2, y2), (x1, y2),          # Cantos
-                ((x1+x2)//2, y1), ((x1+x2)//2, y2),               # Topo e fundo
-                (x1, (y1+y2)//2), (x2, (y1+y2)//2)                # Laterais
-            ]
-            
-            for hx, hy in handles:
-                self.canvas.create_rectangle(
-                    hx-5, hy-5, hx+5, hy+5,
+        """Desenha os retângulos de recorte, com alças no selecionado"""
+        with self.scene.layer("crop") as layer:
+            session = self.session
+            if self.mode != 'crop' or not session.crops:
+                return
+            for idx, crop in enumerate(session.crops):
+                rect = crop['rect']
+                selected = idx == session.selected_crop_index
+                (x1, y1), (x2, y2) = self.to_canvas([rect[:2], rect[2:]])
+                layer.item(
+                    ("crop_rect", idx), "rectangle", (x1, y1, x2, y2),
+                    outline="#00FF00" if selected else "#FFD700",
+                    width=3 if selected else 2,
+                    dash=(4, 2) if selected and session.rect_moving else "",
+                    tags="crop_rect"
+                )
+                layer.item(
+                    ("crop_label", idx), "text", (x1 + 4, y1 + 4),
+                    text=crop['name'] + (" [proporção fixa]" if crop['keep_aspect_ratio'] else ""),
+                    anchor=tk.NW,
+                    fill="#00FF00" if selected else "#FFD700",
+                    font=("Arial", 10, "bold"),
+                    tags="crop_label"
+                )
+
+            # Desenha alças de redimensionamento (o nome da alça vai na segunda tag)
+            handles = session.crop_handles()
+            for name, (hx, hy) in zip(handles, self.to_canvas(list(handles.values()))):
+                layer.item(
+                    ("handle", name), "rectangle", (hx-5, hy-5, hx+5, hy+5),
                     fill="#00FF00",
                     outline="white",
-                    tags="resize_handle"
+                    tags=("resize_handle", name)
                 )
 
     def on_left_click(self, event):
@@ -534,13 +896,17 @@ class ImageEditor:
             # Verificar se clicou em um ponto para mover
             if self.handle_point_drag_start(event):
                 return
+
+            # Varinha mágica: o clique cria o contorno da região
+            if self.wand_mode.get():
+                self.handle_wand_click(event)
+                return
                 
             # Selecionar polígono existente
             if self.select_polygon(event):
                 return
                 
             # Adicionar novo ponto
-            self.save_state_to_history()
             self.handle_polygon_click(event)
             
         elif self.mode == 'crop':
@@ -548,328 +914,183 @@ class ImageEditor:
 
     def select_polygon(self, event):
         """Seleciona um polígono existente ao clicar nele"""
-        # Verificar se clicou em um polígono existente
-        items = self.canvas.find_overlapping(event.x-5, event.y-5, event.x+5, event.y+5)
-        for item in items:
-            tags = self.canvas.gettags(item)
-            # Verificação segura para tags vazias
-            if tags:  # Verifica se há tags
-                # Verificar se alguma tag começa com "polygon_"
-                for tag in tags:
-                    if tag.startswith("polygon_"):
-                        try:
-                            idx = int(tag.split("_")[1])
-                            self.selected_polygon_index = idx
-                            self.redraw()
-                            self.update_status(f"Polígono {idx} selecionado")
-                            return True
-                        except (IndexError, ValueError):
-                            continue
-        return False
+        x, y = self.event_to_image(event)
+        idx = self.session.select_at(x, y, self.HIT_RADIUS / self.scale_factor)
+        if idx is None:
+            return False
+        self.redraw()
+        self.update_status(f"Polígono {idx} selecionado")
+        return True
 
     def check_close_to_first_point(self, event):
         """Verifica se o clique está próximo do primeiro ponto para finalizar o polígono"""
-        if len(self.current_polygon) > 2:
-            first_x, first_y = self.current_polygon[0]
-            distance = ((event.x - first_x) ** 2 + (event.y - first_y) ** 2) ** 0.5
-            if distance < 10:  # 10 pixels de tolerância
-                return True
-        return False
+        x, y = self.event_to_image(event)
+        return self.session.is_near_first_point(x, y, 10 / self.scale_factor)  # 10 pixels na tela
 
     def handle_point_drag_start(self, event):
         """Inicia o arraste de um ponto existente"""
-        # Verificar se clicou em um ponto de controle de polígono existente
-        items = self.canvas.find_overlapping(event.x-5, event.y-5, event.x+5, event.y+5)
-        for item in items:
-            tags = self.canvas.gettags(item)
-            if "control_point" in tags:
-                # Encontrar qual ponto de qual polígono
-                for tag in tags:
-                    if tag.startswith("poly_"):
-                        parts = tag.split("_")
-                        poly_idx = int(parts[1])
-                        point_idx = int(parts[3])
-                        
-                        # Se for um polígono já finalizado
-                        if parts[0] == "poly" and poly_idx < len(self.polygons):
-                            self.dragging_polygon = poly_idx
-                            self.dragging_point = point_idx
-                            self.drag_offset = (event.x - self.polygons[poly_idx]['points'][point_idx][0], 
-                                              event.y - self.polygons[poly_idx]['points'][point_idx][1])
-                            return True
-                        # Se for o polígono atual em construção
-                        elif tag.startswith("current_point"):
-                            point_idx = int(tag.split("_")[-1])
-                            self.dragging_point = point_idx
-                            self.drag_offset = (event.x - self.current_polygon[point_idx][0], 
-                                              event.y - self.current_polygon[point_idx][1])
-                            return True
-        return False
+        x, y = self.event_to_image(event)
+        return self.session.begin_vertex_drag(x, y, self.HIT_RADIUS / self.scale_factor)
 
     def handle_polygon_click(self, event):
         """Adiciona ponto ao polígono atual"""
-        self.current_polygon.append((event.x, event.y))
+        x, y = self.event_to_image(event)
+        self.session.add_vertex(x, y)
         self.redraw()
-        self.update_status(f"Ponto adicionado: ({event.x}, {event.y})")
+        self.update_status(f"Ponto adicionado: ({x}, {y})")
+
+    def handle_wand_click(self, event):
+        """Substitui o polígono em construção pelo contorno da região clicada"""
+        if self.wand is None:
+            return
+        x, y = self.event_to_image(event)
+        start = time.perf_counter()
+        points = self.wand.select(x, y)
+        elapsed = (time.perf_counter() - start) * 1000
+        if points is None:
+            self.update_status("Varinha mágica: nenhuma região encontrada")
+            return
+        self.session.set_current(points)
+        self.redraw()
+        self.update_status(f"Varinha mágica: {len(points)} pontos em {elapsed:.0f} ms (Enter para finalizar)")
 
     def handle_crop_click(self, event):
         """Inicia a criação ou seleção do retângulo de recorte"""
-        # Salvar estado antes da modificação
-        self.save_state_to_history()
-        
-        # Verifica se clicou em uma alça de redimensionamento
-        handles = self.canvas.find_withtag("resize_handle")
-        for handle in handles:
-            x1, y1, x2, y2 = self.canvas.coords(handle)
-            if x1 <= event.x <= x2 and y1 <= event.y <= y2:
-                self.selected_handle = handle
-                self.crop_start_point = (event.x, event.y)
-                self.original_crop_rect = self.crop_rect
-                return
-        
-        # Se não clicou em uma alça, inicia novo recorte
-        if not self.crop_rect:
-            self.crop_start_point = (event.x, event.y)
-        else:
-            # Verifica se clicou dentro do retângulo existente
-            x1, y1, x2, y2 = self.crop_rect
-            if x1 <= event.x <= x2 and y1 <= event.y <= y2:
-                self.rect_moving = True
-                self.rect_move_offset = (event.x - x1, event.y - y1)
+        x, y = self.event_to_image(event)
+        # Alças têm 10 pixels de tela
+        self.session.begin_crop(x, y, 5 / self.scale_factor)
+        self.sync_aspect_lock()
+        self.draw_crop_rectangle()
+
+    def sync_aspect_lock(self):
+        """Mostra em "Manter Proporção" a trava do recorte selecionado"""
+        keep, _ = self.session.crop_aspect()
+        if keep != self.keep_aspect_ratio.get():
+            self.keep_aspect_ratio.set(keep)
+
+    def rename_crop(self, event=None):
+        """Renomeia o recorte sob o cursor (duplo clique) ou o selecionado (F2)"""
+        if self.mode != 'crop':
+            return
+        session = self.session
+        if event is not None and event.widget is self.canvas:
+            index = session.crop_at(*self.event_to_image(event))
+            if index is not None:
+                session.selected_crop_index = index
+        index = session.selected_crop_index
+        if index is None:
+            self.update_status("Nenhum recorte selecionado")
+            return
+        name = simpledialog.askstring("Renomear Recorte", "Nome do recorte:",
+                                      initialvalue=session.crops[index]['name'], parent=self.root)
+        if name and name.strip():
+            session.rename_crop(index, name.strip())
+            self.draw_crop_rectangle()
+            self.update_status(f"Recorte renomeado: {name.strip()}")
 
     def on_mouse_drag(self, event):
         """Manipula arrastar do mouse"""
         if self.zoom_state and self.mode != 'polygon':
             return
-            
-        # Arrastar ponto de polígono
-        if self.dragging_point is not None:
-            if self.dragging_polygon is not None:
-                # Arrastando ponto de polígono existente
-                poly = self.polygons[self.dragging_polygon]
-                new_x = event.x - self.drag_offset[0]
-                new_y = event.y - self.drag_offset[1]
-                poly['points'][self.dragging_point] = (new_x, new_y)
-                self.redraw()
-            elif self.dragging_point is not None and self.current_polygon:
-                # Arrastando ponto do polígono atual
-                new_x = event.x - self.drag_offset[0]
-                new_y = event.y - self.drag_offset[1]
-                self.current_polygon[self.dragging_point] = (new_x, new_y)
-                self.redraw()
-            return
-            
-        if self.mode == 'crop' and self.crop_start_point:
-            if hasattr(self, 'selected_handle'):
-                self.resize_crop_rectangle(event)
-            else:
-                self.update_crop_rectangle(event)
-        elif self.mode == 'polygon' and self.current_polygon:
-            self.temp_line = (event.x, event.y)
-            self.redraw()
 
-    def resize_crop_rectangle(self, event):
-        """Redimensiona o retângulo de recorte usando as alças"""
-        x1, y1, x2, y2 = self.original_crop_rect
-        handle_idx = self.canvas.gettags(self.selected_handle)[1]  # Obtém o índice da alça
-        
-        # Mapeia as alças para suas posições no retângulo
-        handles = {
-            'nw': (0, 0), 'ne': (1, 0), 'se': (1, 1), 'sw': (0, 1),
-            'n': (0.5, 0), 's': (0.5, 1), 'e': (1, 0.5), 'w': (0, 0.5)
-        }
-        
-        hx, hy = handles.get(handle_idx, (0, 0))
-        new_x = event.x
-        new_y = event.y
-        
-        if self.keep_aspect_ratio.get():
-            dx = event.x - self.crop_start_point[0]
-            dy = event.y - self.crop_start_point[1]
-            
-            # Mantém a proporção
-            if abs(dx) > abs(dy):
-                dy = dx / self.aspect_ratio
-            else:
-                dx = dy * self.aspect_ratio
-                
-            new_x = self.crop_start_point[0] + dx
-            new_y = self.crop_start_point[1] + dy
-        
-        # Atualiza as coordenadas baseadas na alça selecionada
-        if hx == 0:   # Lado esquerdo
-            x1 = min(new_x, x2)
-        elif hx == 1: # Lado direito
-            x2 = max(new_x, x1)
-        elif hx == 0.5: # Centro horizontal
-            pass
-        
-        if hy == 0:   # Topo
-            y1 = min(new_y, y2)
-        elif hy == 1: # Fundo
-            y2 = max(new_y, y1)
-        elif hy == 0.5: # Centro vertical
-            pass
-            
-        self.crop_rect = (x1, y1, x2, y2)
-        self.redraw()
-
-    def update_crop_rectangle(self, event):
-        """Atualiza o retângulo de recorte durante o arraste"""
-        x1, y1 = self.crop_start_point
-        x2, y2 = event.x, event.y
+        x, y = self.event_to_image(event)
+        session = self.session
 
-        if self.keep_aspect_ratio.get():
-            dx = x2 - x1
-            dy = y2 - y1
-            
-            # Mantém a proporção
-            if abs(dx) > abs(dy):
-                y2 = y1 + dx / self.aspect_ratio
+        # Arrastar ponto de polígono
+        if session.dragging_point is not None:
+            session.drag_vertex(x, y)
+            if session.dragging_polygon is not None:
+                # Só os itens do polígono arrastado são atualizados
+                with self.scene.layer("polygons", prune=False) as layer:
+                    self.draw_polygon(layer, session.dragging_polygon)
             else:
-                x2 = x1 + dy * self.aspect_ratio
+                self.draw_current_polygon()
+                self.draw_temp_line()
+            return
 
-        self.crop_rect = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
-        self.redraw()
+        if self.mode == 'crop':
+            if session.drag_crop(x, y):
+                self.draw_crop_rectangle()
+        elif self.mode == 'polygon' and session.current_polygon:
+            self.temp_line = (x, y)
+            self.draw_temp_line()
 
     def on_mouse_release(self, event):
         """Finaliza a interação ao soltar o botão do mouse"""
-        if self.mode == 'crop' and self.crop_rect:
-            self.finalize_crop_rectangle()
-            if hasattr(self, 'selected_handle'):
-                del self.selected_handle
-                
+        if self.mode == 'crop' and self.session.end_crop():
+            crop = self.session.crops[self.session.selected_crop_index]
+            self.update_status(f"Recorte '{crop['name']}' definido: {crop['rect']} "
+                               f"({len(self.session.crops)} recorte(s))")
+
         # Finalizar arraste de ponto
-        if self.dragging_point is not None:
-            self.dragging_point = None
-            self.dragging_polygon = None
-            self.save_state_to_history()
+        if self.session.dragging_point is not None:
+            self.session.end_vertex_drag()
             self.update_status("Ponto movido")
-            
+
         self.temp_line = None
         self.redraw()
 
-    def finalize_crop_rectangle(self):
-        """Ajusta coordenadas finais do recorte"""
-        x1, y1, x2, y2 = self.crop_rect
-        self.crop_rect = (
-            max(0, min(x1, x2)),
-            max(0, min(y1, y2)),
-            min(self.width, max(x1, x2)),
-            min(self.height, max(y1, y2))
-        )
-        self.update_status(f"Área de recorte definida: {self.crop_rect}")
-
     def on_right_click(self, event):
         """Inicia movimento do retângulo de recorte"""
-        if self.mode == 'crop' and self.crop_rect:
-            # Salvar estado antes da modificação
-            self.save_state_to_history()
-            
-            x1, y1, x2, y2 = self.crop_rect
-            if x1 <= event.x <= x2 and y1 <= event.y <= y2:
-                self.rect_moving = True
-                self.rect_move_offset = (event.x - x1, event.y - y1)
+        if self.mode == 'crop':
+            self.session.begin_move_crop(*self.event_to_image(event))
+            self.sync_aspect_lock()
 
     def on_right_drag(self, event):
         """Move o retângulo de recorte durante o arraste"""
-        if self.mode == 'crop' and self.rect_moving:
-            self.move_crop_rectangle(event)
-
-    def move_crop_rectangle(self, event):
-        """Calcula nova posição do retângulo de recorte"""
-        offset_x, offset_y = self.rect_move_offset
-        rect_width = self.crop_rect[2] - self.crop_rect[0]
-        rect_height = self.crop_rect[3] - self.crop_rect[1]
-        
-        x1 = max(0, min(event.x - offset_x, self.width - rect_width))
-        y1 = max(0, min(event.y - offset_y, self.height - rect_height))
-        x2 = x1 + rect_width
-        y2 = y1 + rect_height
-
-        self.crop_rect = (x1, y1, x2, y2)
-        self.redraw()
+        if self.mode == 'crop' and self.session.rect_moving:
+            self.session.move_crop(*self.event_to_image(event))
+            self.draw_crop_rectangle()
 
     def on_right_release(self, event):
         """Finaliza o movimento do retângulo de recorte"""
-        self.rect_moving = False
+        self.session.end_move_crop()
 
     def on_mouse_wheel(self, event):
         """Manipula o zoom com a roda do mouse"""
-        if not self.zoom_state or self.mode == 'polygon':
+        if not self.zoom_state or self.mode == 'polygon' or self.pyramid is None:
             return
             
+        # Ponto da imagem sob o cursor antes do zoom
+        img_x = self.canvas.canvasx(event.x) / self.scale_factor
+        img_y = self.canvas.canvasy(event.y) / self.scale_factor
+
         scale_factor = 1.1 if event.delta > 0 else 0.9
         self.scale_factor *= scale_factor
         
         # Limita o zoom entre 10% e 1000%
         self.scale_factor = max(0.1, min(self.scale_factor, 10.0))
         
-        # Atualiza a posição de visualização
-        x = self.canvas.canvasx(event.x)
-        y = self.canvas.canvasy(event.y)
+        # Atualiza a posição de visualização para manter o ponto sob o cursor
+        canvas_w, canvas_h = self.pyramid.canvas_size(self.scale_factor)
+        self.canvas.config(scrollregion=(0, 0, canvas_w, canvas_h))
+        self.canvas.xview_moveto((img_x * self.scale_factor - event.x) / canvas_w)
+        self.canvas.yview_moveto((img_y * self.scale_factor - event.y) / canvas_h)
         
         self.redraw()
-        self.canvas.scale("all", x, y, scale_factor, scale_factor)
-        self.update_status(f"Zoom: {self.scale_factor*100:.1f}%")
+        cache = self.tile_cache.stats()
+        self.update_status(f"Zoom: {self.scale_factor*100:.1f}% | Cache: {cache['hit_rate']*100:.0f}% acertos, "
+                           f"{cache['bytes'] / 2**20:.0f} MB")
 
     def on_mouse_move(self, event):
         """Atualiza a linha temporária e mostra coordenadas"""
-        self.update_status(f"Posição: ({event.x}, {event.y})")
+        x, y = self.event_to_image(event)
+        self.update_status(f"Posição: ({x}, {y})")
         
-        if self.mode == 'polygon' and self.current_polygon:
-            self.temp_line = (event.x, event.y)
-            self.redraw()
+        if self.mode == 'polygon' and self.session.current_polygon:
+            # Apenas a linha temporária muda com o cursor
+            self.temp_line = (x, y)
+            self.draw_temp_line()
         
         if self.zoom_state and self.mode != 'polygon':
             self.show_zoom_preview(event)
 
     def show_zoom_preview(self, event):
         """Mostra uma prévia ampliada sob o cursor"""
-        if self.display_image is None or not self.zoom_state or self.mode == 'polygon':
-            return
-            
-        # Calcula a região de zoom
-        zoom_size = 100
-        zoom_factor = 2.0
-        
-        # Obtém as coordenadas reais da imagem
-        img_x = int(event.x / self.scale_factor)
-        img_y = int(event.y / self.scale_factor)
-        
-        # Garante coordenadas válidas
-        x1 = max(0, min(img_x, self.width - 1))
-        y1 = max(0, min(img_y, self.height - 1))
-        
-        # Define a área para ampliar (garantindo ordem correta)
-        left = max(0, x1 - zoom_size//2)
-        top = max(0, y1 - zoom_size//2)
-        right = min(self.width, left + zoom_size)
-        bottom = min(self.height, top + zoom_size)
-        
-        # Verifica se a região é válida
-        if right <= left or bottom <= top:
+        if self.image_buffer is None or not self.zoom_state or self.mode == 'polygon':
             return
-            
-        # Recorta e amplia a região
-        zoom_region = self.display_image.crop((left, top, right, bottom))
-        
-        # Corrigido: cálculo correto do novo tamanho
-        new_width = int(zoom_region.width * zoom_factor)
-        new_height = int(zoom_region.height * zoom_factor)
-        zoom_region = zoom_region.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Atualiza o overlay
-        self.overlay.delete("all")
-        zoom_tk = ImageTk.PhotoImage(zoom_region)
-        self.overlay.image = zoom_tk  # Mantém referência
-        self.overlay.create_image(0, 0, anchor=tk.NW, image=zoom_tk)
-        
-        # Desenha cruz indicadora
-        cross_x = zoom_region.width // 2
-        cross_y = zoom_region.height // 2
-        self.overlay.create_line(cross_x, 0, cross_x, zoom_region.height, fill="red", width=1)
-        self.overlay.create_line(0, cross_y, zoom_region.width, cross_y, fill="red", width=1)
+        img_x, img_y = self.event_to_image(event)
+        self.magnifier.update(self.image_buffer, img_x, img_y)
 
     def start_pan(self, event):
         """Inicia o pan da imagem"""
@@ -884,6 +1105,8 @@ class ImageEditor:
             self.canvas.xview_scroll(-dx, "units")
             self.canvas.yview_scroll(-dy, "units")
             self.pan_start = (event.x, event.y)
+            self.display_image_on_canvas()
+            self.draw_polygons()
 
     def ask_polygon_info(self):
         """Pergunta o label e ID para um novo polígono"""
@@ -901,13 +1124,13 @@ class ImageEditor:
         tk.Label(dialog, text="Label do polígono:").pack(pady=(10, 0))
         label_entry = ttk.Entry(dialog)
         label_entry.pack(pady=5, padx=20, fill=tk.X)
-        label_entry.insert(0, f"Objeto {self.next_polygon_id}")
+        label_entry.insert(0, f"Objeto {self.session.next_polygon_id}")
         label_entry.focus_set()
         
         tk.Label(dialog, text="ID do polígono:").pack()
         id_entry = ttk.Entry(dialog)
         id_entry.pack(pady=5, padx=20, fill=tk.X)
-        id_entry.insert(0, str(self.next_polygon_id))
+        id_entry.insert(0, str(self.session.next_polygon_id))
         
         # Variável para armazenar o resultado
         self.polygon_info_result = {"label": "", "id": ""}
@@ -953,27 +1176,15 @@ class ImageEditor:
 
     def finalize_polygon(self, event=None):
         """Finaliza o polígono atual e pergunta pelo label e ID"""
-        if self.mode == 'polygon' and len(self.current_polygon) >= 3:
+        if self.mode == 'polygon' and len(self.session.current_polygon) >= 3:
             # Perguntar pelo label e ID
             info = self.ask_polygon_info()
             if not info["label"] or not info["id"]:
                 self.update_status("Criação de polígono cancelada")
                 return
-                
-            # Salvar estado antes da modificação
-            self.save_state_to_history()
-            
-            # Adiciona o polígono com informações
-            self.polygons.append({
-                'points': self.current_polygon.copy(),
-                'label': info["label"],
-                'id': info["id"],
-                'color': self.generate_distinct_color()
-            })
-            
-            self.current_polygon = []
-            self.next_polygon_id = info["id"] + 1
-            self.selected_polygon_index = len(self.polygons) - 1  # Seleciona o novo polígono
+
+            # Adiciona o polígono com informações (e o seleciona)
+            self.session.finalize_polygon(info["label"], info["id"])
             self.redraw()
             self.update_status(f"Polígono '{info['label']}' (ID: {info['id']}) finalizado")
         elif self.mode == 'polygon':
@@ -981,107 +1192,129 @@ class ImageEditor:
 
     def delete_selected(self, event=None):
         """Deleta o polígono selecionado ou o recorte atual"""
-        # Salvar estado antes da modificação
-        self.save_state_to_history()
-        
+        session = self.session
         if self.mode == 'polygon':
-            if self.selected_polygon_index is not None and self.selected_polygon_index < len(self.polygons):
-                deleted = self.polygons.pop(self.selected_polygon_index)
-                self.selected_polygon_index = None
-                self.redraw()
-                self.update_status(f"Polígono '{deleted['label']}' deletado")
-            elif self.current_polygon:
-                # Cancela o polígono em construção
-                self.current_polygon = []
-                self.redraw()
+            selected = session.selected_polygon_index
+            if selected is not None and selected < len(session.polygons):
+                polygon = session.delete_polygon(selected)
+                self.update_status(f"Polígono '{polygon['label']}' deletado")
+            elif session.cancel_current():
                 self.update_status("Polígono em construção cancelado")
-            elif self.polygons:
+            elif session.polygons:
                 # Remove o último polígono se nenhum estiver selecionado
-                deleted = self.polygons.pop()
-                self.redraw()
-                self.update_status(f"Polígono '{deleted['label']}' deletado")
+                polygon = session.delete_polygon(len(session.polygons) - 1)
+                self.update_status(f"Polígono '{polygon['label']}' deletado")
             else:
                 self.update_status("Nenhum polígono para deletar")
-        elif self.mode == 'crop' and self.crop_rect:
-            self.crop_rect = None
+                return
+            self.redraw()
+        elif self.mode == 'crop' and session.crop_rect:
+            crop = session.delete_crop()
             self.redraw()
-            self.update_status("Recorte deletado")
+            self.update_status(f"Recorte '{crop['name']}' deletado")
 
     def save_crop(self):
-        """Salva a área recortada e seus metadados"""
-        if not self.crop_rect:
+        """Exporta todos os recortes para uma pasta, em paralelo, com um JSON de metadados"""
+        session = self.session
+        if not session.crops:
             messagebox.showwarning("Aviso", "Nenhuma área de recorte definida")
             return
 
-        x1, y1, x2, y2 = self.crop_rect
-        cropped_image = self.display_image.crop((x1, y1, x2, y2))
-        
-        save_path = filedialog.asksaveasfilename(
-            initialdir=self.last_save_dir,
-            defaultextension=".png",
-            filetypes=[
-                ("PNG files", "*.png"),
-                ("JPEG files", "*.jpg;*.jpeg"),
-                ("Todos os arquivos", "*.*")
-            ]
-        )
-        
-        if not save_path:
+        directory = filedialog.askdirectory(initialdir=self.last_save_dir, title="Pasta dos recortes")
+        if not directory:
             return
 
         # Atualiza o último diretório usado
-        self.last_save_dir = os.path.dirname(save_path)
-        
-        # Salva a imagem no formato apropriado
-        if save_path.lower().endswith(('.jpg', '.jpeg')):
-            cropped_image.save(save_path, "JPEG", quality=95)
-        else:
-            cropped_image.save(save_path)
-            
-        self.save_crop_metadata(save_path, x1, y1, x2, y2)
-        messagebox.showinfo("Sucesso", f"Imagem salva: {save_path}")
+        self.last_save_dir = directory
+
+        # Mesmo formato da imagem de origem (JPEG continua JPEG; o resto vira PNG)
+        source_ext = os.path.splitext(self.filepath or "")[1].lower()
+        extension = ".jpg" if source_ext in (".jpg", ".jpeg") else ".png"
+        names = session.crop_file_names(extension)
+        context = session.export_context(polygons=False, crop_files=names)
+        stem = os.path.splitext(os.path.basename(self.filepath or "imagem"))[0]
+
+        # Codificação e gravação em segundo plano; o próximo recorte pode começar já
+        futures = []
+        for crop, name in zip(session.crops, names):
+            x1, y1, x2, y2 = map(int, crop['rect'])
+            # Visão do buffer RGBX, sem cópia: o buffer nunca é alterado, só substituído
+            path = os.path.join(directory, name)
+            futures.append(self.save_queue.submit(path, write_crop, self.image_buffer[y1:y2, x1:x2], path))
+        base = os.path.join(directory, f"{stem}_crops")
+        futures += submit_exports(self.save_queue.submit, context, base, self.selected_formats())
+        # O diário só é apagado (e o índice e o painel atualizados) quando todos os recortes estiverem gravados
+        on_saved = [self.journal_discarder(), self.browser_marker()]
+        if self.project is not None:
+            on_saved.append(self.project_recorder(self.project.record_crops, base + ".json",
+                                                  crop_rows(session.crops)))
         self.reset_annotations()
-
-    def save_crop_metadata(self, path: str, x1: int, y1: int, x2: int, y2: int):
-        """Salva metadados do recorte com coordenadas normalizadas"""
-        json_path = os.path.splitext(path)[0] + ".json"
-        
-        # Calcula coordenadas relativas (0-1)
-        x1_rel = x1 / self.width
-        y1_rel = y1 / self.height
-        x2_rel = x2 / self.width
-        y2_rel = y2 / self.height
-        
-        # Calcula coordenadas do centro e tamanho (formato YOLO)
-        center_x = (x1_rel + x2_rel) / 2
-        center_y = (y1_rel + y2_rel) / 2
-        width = x2_rel - x1_rel
-        height = y2_rel - y1_rel
-        
-        metadata = {
-            "original_size": {"width": self.width, "height": self.height},
-            "crop_coordinates_relative": {
-                "x1": x1_rel, "y1": y1_rel,
-                "x2": x2_rel, "y2": y2_rel
-            },
-            "crop_coordinates_absolute": {
-                "x1": x1, "y1": y1,
-                "x2": x2, "y2": y2
-            },
-            "yolo_format": {
-                "center_x": center_x,
-                "center_y": center_y,
-                "width": width,
-                "height": height
-            }
-        }
-        
-        with open(json_path, 'w') as f:
-            json.dump(metadata, f, indent=4)
+        self.after_saved(futures, *on_saved)
+        self.update_status(f"Exportando {len(names)} recorte(s) para {directory}")
+
+    def selected_formats(self) -> List[str]:
+        """Formatos marcados no menu "Formatos", além do JSON do editor"""
+        return [name for name, var in self.export_formats.items() if var.get()]
+
+    def poll_saves(self):
+        """Mostra o andamento das gravações e informa as concluídas (na thread do Tk)"""
+        for path, _, error in self.save_queue.poll():
+            if error is None:
+                self.update_status(f"Salvo: {path}")
+            else:
+                messagebox.showerror("Erro", f"Não foi possível salvar {path}: {error}\n"
+                                             "Use Ctrl+Z para recuperar as anotações; o diário da imagem foi mantido.")
+        self.complete_saves()
+        pending = len(self.save_queue)
+        if pending:
+            self.save_label.config(text=f"Salvando {pending} arquivo(s)...")
+            if not self.save_indicator.winfo_ismapped():
+                self.save_indicator.pack(side=tk.BOTTOM, fill=tk.X, after=self.status_bar)
+                self.save_progress.start(15)
+            self.root.after(100, self.poll_saves)
+            return
+        self._polling_saves = False
+        if self.save_indicator.winfo_ismapped():
+            self.save_progress.stop()
+            self.save_indicator.pack_forget()
+
+    def after_saved(self, futures: List[Future], *on_success: Callable[[], None]):
+        """Agenda as funções `on_success` (na thread do Tk) para quando todas as gravações derem certo"""
+        self.pending_saves.append((futures, on_success))
+        if not self._polling_saves:  # Um único ciclo de `poll_saves`, por mais salvamentos que haja
+            self._polling_saves = True
+            self.poll_saves()
+
+    def complete_saves(self):
+        """Conclui os salvamentos cujas gravações terminaram (os que falharam são só descartados)"""
+        for save in [s for s in self.pending_saves if all(f.done() for f in s[0])]:
+            self.pending_saves.remove(save)
+            futures, on_success = save
+            if all(not f.cancelled() and f.exception() is None for f in futures):
+                for callback in on_success:
+                    callback()
+
+    def browser_marker(self) -> Callable[[], None]:
+        """Função que marca a imagem atual como anotada no painel de miniaturas"""
+        image_path = self.session.image_path
+        if not image_path:
+            return lambda: None
+        return lambda: self.browser.mark(os.path.abspath(image_path))
+
+    def project_recorder(self, record: Callable, sidecar: str, rows: list) -> Callable[[], None]:
+        """Função que grava no índice do projeto as linhas de um salvamento da imagem atual
+
+        As linhas são calculadas agora (a sessão é limpa em seguida); a
+        gravação no banco fica para quando os arquivos estiverem no disco.
+        """
+        project = self.project
+        session = self.session
+        args = (sidecar, session.image_path, session.width, session.height, rows)
+        return lambda: project.submit(record, *args)
 
     def save_polygons(self):
         """Salva polígonos em arquivo JSON com labels e IDs"""
-        if not self.polygons:
+        if not self.session.polygons:
             messagebox.showwarning("Aviso", "Nenhum polígono para salvar")
             return
 
@@ -1097,57 +1330,81 @@ class ImageEditor:
         # Atualiza o último diretório usado
         self.last_save_dir = os.path.dirname(save_path)
         
-        # Normaliza as coordenadas
-        normalized_polygons = []
-        for polygon_data in self.polygons:
-            normalized = []
-            for x, y in polygon_data['points']:
-                normalized.append((x / self.width, y / self.height))
-                
-            normalized_polygons.append({
-                'points': normalized,
-                'label': polygon_data['label'],
-                'id': polygon_data['id'],
-                'color': polygon_data['color']
-            })
-        
-        # Estrutura de metadados completa
-        metadata = {
-            "image_path": self.filepath,
-            "image_size": {"width": self.width, "height": self.height},
-            "polygons_absolute": self.polygons,
-            "polygons_normalized": normalized_polygons
-        }
-        
-        with open(save_path, 'w') as f:
-            json.dump(metadata, f, indent=4)
-        
-        messagebox.showinfo("Sucesso", f"Polígonos salvos: {save_path}")
+        # Coordenadas normalizadas calculadas uma vez; cada formato é gravado em segundo plano
+        session = self.session
+        formats = self.selected_formats()
+        base = os.path.splitext(save_path)[0]
+        futures = submit_exports(self.save_queue.submit, session.export_context(crops=False), base, formats)
+        # O diário só é apagado (e o índice e o painel atualizados) quando todos os arquivos estiverem gravados
+        on_saved = [self.journal_discarder(), self.browser_marker()]
+        if self.project is not None:
+            on_saved.append(self.project_recorder(self.project.record_polygons, save_path,
+                                                  polygon_rows(session.polygons)))
+
         self.reset_annotations()
+        self.after_saved(futures, *on_saved)
+        self.update_status(f"Exportando polígonos ({', '.join([NATIVE_FORMAT, *formats])}) para {base}")
 
     def save_and_restart(self, event=None):
         """Salva o trabalho atual e reinicia o editor"""
         if self.mode == 'crop':
             self.save_crop()
-        elif self.mode == 'polygon' and (self.polygons or self.current_polygon):
-            if self.current_polygon:
+        elif self.mode == 'polygon' and (self.session.polygons or self.session.current_polygon):
+            if self.session.current_polygon:
                 self.finalize_polygon()
             else:
                 self.save_polygons()
         else:
             self.update_status("Nada para salvar")
         
-        self.load_image()
+        self.next_image()
 
     def on_close(self):
         """Garante o fechamento seguro da aplicação"""
         if messagebox.askokcancel("Sair", "Tem certeza que deseja sair?"):
+            self.prefetcher.shutdown()
+            self.browser.shutdown()
+            self.decode_cache.shutdown()  # Gravações no cache ainda na fila são descartadas
+            self.save_queue.shutdown()  # Termina as gravações pendentes
+            self.complete_saves()  # Apaga os diários das anotações que foram salvas
+            if self.project is not None:
+                self.project.shutdown()
+            if self.journal is not None:
+                self.journal.close()  # Grava as últimas operações
             try:
                 self.root.destroy()
             except Exception:
                 self.root.quit()
 
 if __name__ == "__main__":
+    # Modos de linha de comando: rodam sem abrir a interface Tk
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        from dataset_export import main as export_main
+        sys.exit(export_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "masks":
+        from masks import main as masks_main
+        sys.exit(masks_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        from project_index import main as index_main
+        sys.exit(index_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "cache":
+        from decode_cache import main as cache_main
+        sys.exit(cache_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from session_bench import main as bench_main
+        sys.exit(bench_main(sys.argv[2:]))
+
+    # Instrumentação opcional: --profile [arquivo.json] ou MAPGEN_PROFILE
+    profiler = None
+    profile_path = profile_path_from_env()
+    if len(sys.argv) > 1 and sys.argv[1] == "--profile":
+        profile_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PROFILE_PATH
+    if profile_path:
+        profiler = Profiler(profile_path)
+
     root = ThemedTk(theme="clam")
     root.title("Map Editor")
     
@@ -1171,5 +1428,7 @@ if __name__ == "__main__":
     # Configura tamanho mínimo
     root.minsize(800, 600)
     
-    ImageEditor(root)
-    root.mainloop()
\ No newline at end of file
+    editor = ImageEditor(root, profiler)
+    root.mainloop()
+    if profiler is not None:
+        print(f"Relatório de desempenho: {profiler.dump(editor.profile_extra())}")
\ No newline at end of file
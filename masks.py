@@ -0,0 +1,192 @@
+"""Geração de máscaras PNG (semântica e de instâncias) a partir dos polígonos
+
+Uso:
+    python main.py masks <pasta_json> [<pasta_saida>] [--classes ARQUIVO] [--workers N]
+
+Para cada JSON de polígonos são gravados `<nome>_semantic.png` (uint8, ID
+da classe, 0 = fundo) e `<nome>_instance.png` (uint16, ID do polígono).
+Os IDs das classes seguem o `classes.txt`, o mesmo da exportação de dataset.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from batch import find_sidecars, sidecar_kind
+from dataset_export import read_classes
+from metadata import polygons_from_metadata
+from polygon_store import PolygonStore
+
+CLASSES_FILE = "classes.txt"
+MAX_INSTANCE_ID = np.iinfo(np.uint16).max
+
+
+def polygon_contours(store: PolygonStore) -> List[np.ndarray]:
+    """Vértices de cada polígono como contornos int32 do OpenCV (uma conversão para todos)"""
+    vertices = np.rint(store.vertices).astype(np.int32)
+    return np.split(vertices, store.offsets[1:-1])
+
+
+def render_masks(store: PolygonStore, width: int, height: int, class_ids: Dict[str, int],
+                 semantic: Optional[np.ndarray] = None,
+                 instance: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Rasteriza os polígonos nas máscaras semântica (uint8) e de instâncias (uint16)
+
+    Cada polígono é preenchido sozinho, na ordem da lista, nas duas
+    máscaras: polígonos posteriores ficam por cima dos anteriores e a
+    sobreposição de dois polígonos da mesma classe não vira buraco. Os
+    buffers podem ser passados para reaproveitamento. Levanta ValueError se
+    algum ID de polígono não couber na máscara de instâncias.
+    """
+    if len(store) and int(store.ids.max()) > MAX_INSTANCE_ID:
+        raise ValueError(f"a máscara de instâncias uint16 comporta IDs até {MAX_INSTANCE_ID}")
+    if semantic is None:
+        semantic = np.zeros((height, width), dtype=np.uint8)
+    else:
+        semantic.fill(0)
+    if instance is None:
+        instance = np.zeros((height, width), dtype=np.uint16)
+    else:
+        instance.fill(0)
+    if not len(store):
+        return semantic, instance
+
+    class_of = [class_ids.get(label) for label in store.labels]  # None: label fora da lista de classes
+    for contour, label_id, poly_id in zip(polygon_contours(store), store.label_ids.tolist(),
+                                          store.ids.tolist()):
+        class_id = class_of[label_id]
+        if class_id is not None:
+            cv2.fillPoly(semantic, [contour], class_id)
+        cv2.fillPoly(instance, [contour], poly_id)
+    return semantic, instance
+
+
+def mask_paths(base_path: str) -> Tuple[str, str]:
+    """Caminhos das máscaras semântica e de instâncias para um JSON"""
+    stem = os.path.splitext(base_path)[0]
+    return stem + "_semantic.png", stem + "_instance.png"
+
+
+def write_masks(base_path: str, semantic: np.ndarray, instance: np.ndarray) -> List[str]:
+    """Grava as duas máscaras ao lado de `base_path` e retorna os caminhos"""
+    paths = mask_paths(base_path)
+    for path, mask in zip(paths, (semantic, instance)):
+        if not cv2.imwrite(path, mask):
+            raise OSError(f"falha ao gravar {path}")
+    return list(paths)
+
+
+def class_ids_for(labels: Sequence[str]) -> Dict[str, int]:
+    """IDs das classes na máscara semântica (1 em diante; 0 é o fundo)"""
+    if len(labels) > 255:
+        raise ValueError("a máscara semântica uint8 comporta no máximo 255 classes")
+    return {label: i + 1 for i, label in enumerate(labels)}
+
+
+def update_classes_file(directory: str, labels: Sequence[str]) -> List[str]:
+    """Acrescenta labels novos ao `classes.txt` da pasta e retorna a lista completa"""
+    path = os.path.join(directory, CLASSES_FILE)
+    classes = read_classes(path) if os.path.exists(path) else []
+    new = [label for label in dict.fromkeys(labels) if label not in classes]
+    if new:
+        classes.extend(new)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(label + "\n" for label in classes)
+    return classes
+
+
+def read_labels(json_path: str) -> List[str]:
+    """Labels de um JSON de polígonos, na ordem em que aparecem (roda em um processo do pool)"""
+    try:
+        with open(json_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return []  # O erro é informado na geração das máscaras
+    if sidecar_kind(metadata) != "polygons":
+        return []
+    return list(dict.fromkeys(p["label"] for p in metadata["polygons_normalized"]))
+
+
+def process_sidecar(json_path: str, output_dir: Optional[str], class_ids: Dict[str, int]) -> Dict[str, Any]:
+    """Gera as máscaras de um JSON de polígonos (roda em um processo do pool)"""
+    with open(json_path) as f:
+        metadata = json.load(f)
+    if sidecar_kind(metadata) != "polygons":
+        return {"path": json_path, "status": "skipped", "reason": "não é um JSON de polígonos"}
+
+    width = metadata["image_size"]["width"]
+    height = metadata["image_size"]["height"]
+    store = polygons_from_metadata(metadata)
+    semantic, instance = render_masks(store, width, height, class_ids)
+
+    base = os.path.join(output_dir, os.path.basename(json_path)) if output_dir else json_path
+    return {"path": json_path, "status": "ok", "outputs": write_masks(base, semantic, instance)}
+
+
+def run_masks(input_dir: str, output_dir: Optional[str] = None, classes: Optional[List[str]] = None,
+              workers: Optional[int] = None, progress=print) -> Dict[str, Any]:
+    """Regenera as máscaras de todos os JSONs de polígonos de uma pasta, em paralelo"""
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    sidecars = find_sidecars(input_dir, exclude=output_dir)
+    total = len(sidecars)
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if classes is None:
+            # Sem lista fixa: usa o classes.txt da pasta, completado com os labels encontrados
+            labels = [label for found in pool.map(read_labels, sidecars, chunksize=16) for label in found]
+            classes = update_classes_file(output_dir or input_dir, labels)
+        class_ids = class_ids_for(classes)
+
+        futures = {pool.submit(process_sidecar, path, output_dir, class_ids): path for path in sidecars}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as e:  # Um arquivo inválido não interrompe o lote
+                result = {"path": futures[future], "status": "error", "reason": str(e)}
+            counts[result["status"]] += 1
+
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed > 0 else 0.0
+            line = f"[{done}/{total}] {result['status']}: {os.path.basename(result['path'])} ({rate:.1f} img/s)"
+            if result["status"] != "ok":
+                line += f" - {result['reason']}"
+            progress(line)
+
+    elapsed = time.perf_counter() - start
+    summary = dict(counts, total=total, classes=len(classes), seconds=elapsed)
+    progress(f"Concluído: {counts['ok']} ok, {counts['skipped']} ignorados, {counts['error']} erros "
+             f"em {elapsed:.1f}s")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py masks",
+        description="Gera máscaras PNG semânticas e de instâncias a partir dos JSONs de polígonos"
+    )
+    parser.add_argument("input_dir", help="pasta com os JSONs gerados pelo editor")
+    parser.add_argument("output_dir", nargs="?", default=None,
+                        help="pasta das máscaras (padrão: ao lado de cada JSON)")
+    parser.add_argument("--classes",
+                        help="arquivo com uma classe por linha (padrão: classes.txt da pasta, completado)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="número de processos (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+
+    classes = read_classes(args.classes) if args.classes else None
+    summary = run_masks(args.input_dir, args.output_dir, classes, args.workers)
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
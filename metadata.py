@@ -0,0 +1,175 @@
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from polygon_store import PolygonStore
+
+Polygons = Union[PolygonStore, Sequence[Dict[str, Any]]]
+
+
+def crop_metadata(width: int, height: int, x1: int, y1: int, x2: int, y2: int,
+                  image_path: Optional[str] = None) -> Dict[str, Any]:
+    """Monta os metadados de um recorte com coordenadas absolutas, relativas e YOLO"""
+    # Calcula coordenadas relativas (0-1)
+    x1_rel = x1 / width
+    y1_rel = y1 / height
+    x2_rel = x2 / width
+    y2_rel = y2 / height
+
+    # Calcula coordenadas do centro e tamanho (formato YOLO)
+    center_x = (x1_rel + x2_rel) / 2
+    center_y = (y1_rel + y2_rel) / 2
+    crop_width = x2_rel - x1_rel
+    crop_height = y2_rel - y1_rel
+
+    metadata = {
+        "original_size": {"width": width, "height": height},
+        "crop_coordinates_relative": {
+            "x1": x1_rel, "y1": y1_rel,
+            "x2": x2_rel, "y2": y2_rel
+        },
+        "crop_coordinates_absolute": {
+            "x1": x1, "y1": y1,
+            "x2": x2, "y2": y2
+        },
+        "yolo_format": {
+            "center_x": center_x,
+            "center_y": center_y,
+            "width": crop_width,
+            "height": crop_height
+        }
+    }
+    if image_path is not None:
+        metadata["image_path"] = image_path
+    return metadata
+
+
+def crops_metadata(width: int, height: int, crops: Sequence[Dict[str, Any]],
+                   image_path: Optional[str] = None,
+                   files: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """Metadados de vários recortes de uma imagem em um só arquivo"""
+    entries = []
+    for i, crop in enumerate(crops):
+        x1, y1, x2, y2 = crop["rect"]
+        entry = {"name": crop["name"]}
+        if files is not None:
+            entry["file"] = files[i]
+        single = crop_metadata(width, height, x1, y1, x2, y2)
+        del single["original_size"]
+        entry.update(single)
+        entries.append(entry)
+
+    metadata = {"original_size": {"width": width, "height": height}, "crops": entries}
+    if image_path is not None:
+        metadata["image_path"] = image_path
+    return metadata
+
+
+def relative_crop_to_absolute(relative: Dict[str, float], width: int, height: int):
+    """Converte um recorte relativo (0-1) em pixels para uma imagem de outro tamanho"""
+    return (
+        int(round(relative["x1"] * width)), int(round(relative["y1"] * height)),
+        int(round(relative["x2"] * width)), int(round(relative["y2"] * height))
+    )
+
+
+def as_store(polygons: Polygons) -> PolygonStore:
+    """Aceita um PolygonStore ou uma lista de dicionários de polígonos"""
+    return polygons if isinstance(polygons, PolygonStore) else PolygonStore.from_records(polygons)
+
+
+def normalize_polygons(polygons: Polygons, width: int, height: int) -> List[Dict[str, Any]]:
+    """Converte os pontos dos polígonos para coordenadas relativas (0-1)"""
+    return as_store(polygons).normalized_records(width, height)
+
+
+def denormalize_polygons(polygons: Polygons, width: int, height: int) -> List[Dict[str, Any]]:
+    """Converte polígonos normalizados em pixels para uma imagem de tamanho dado"""
+    return as_store(polygons).scaled_records(width, height)
+
+
+def polygons_metadata(image_path: Optional[str], width: int, height: int,
+                      polygons: Polygons) -> Dict[str, Any]:
+    """Monta a estrutura completa do JSON de polígonos"""
+    store = as_store(polygons)
+    return {
+        "image_path": image_path,
+        "image_size": {"width": width, "height": height},
+        "polygons_absolute": store.to_records(),
+        "polygons_normalized": store.normalized_records(width, height)
+    }
+
+
+def polygons_from_metadata(metadata: Dict[str, Any]) -> PolygonStore:
+    """Polígonos em pixels de um JSON salvo pelo editor (usa os absolutos quando existem)"""
+    if "polygons_absolute" in metadata:
+        return PolygonStore.from_records(metadata["polygons_absolute"])
+    size = metadata["image_size"]
+    normalized = PolygonStore.from_records(metadata["polygons_normalized"])
+    return PolygonStore.from_records(normalized.scaled_records(size["width"], size["height"]))
+
+
+class ExportContext:
+    """Anotações de uma imagem prontas para exportação, em qualquer formato
+
+    Coordenadas normalizadas, caixas e áreas são calculadas uma única vez
+    aqui e compartilhadas pelos formatos. Polígonos e recortes são copiados,
+    então a edição pode continuar enquanto os formatos são gravados.
+    """
+
+    def __init__(self, image_path: Optional[str], width: int, height: int, polygons: Polygons = (),
+                 crops: Sequence[Dict[str, Any]] = (), crop_files: Optional[Sequence[str]] = None):
+        self.image_path = image_path
+        self.width = width
+        self.height = height
+        self.store = polygons.copy() if isinstance(polygons, PolygonStore) else as_store(polygons)
+        self.crops = [dict(crop) for crop in crops]
+        self.crop_files = list(crop_files) if crop_files is not None else None
+
+        store = self.store
+        self.offsets: List[int] = store.offsets.tolist()
+        self.normalized = store.vertices.astype(np.float64) / np.array([width, height])
+        self.bboxes = store.bboxes().astype(np.float64)  # (x0, y0, x1, y1)
+        self.areas = store.areas()
+        self.classes: Dict[str, List[str]] = {}  # Lista de classes por pasta de saída (ver `exporters`)
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any], image_path: Optional[str] = None) -> "ExportContext":
+        """Contexto de um JSON de polígonos salvo pelo editor"""
+        size = metadata["image_size"]
+        return cls(image_path or metadata.get("image_path"), size["width"], size["height"],
+                   polygons_from_metadata(metadata))
+
+    @property
+    def labels(self) -> List[str]:
+        """Labels dos polígonos, na ordem em que aparecem"""
+        return list(dict.fromkeys(polygon.label for polygon in self.store))
+
+    def polygon_entries(self) -> List[Dict[str, Any]]:
+        """Label, ID, segmentação (x, y, x, y...), área e caixa (x, y, w, h) de cada polígono"""
+        boxes = self.bboxes.copy()
+        boxes[:, 2:] -= boxes[:, :2]
+        vertices = self.store.vertices
+        return [
+            {"label": polygon.label, "id": polygon.id,
+             "segmentation": vertices[start:end].ravel().tolist(), "area": area, "bbox": box}
+            for polygon, start, end, area, box in zip(
+                self.store, self.offsets[:-1], self.offsets[1:], self.areas.tolist(), boxes.tolist())
+        ]
+
+    def yolo_coordinates(self, index: int) -> str:
+        """Vértices normalizados do polígono `index` (limitados a 0-1), no formato YOLO"""
+        points = np.clip(self.normalized[self.offsets[index]:self.offsets[index + 1]], 0.0, 1.0)
+        return " ".join(f"{v:.6f}" for v in points.ravel())
+
+    def polygons_metadata(self) -> Dict[str, Any]:
+        """Estrutura do JSON de polígonos do editor (a mesma de `polygons_metadata`)"""
+        return {
+            "image_path": self.image_path,
+            "image_size": {"width": self.width, "height": self.height},
+            "polygons_absolute": self.store.to_records(),
+            "polygons_normalized": self.store.to_records(self.normalized)
+        }
+
+    def crops_metadata(self) -> Dict[str, Any]:
+        return crops_metadata(self.width, self.height, self.crops, self.image_path, self.crop_files)
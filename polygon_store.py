@@ -0,0 +1,297 @@
+import itertools
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Selos de revisão, únicos no processo: o mesmo selo sempre indica a mesma geometria
+_revision_stamps = itertools.count(1)
+
+
+class PolygonView:
+    """Visão leve de um polígono do `PolygonStore` (não copia os vértices)"""
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: "PolygonStore", index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def points(self) -> np.ndarray:
+        """Vértices (k, 2) float32, como visão do buffer do store"""
+        return self.store.points(self.index)
+
+    @property
+    def label(self) -> str:
+        return self.store.labels[self.store.label_ids[self.index]]
+
+    @property
+    def id(self) -> int:
+        return int(self.store.ids[self.index])
+
+    @property
+    def color(self) -> str:
+        return f"#{int(self.store.colors[self.index]):06x}"
+
+    @property
+    def revision(self) -> int:
+        return int(self.store.revisions[self.index])
+
+    @property
+    def centroid(self) -> Tuple[float, float]:
+        x, y = self.points.mean(axis=0, dtype=np.float64)
+        return float(x), float(y)
+
+    def to_record(self) -> Dict[str, Any]:
+        """Converte para o dicionário usado nos JSONs ('points', 'label', 'id', 'color')"""
+        return self.store.record(self.index)
+
+
+class PolygonStore:
+    """Armazena todos os polígonos em arrays contíguos
+
+    Os vértices de todos os polígonos ficam em um único buffer float32
+    (8 bytes por vértice); `offsets[i]:offsets[i + 1]` delimita os vértices
+    do polígono i. Labels são internados e referenciados por `label_ids`,
+    e as cores ficam em `colors` como inteiros 0xRRGGBB. `revisions` recebe
+    um selo novo sempre que os vértices de um polígono mudam, servindo de
+    chave barata para caches derivados da geometria.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._vertices = np.empty((capacity, 2), dtype=np.float32)
+        self._n_vertices = 0
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.label_ids = np.empty(0, dtype=np.int32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.colors = np.empty(0, dtype=np.uint32)
+        self.revisions = np.empty(0, dtype=np.int64)
+        self.labels: List[str] = []
+        self._label_lookup: Dict[str, int] = {}
+        self._bboxes: Optional[np.ndarray] = None  # Cache de bboxes(), mantido nas edições
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "PolygonStore":
+        """Cria um store a partir de dicionários com 'points', 'label', 'id' e 'color'"""
+        records = list(records)
+        store = cls()
+        if not records:
+            return store
+        # Construção em bloco: uma única concatenação em vez de uma inserção por polígono
+        arrays = [np.asarray(r['points'], dtype=np.float32).reshape(-1, 2) for r in records]
+        store._vertices = np.concatenate(arrays)
+        store._n_vertices = len(store._vertices)
+        store.offsets = np.concatenate(([0], np.cumsum([len(a) for a in arrays]))).astype(np.int64)
+        store.label_ids = np.array([store._intern(r['label']) for r in records], dtype=np.int32)
+        store.ids = np.array([int(r['id']) for r in records], dtype=np.int64)
+        store.colors = np.array([int(r['color'].lstrip('#'), 16) for r in records], dtype=np.uint32)
+        store.revisions = np.fromiter((next(_revision_stamps) for _ in records), dtype=np.int64,
+                                      count=len(records))
+        return store
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __iter__(self) -> Iterator[PolygonView]:
+        for index in range(len(self)):
+            yield PolygonView(self, index)
+
+    def __getitem__(self, index: int) -> PolygonView:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("índice de polígono fora do intervalo")
+        return PolygonView(self, index)
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """Buffer de vértices em uso (n, 2) float32"""
+        return self._vertices[:self._n_vertices]
+
+    @property
+    def vertex_count(self) -> int:
+        return self._n_vertices
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Número de vértices de cada polígono"""
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelos arrays em uso"""
+        return (self.vertices.nbytes + self.offsets.nbytes + self.label_ids.nbytes
+                + self.ids.nbytes + self.colors.nbytes + self.revisions.nbytes)
+
+    def points(self, index: int) -> np.ndarray:
+        """Vértices do polígono `index`, sem cópia"""
+        return self._vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    def append(self, record: Dict[str, Any]):
+        """Adiciona um polígono no fim"""
+        self.insert(len(self), record)
+
+    def insert(self, index: int, record: Dict[str, Any]):
+        """Insere um polígono na posição dada"""
+        points = np.asarray(record['points'], dtype=np.float32).reshape(-1, 2)
+        k = len(points)
+        start = int(self.offsets[index])
+        n = self._n_vertices
+
+        self._reserve(n + k)
+        self._vertices[start + k:n + k] = self._vertices[start:n]
+        self._vertices[start:start + k] = points
+        self._n_vertices = n + k
+
+        self.offsets = np.concatenate((self.offsets[:index + 1], self.offsets[index:] + k))
+        self.label_ids = np.insert(self.label_ids, index, self._intern(record['label']))
+        self.ids = np.insert(self.ids, index, int(record['id']))
+        self.colors = np.insert(self.colors, index, int(record['color'].lstrip('#'), 16))
+        self.revisions = np.insert(self.revisions, index, next(_revision_stamps))
+        if self._bboxes is not None:
+            self._bboxes = np.insert(self._bboxes, index, _bbox(points), axis=0)
+
+    def pop(self, index: int = -1) -> Dict[str, Any]:
+        """Remove um polígono e retorna seus dados como dicionário"""
+        if index < 0:
+            index += len(self)
+        record = self.record(index)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        k = end - start
+        n = self._n_vertices
+
+        self._vertices[start:n - k] = self._vertices[end:n]
+        self._n_vertices = n - k
+
+        self.offsets = np.concatenate((self.offsets[:index], self.offsets[index + 1:] - k))
+        self.label_ids = np.delete(self.label_ids, index)
+        self.ids = np.delete(self.ids, index)
+        self.colors = np.delete(self.colors, index)
+        self.revisions = np.delete(self.revisions, index)
+        if self._bboxes is not None:
+            self._bboxes = np.delete(self._bboxes, index, axis=0)
+        return record
+
+    def move_vertex(self, index: int, vertex_index: int, point: Tuple[float, float]):
+        """Altera a posição de um vértice no lugar"""
+        self._vertices[self.offsets[index] + vertex_index] = point
+        self.revisions[index] = next(_revision_stamps)
+        if self._bboxes is not None:
+            self._bboxes[index] = _bbox(self.points(index))
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """Dados do polígono `index` como dicionário (com cópia dos pontos)"""
+        view = PolygonView(self, index)
+        return {'points': view.points.tolist(), 'label': view.label, 'id': view.id, 'color': view.color}
+
+    def to_records(self, vertices: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Todos os polígonos como dicionários, no formato dos JSONs
+
+        Sem `vertices`, os pontos saem em pixels inteiros, como o editor sempre gravou;
+        `vertices` substitui os pontos (mesma forma do buffer, ex.: já normalizados).
+        """
+        if vertices is None:
+            vertices = np.rint(self.vertices).astype(np.int64)
+        return self._records(vertices.tolist())
+
+    def normalized_records(self, width: float, height: float) -> List[Dict[str, Any]]:
+        """Todos os polígonos com coordenadas divididas pelo tamanho da imagem (0-1)"""
+        scaled = self.vertices.astype(np.float64) / np.array([width, height])
+        return self._records(scaled.tolist())
+
+    def scaled_records(self, scale_x: float, scale_y: float) -> List[Dict[str, Any]]:
+        """Todos os polígonos com coordenadas multiplicadas pelos fatores dados"""
+        scaled = self.vertices.astype(np.float64) * np.array([scale_x, scale_y])
+        return self._records(scaled.tolist())
+
+    def centroids(self) -> np.ndarray:
+        """Média dos vértices de cada polígono, (n, 2)"""
+        if not len(self):
+            return np.empty((0, 2))
+        sums = np.add.reduceat(self.vertices.astype(np.float64), self.offsets[:-1], axis=0)
+        return sums / self.counts[:, None]
+
+    def bboxes(self) -> np.ndarray:
+        """Caixas delimitadoras (x0, y0, x1, y1) de cada polígono, (n, 4)
+
+        Calculadas uma vez e atualizadas nas edições; não altere o array retornado.
+        """
+        if self._bboxes is None:
+            if not len(self):
+                self._bboxes = np.empty((0, 4), dtype=np.float32)
+            else:
+                starts = self.offsets[:-1]
+                mins = np.minimum.reduceat(self.vertices, starts, axis=0)
+                maxs = np.maximum.reduceat(self.vertices, starts, axis=0)
+                self._bboxes = np.hstack((mins, maxs))
+        return self._bboxes
+
+    def visible(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Índices dos polígonos cuja caixa delimitadora cruza o retângulo dado"""
+        boxes = self.bboxes()
+        return np.flatnonzero((boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) &
+                              (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0))
+
+    def areas(self) -> np.ndarray:
+        """Área de cada polígono pela fórmula do laço (shoelace)"""
+        if not len(self):
+            return np.empty(0)
+        v = self.vertices.astype(np.float64)
+        # Índice do próximo vértice, voltando ao primeiro no fim de cada polígono
+        nxt = np.arange(1, len(v) + 1)
+        nxt[self.offsets[1:] - 1] = self.offsets[:-1]
+        cross = v[:, 0] * v[nxt, 1] - v[nxt, 0] * v[:, 1]
+        return np.abs(np.add.reduceat(cross, self.offsets[:-1])) / 2
+
+    def copy(self) -> "PolygonStore":
+        """Cópia independente (ex.: para gravar em outra thread enquanto a edição continua)"""
+        store = PolygonStore(capacity=0)
+        store._vertices = self.vertices.copy()
+        store._n_vertices = self._n_vertices
+        store.offsets = self.offsets.copy()
+        store.label_ids = self.label_ids.copy()
+        store.ids = self.ids.copy()
+        store.colors = self.colors.copy()
+        store.revisions = self.revisions.copy()
+        store.labels = list(self.labels)
+        store._label_lookup = dict(self._label_lookup)
+        return store
+
+    def clear(self):
+        """Remove todos os polígonos"""
+        self.__init__()
+
+    def _records(self, flat_points: List[List[float]]) -> List[Dict[str, Any]]:
+        offsets = self.offsets.tolist()
+        return [
+            {
+                'points': flat_points[offsets[i]:offsets[i + 1]],
+                'label': self.labels[label_id],
+                'id': poly_id,
+                'color': f"#{color:06x}"
+            }
+            for i, (label_id, poly_id, color) in enumerate(
+                zip(self.label_ids.tolist(), self.ids.tolist(), self.colors.tolist()))
+        ]
+
+    def _intern(self, label: str) -> int:
+        label_id = self._label_lookup.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self._label_lookup[label] = label_id
+        return label_id
+
+    def _reserve(self, size: int):
+        if size <= len(self._vertices):
+            return
+        capacity = max(size, 2 * len(self._vertices))
+        grown = np.empty((capacity, 2), dtype=np.float32)
+        grown[:self._n_vertices] = self.vertices
+        self._vertices = grown
+
+
+def _bbox(points: np.ndarray) -> np.ndarray:
+    if not len(points):
+        return np.zeros(4, dtype=np.float32)
+    return np.concatenate((points.min(axis=0), points.max(axis=0)))
@@ -0,0 +1,148 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from batch import IMAGE_EXTENSIONS
+from image_io import estimate_nbytes, load_rgbx
+
+# Quantas imagens seguintes decodificar e quanta memória elas podem ocupar
+DEFAULT_DEPTH = int(os.environ.get("MAPGEN_PREFETCH_DEPTH", "2"))
+DEFAULT_BUDGET_MB = int(os.environ.get("MAPGEN_PREFETCH_MB", "1024"))
+
+
+def list_images(directory: str) -> List[str]:
+    """Imagens da pasta (sem subpastas), em ordem alfabética"""
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(directory, n) for n in names]
+
+
+class FolderSession:
+    """Lista ordenada das imagens de uma pasta e a posição atual nela"""
+
+    def __init__(self, paths: Sequence[str], index: int = 0):
+        self.paths = list(paths)
+        self.index = index
+
+    @classmethod
+    def from_file(cls, path: str) -> "FolderSession":
+        """Sessão com as imagens da pasta do arquivo, posicionada nele"""
+        paths = list_images(os.path.dirname(os.path.abspath(path)))
+        target = os.path.abspath(path)
+        index = next((i for i, p in enumerate(paths) if os.path.abspath(p) == target), None)
+        if index is None:
+            paths.insert(0, path)
+            index = 0
+        return cls(paths, index)
+
+    @property
+    def current(self) -> str:
+        return self.paths[self.index]
+
+    def peek(self, step: int) -> Optional[str]:
+        """Caminho da imagem a `step` posições da atual (None fora da lista)"""
+        index = self.index + step
+        return self.paths[index] if 0 <= index < len(self.paths) else None
+
+    def move(self, step: int) -> Optional[str]:
+        """Avança (ou volta) `step` imagens e retorna o novo caminho"""
+        path = self.peek(step)
+        if path is not None:
+            self.index += step
+        return path
+
+    def upcoming(self, count: int) -> List[str]:
+        """As próximas `count` imagens depois da atual"""
+        return self.paths[self.index + 1:self.index + 1 + count]
+
+    def position(self) -> str:
+        return f"{self.index + 1}/{len(self.paths)}"
+
+
+class Prefetcher:
+    """Decodifica as próximas imagens em uma thread de fundo
+
+    No máximo `depth` imagens ficam reservadas, limitadas a `budget_bytes`.
+    Uma imagem que deixa de estar entre as próximas é cancelada (ou
+    descartada ao terminar, se a decodificação já começou).
+    """
+
+    def __init__(self, loader: Callable[[str], Optional[np.ndarray]] = load_rgbx,
+                 depth: Optional[int] = None, budget_bytes: Optional[int] = None):
+        self.loader = loader
+        self.depth = DEFAULT_DEPTH if depth is None else depth
+        self.budget_bytes = budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_MB * 2**20
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._jobs: "OrderedDict[str, Future]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def schedule(self, paths: Sequence[str]):
+        """Passa a pré-carregar as imagens dadas (em ordem de prioridade)"""
+        wanted = list(paths)[:self.depth]
+        for path in list(self._jobs):
+            if path not in wanted:
+                self.discard(path)
+
+        for path in wanted:
+            if path in self._jobs:
+                continue
+            nbytes = estimate_nbytes(path)
+            if nbytes is None:
+                continue  # Cabeçalho ilegível: a imagem é aberta (ou recusada) só quando pedida
+            if self.reserved_bytes + nbytes > self.budget_bytes:
+                break  # Sem espaço: as seguintes também esperam
+            self._sizes[path] = nbytes
+            self._jobs[path] = self._executor.submit(self.loader, path)
+
+    def take(self, path: str) -> Optional[np.ndarray]:
+        """Retorna a imagem pré-carregada (esperando se ainda estiver em andamento)"""
+        future = self._jobs.pop(path, None)
+        self._sizes.pop(path, None)
+        if future is None or future.cancelled():
+            self.misses += 1
+            return None
+        try:
+            buffer = future.result()
+        except Exception:
+            buffer = None
+        if buffer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return buffer
+
+    def discard(self, path: str):
+        """Cancela ou descarta o pré-carregamento de uma imagem"""
+        future = self._jobs.pop(path, None)
+        self._sizes.pop(path, None)
+        if future is not None:
+            future.cancel()
+            self.cancelled += 1
+
+    def clear(self):
+        """Descarta todos os pré-carregamentos"""
+        for path in list(self._jobs):
+            self.discard(path)
+
+    def shutdown(self):
+        """Descarta pendências e encerra a thread de fundo"""
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._jobs),
+            "reserved_bytes": self.reserved_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "cancelled": self.cancelled,
+        }
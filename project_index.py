@@ -0,0 +1,355 @@
+"""Índice SQLite das anotações de uma biblioteca de imagens
+
+Uso:
+    python main.py index import <pasta_json> [--images PASTA] [--db ARQUIVO] [--workers N]
+    python main.py index label <label> [--db ARQUIVO]
+    python main.py index stats [--db ARQUIVO]
+    python main.py index unannotated [--db ARQUIVO]
+
+O editor atualiza o índice a cada gravação; `import` carrega de uma vez
+os JSONs já existentes (lidos em um pool de processos).
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from batch import find_sidecars, match_legacy_image, sidecar_kind
+from metadata import polygons_from_metadata, relative_crop_to_absolute
+from polygon_store import PolygonStore
+from prefetch import list_images
+
+# Banco de dados do projeto
+DEFAULT_DB_PATH = os.environ.get("MAPGEN_PROJECT_DB", os.path.join(os.path.expanduser("~"), ".mapgen", "project.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    width INTEGER,
+    height INTEGER,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS polygons (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images(id),
+    sidecar TEXT NOT NULL,
+    polygon_id INTEGER,
+    label TEXT NOT NULL,
+    vertices INTEGER,
+    area REAL,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL
+);
+CREATE TABLE IF NOT EXISTS crops (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL REFERENCES images(id),
+    sidecar TEXT NOT NULL,
+    name TEXT,
+    x0 REAL, y0 REAL, x1 REAL, y1 REAL
+);
+CREATE INDEX IF NOT EXISTS idx_polygons_label ON polygons(label, image_id);
+CREATE INDEX IF NOT EXISTS idx_polygons_image ON polygons(image_id);
+CREATE INDEX IF NOT EXISTS idx_polygons_sidecar ON polygons(sidecar);
+CREATE INDEX IF NOT EXISTS idx_polygons_bbox ON polygons(image_id, x0, x1, y0, y1);
+CREATE INDEX IF NOT EXISTS idx_crops_image ON crops(image_id);
+CREATE INDEX IF NOT EXISTS idx_crops_sidecar ON crops(sidecar);
+"""
+
+# Linhas de uma tabela: (polygon_id, label, vertices, area, x0, y0, x1, y1) e (name, x0, y0, x1, y1)
+PolygonRow = Tuple[int, str, int, float, float, float, float, float]
+CropRow = Tuple[str, float, float, float, float]
+
+
+def polygon_rows(store: PolygonStore) -> List[PolygonRow]:
+    """Linhas da tabela `polygons` para os polígonos do store (caixas e áreas vetorizadas)"""
+    if not len(store):
+        return []
+    labels = store.labels
+    return [
+        (poly_id, labels[label_id], count, area, *bbox)
+        for poly_id, label_id, count, area, bbox in zip(
+            store.ids.tolist(), store.label_ids.tolist(), store.counts.tolist(),
+            store.areas().tolist(), store.bboxes().tolist())
+    ]
+
+
+def crop_rows(crops: Iterable[Dict[str, Any]]) -> List[CropRow]:
+    """Linhas da tabela `crops` para recortes com 'name' e 'rect'"""
+    return [(crop['name'], *map(float, crop['rect'])) for crop in crops]
+
+
+def parse_sidecar(json_path: str) -> Optional[Dict[str, Any]]:
+    """Lê um JSON do editor e monta as linhas do índice (roda em um processo do pool)"""
+    try:
+        with open(json_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    kind = sidecar_kind(metadata)
+    if kind is None:
+        return None
+
+    entry = {"sidecar": os.path.abspath(json_path), "kind": kind, "polygons": [], "crops": []}
+    if kind == "polygons":
+        width = metadata["image_size"]["width"]
+        height = metadata["image_size"]["height"]
+        entry["polygons"] = polygon_rows(polygons_from_metadata(metadata))
+    else:
+        width = metadata["original_size"]["width"]
+        height = metadata["original_size"]["height"]
+        if kind == "crop":
+            entries = [dict(metadata, name=os.path.splitext(os.path.basename(json_path))[0])]
+        else:
+            entries = metadata["crops"]
+        for crop in entries:
+            rect = relative_crop_to_absolute(crop["crop_coordinates_relative"], width, height)
+            entry["crops"].append((crop["name"], *map(float, rect)))
+
+    # JSONs de recorte antigos não têm `image_path`: a imagem é resolvida depois (ou o JSON é ignorado)
+    image_path = metadata.get("image_path")
+    entry["image"] = os.path.abspath(image_path) if image_path else None
+    entry["width"] = width
+    entry["height"] = height
+    return entry
+
+
+class ProjectIndex:
+    """Banco SQLite com imagens, polígonos (com caixas) e recortes de um projeto
+
+    As gravações do editor passam por `submit`, que as executa em uma
+    única thread, na ordem; a interface não espera o disco. As consultas
+    abrem a própria conexão e podem rodar em qualquer thread.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEFAULT_DB_PATH
+        self.error: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Conexão com commit ao final do bloco (rollback se houver erro)"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # Gravação
+
+    def submit(self, fn, *args):
+        """Executa uma gravação na thread do índice; erros ficam em `error`"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="project-index")
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._check)
+        return future
+
+    def _check(self, future):
+        error = future.exception()
+        if error is not None:
+            self.error = str(error)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _image_id(self, db: sqlite3.Connection, path: str, width: Optional[int], height: Optional[int]) -> int:
+        db.execute(
+            "INSERT INTO images (path, width, height, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET width = COALESCE(excluded.width, width), "
+            "height = COALESCE(excluded.height, height), updated = excluded.updated",
+            (os.path.abspath(path), width, height, time.time())
+        )
+        return db.execute("SELECT id FROM images WHERE path = ?", (os.path.abspath(path),)).fetchone()[0]
+
+    def register_images(self, paths: Iterable[str], sizes: Optional[Sequence[Tuple[int, int]]] = None):
+        """Inclui imagens da biblioteca (anotadas ou não)"""
+        with self.connect() as db:
+            for i, path in enumerate(paths):
+                width, height = sizes[i] if sizes is not None else (None, None)
+                self._image_id(db, path, width, height)
+
+    def record_polygons(self, sidecar: str, image_path: str, width: int, height: int,
+                        rows: Sequence[PolygonRow]):
+        """Substitui os polígonos gravados em `sidecar`"""
+        with self.connect() as db:
+            self._write(db, "polygons", sidecar, image_path, width, height, rows)
+
+    def record_crops(self, sidecar: str, image_path: str, width: int, height: int, rows: Sequence[CropRow]):
+        """Substitui os recortes gravados em `sidecar`"""
+        with self.connect() as db:
+            self._write(db, "crops", sidecar, image_path, width, height, rows)
+
+    def _write(self, db: sqlite3.Connection, table: str, sidecar: str, image_path: str,
+               width: int, height: int, rows: Sequence[tuple]):
+        sidecar = os.path.abspath(sidecar)
+        image_id = self._image_id(db, image_path, width, height)
+        db.execute(f"DELETE FROM {table} WHERE sidecar = ?", (sidecar,))
+        if table == "polygons":
+            db.executemany(
+                "INSERT INTO polygons (image_id, sidecar, polygon_id, label, vertices, area, x0, y0, x1, y1) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((image_id, sidecar, *row) for row in rows)
+            )
+        else:
+            db.executemany(
+                "INSERT INTO crops (image_id, sidecar, name, x0, y0, x1, y1) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((image_id, sidecar, *row) for row in rows)
+            )
+
+    def import_sidecars(self, json_paths: Sequence[str], workers: Optional[int] = None,
+                        progress=print, images: Sequence[str] = ()) -> Dict[str, Any]:
+        """Carrega JSONs existentes: leitura em processos, gravação em uma só transação
+
+        JSONs sem o caminho da imagem de origem (recortes antigos) só são
+        importados se a imagem for achada entre `images`; os demais contam em
+        "no_image".
+        """
+        by_stem = {os.path.splitext(os.path.basename(path))[0]: path for path in images}
+        counts = {"polygons": 0, "crops": 0, "skipped": 0, "no_image": 0}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool, self.connect() as db:
+            for done, entry in enumerate(pool.map(parse_sidecar, json_paths, chunksize=16), 1):
+                if entry is None:
+                    counts["skipped"] += 1
+                    continue
+                if entry["image"] is None:
+                    image = match_legacy_image(entry["sidecar"], entry["width"], entry["height"], by_stem)
+                    if image is None:
+                        counts["no_image"] += 1
+                        continue
+                    entry["image"] = os.path.abspath(image)
+                table = "polygons" if entry["kind"] == "polygons" else "crops"
+                rows = entry[table]
+                self._write(db, table, entry["sidecar"], entry["image"], entry["width"], entry["height"], rows)
+                counts[table] += len(rows)
+                if done % 500 == 0:
+                    progress(f"[{done}/{len(json_paths)}] arquivos lidos")
+        counts["seconds"] = time.perf_counter() - start
+        return counts
+
+    # Consultas
+
+    def images_with_label(self, label: str) -> List[Tuple[str, int]]:
+        """Imagens que têm polígonos com o label, e quantos"""
+        with self.connect() as db:
+            return db.execute(
+                "SELECT images.path, COUNT(*) FROM polygons JOIN images ON images.id = polygons.image_id "
+                "WHERE polygons.label = ? GROUP BY polygons.image_id ORDER BY images.path",
+                (label,)
+            ).fetchall()
+
+    def label_counts(self) -> List[Tuple[str, int, int]]:
+        """Por label: número de polígonos e de imagens"""
+        with self.connect() as db:
+            return db.execute(
+                "SELECT label, COUNT(*), COUNT(DISTINCT image_id) FROM polygons "
+                "GROUP BY label ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+    def unannotated(self) -> List[str]:
+        """Imagens sem polígonos nem recortes"""
+        with self.connect() as db:
+            return [row[0] for row in db.execute(
+                "SELECT path FROM images WHERE NOT EXISTS (SELECT 1 FROM polygons WHERE image_id = images.id) "
+                "AND NOT EXISTS (SELECT 1 FROM crops WHERE image_id = images.id) ORDER BY path"
+            )]
+
+    def annotated_in(self, directory: str) -> Set[str]:
+        """Imagens de uma pasta (sem subpastas) que têm polígonos ou recortes"""
+        prefix = os.path.join(os.path.abspath(directory), "")
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT path FROM images WHERE substr(path, 1, ?) = ? "
+                "AND (EXISTS (SELECT 1 FROM polygons WHERE image_id = images.id) "
+                "OR EXISTS (SELECT 1 FROM crops WHERE image_id = images.id))",
+                (len(prefix), prefix)
+            ).fetchall()
+        return {path for (path,) in rows if os.path.dirname(path) == prefix[:-1]}
+
+    def polygons_in(self, image_path: str, x0: float, y0: float, x1: float, y1: float) -> List[Tuple]:
+        """Polígonos de uma imagem cuja caixa cruza o retângulo (em pixels)"""
+        with self.connect() as db:
+            return db.execute(
+                "SELECT polygons.polygon_id, polygons.label, polygons.x0, polygons.y0, polygons.x1, polygons.y1 "
+                "FROM polygons JOIN images ON images.id = polygons.image_id "
+                "WHERE images.path = ? AND polygons.x0 <= ? AND polygons.x1 >= ? "
+                "AND polygons.y0 <= ? AND polygons.y1 >= ?",
+                (os.path.abspath(image_path), x1, x0, y1, y0)
+            ).fetchall()
+
+    def stats(self) -> Dict[str, int]:
+        with self.connect() as db:
+            return {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("images", "polygons", "crops")}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py index",
+        description="Índice SQLite das anotações do projeto"
+    )
+    parser.add_argument("--db", default=None, help=f"arquivo do banco (padrão: {DEFAULT_DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("import", help="carrega os JSONs existentes de uma pasta")
+    load.add_argument("input_dir", help="pasta com os JSONs gerados pelo editor")
+    load.add_argument("--images", help="pasta da biblioteca de imagens (inclui as não anotadas)")
+    load.add_argument("--workers", type=int, default=None, help="número de processos (padrão: número de CPUs)")
+
+    label = commands.add_parser("label", help="imagens que contêm um label")
+    label.add_argument("label")
+    commands.add_parser("stats", help="polígonos e imagens por label")
+    commands.add_parser("unannotated", help="imagens ainda sem anotações")
+    args = parser.parse_args(argv)
+
+    index = ProjectIndex(args.db)
+    start = time.perf_counter()
+    if args.command == "import":
+        images = list_images(args.images) if args.images else []
+        index.register_images(images)
+        counts = index.import_sidecars(find_sidecars(args.input_dir), args.workers, images=images)
+        print(f"Importados: {counts['polygons']} polígonos e {counts['crops']} recortes, "
+              f"{counts['skipped']} arquivos ignorados em {counts['seconds']:.1f}s")
+        if counts["no_image"]:
+            print(f"{counts['no_image']} JSON(s) sem imagem de origem ignorados "
+                  "(recortes antigos; use --images com a pasta das imagens)")
+        print(f"Índice: {index.stats()}")
+        return 0
+
+    if args.command == "label":
+        rows = index.images_with_label(args.label)
+        for path, count in rows:
+            print(f"{count:>8}  {path}")
+        summary = f"{len(rows)} imagem(ns) com '{args.label}'"
+    elif args.command == "stats":
+        rows = index.label_counts()
+        print(f"{'label':<30}{'polígonos':>12}{'imagens':>10}")
+        for name, polygons, images in rows:
+            print(f"{name:<30}{polygons:>12}{images:>10}")
+        summary = f"{len(rows)} label(s)"
+    else:
+        rows = index.unannotated()
+        for path in rows:
+            print(path)
+        summary = f"{len(rows)} imagem(ns) sem anotações"
+    print(f"{summary} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+# Orçamento padrão de memória para imagens prontas para exibição (em MB)
+DEFAULT_BUDGET_MB = int(os.environ.get("MAPGEN_TILE_CACHE_MB", "256"))
+
+
+class RenderCache:
+    """Cache LRU de imagens já convertidas para o Tk, limitado por memória
+
+    As chaves começam pela identificação da imagem de origem, seguidas do
+    zoom e da região (ex.: ``(origem, escala, nível, coluna, linha)``), o que
+    permite invalidar de uma vez tudo o que pertence a uma imagem.
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None):
+        self.budget_bytes = budget_bytes if budget_bytes is not None else DEFAULT_BUDGET_MB * 1024 * 1024
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retorna o item em cache (marcando-o como recente) ou None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int):
+        """Armazena um item e descarta os menos usados até caber no orçamento"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes_used -= old[1]
+        self._entries[key] = (value, nbytes)
+        self.bytes_used += nbytes
+
+        while self.bytes_used > self.budget_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes_used -= size
+            self.evictions += 1
+
+    def invalidate(self, source: Optional[Hashable] = None):
+        """Remove as entradas de uma imagem de origem (ou todas, se None)"""
+        if source is None:
+            self._entries.clear()
+            self.bytes_used = 0
+            return
+        for key in [k for k in self._entries if k[0] == source]:
+            self.bytes_used -= self._entries.pop(key)[1]
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso do cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+            "budget": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
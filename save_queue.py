@@ -0,0 +1,76 @@
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Threads que codificam e gravam os recortes (o OpenCV libera o GIL ao codificar)
+DEFAULT_WORKERS = int(os.environ.get("MAPGEN_SAVE_WORKERS", "2"))
+
+
+def write_crop(crop: np.ndarray, path: str, metadata: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Codifica o recorte RGBX e grava a imagem (e o JSON de metadados, se dado) (roda em uma thread do pool)"""
+    bgr = cv2.cvtColor(crop, cv2.COLOR_RGBA2BGR)
+    params = [cv2.IMWRITE_JPEG_QUALITY, 95] if path.lower().endswith(('.jpg', '.jpeg')) else []
+    if not cv2.imwrite(path, bgr, params):
+        raise OSError(f"falha ao gravar {path}")
+    if metadata is None:
+        return [path]
+
+    json_path = os.path.splitext(path)[0] + ".json"
+    return [path, write_json(json_path, metadata)]
+
+
+def write_json(path: str, data: Dict[str, Any]) -> str:
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
+    return path
+
+
+class SaveQueue:
+    """Fila de gravações em segundo plano
+
+    `submit` retorna imediatamente; `poll` (chamado na thread do Tk)
+    devolve as gravações concluídas, com o resultado ou o erro.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self._executor = ThreadPoolExecutor(max_workers=workers or DEFAULT_WORKERS, thread_name_prefix="save")
+        self._jobs: List[Tuple[str, Future]] = []
+        self.completed = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        """Gravações ainda pendentes"""
+        return len(self._jobs)
+
+    def submit(self, description: str, fn: Callable, *args) -> Future:
+        future = self._executor.submit(fn, *args)
+        self._jobs.append((description, future))
+        return future
+
+    def poll(self) -> List[Tuple[str, Any, Optional[BaseException]]]:
+        """Gravações concluídas desde a última chamada: (descrição, resultado, erro)"""
+        done, pending = [], []
+        for description, future in self._jobs:
+            if not future.done():
+                pending.append((description, future))
+                continue
+            error = future.exception()
+            if error is None:
+                self.completed += 1
+                done.append((description, future.result(), None))
+            else:
+                self.failed += 1
+                done.append((description, None, error))
+        self._jobs = pending
+        return done
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._jobs), "completed": self.completed, "failed": self.failed}
+
+    def shutdown(self, wait: bool = True):
+        """Espera as gravações pendentes (com `wait`) e encerra as threads"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,142 @@
+import tkinter as tk
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+
+# Ordem de empilhamento das camadas (da mais baixa para a mais alta)
+LAYER_ORDER = ("image", "polygons", "current", "crop", "temp", "welcome")
+
+
+class SceneLayer:
+    """Camada de itens persistentes do canvas, sincronizada por quadro"""
+
+    def __init__(self, scene: "CanvasScene", name: str):
+        self.scene = scene
+        self.name = name
+        self.touched: Set[Hashable] = set()
+
+    def item(self, key: Hashable, kind: str, coords, **options) -> int:
+        """Cria ou atualiza no lugar o item identificado por `key`"""
+        self.touched.add(key)
+        return self.scene.upsert(self.name, key, kind, coords, **options)
+
+
+class CanvasScene:
+    """Grafo de cena retido: cada elemento desenhado mantém um ID fixo no canvas
+
+    Os itens só são recriados quando aparecem pela primeira vez; nas
+    atualizações seguintes apenas `coords`/`itemconfig` são chamados, e
+    somente se as coordenadas ou opções realmente mudaram.
+    """
+
+    def __init__(self, canvas: tk.Canvas):
+        self.canvas = canvas
+        self._items: Dict[Hashable, int] = {}
+        self._layer_of: Dict[Hashable, str] = {}
+        self._coords: Dict[Hashable, Tuple[float, ...]] = {}
+        self._options: Dict[Hashable, Dict[str, Any]] = {}
+        self._layer_keys: Dict[str, Set[Hashable]] = {name: set() for name in LAYER_ORDER}
+        self.created = 0
+        self.updated = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def item_id(self, key: Hashable) -> Optional[int]:
+        """Retorna o ID do item no canvas associado à chave"""
+        return self._items.get(key)
+
+    @contextmanager
+    def layer(self, name: str, prune: bool = True) -> Iterator[SceneLayer]:
+        """Sincroniza uma camada; itens não tocados são removidos ao final se `prune`"""
+        layer = SceneLayer(self, name)
+        yield layer
+        if prune:
+            stale = self._layer_keys[name] - layer.touched
+            for key in stale:
+                self.discard(key)
+
+    def upsert(self, layer: str, key: Hashable, kind: str, coords, **options) -> int:
+        """Cria o item se necessário, senão aplica apenas o que mudou"""
+        flat = _flatten(coords)
+        options["tags"] = _with_layer_tag(options.get("tags"), layer)
+        item = self._items.get(key)
+        if item is None:
+            item = getattr(self.canvas, f"create_{kind}")(*flat, **options)
+            self._items[key] = item
+            self._layer_of[key] = layer
+            self._coords[key] = flat
+            self._options[key] = dict(options)
+            self._layer_keys[layer].add(key)
+            self._restack(item, layer)
+            self.created += 1
+            return item
+
+        if self._coords[key] != flat:
+            self.canvas.coords(item, *flat)
+            self._coords[key] = flat
+            self.updated += 1
+
+        cached = self._options[key]
+        changed = {k: v for k, v in options.items() if cached.get(k) != v}
+        if changed:
+            self.canvas.itemconfig(item, **changed)
+            cached.update(changed)
+            self.updated += 1
+        return item
+
+    def discard(self, key: Hashable):
+        """Remove um item da cena e do canvas, se existir"""
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        self.canvas.delete(item)
+        self._layer_keys[self._layer_of.pop(key)].discard(key)
+        self._coords.pop(key, None)
+        self._options.pop(key, None)
+
+    def clear_layer(self, name: str):
+        """Remove todos os itens de uma camada"""
+        for key in list(self._layer_keys[name]):
+            self.discard(key)
+
+    def clear(self):
+        """Remove todos os itens gerenciados (e qualquer resto no canvas)"""
+        self.canvas.delete("all")
+        self._items.clear()
+        self._layer_of.clear()
+        self._coords.clear()
+        self._options.clear()
+        for keys in self._layer_keys.values():
+            keys.clear()
+
+    def _restack(self, item: int, layer: str):
+        """Posiciona um item recém-criado abaixo da primeira camada superior ocupada"""
+        for name in LAYER_ORDER[LAYER_ORDER.index(layer) + 1:]:
+            if self._layer_keys[name]:
+                # Com uma tag, o Tk usa o item mais baixo da camada na lista de exibição
+                self.canvas.tag_lower(item, f"layer_{name}")
+                return
+
+
+def _with_layer_tag(tags, layer: str) -> Tuple[str, ...]:
+    """Acrescenta a tag da camada às tags informadas pelo chamador"""
+    if tags is None:
+        tags = ()
+    elif isinstance(tags, str):
+        tags = (tags,)
+    return tuple(tags) + (f"layer_{layer}",)
+
+
+def _flatten(coords) -> Tuple[float, ...]:
+    """Converte [(x, y), ...] ou (x1, y1, ...) em uma tupla plana"""
+    flat: List[float] = []
+    for value in coords:
+        if isinstance(value, (tuple, list)):
+            flat.extend(value)
+        else:
+            flat.append(value)
+    return tuple(flat)
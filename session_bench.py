@@ -0,0 +1,129 @@
+"""Benchmark sem interface das operações de `AnnotationSession`
+
+Uso:
+    python main.py bench [--vertices N] [--polygon-size K] [--workers W] [--seed S]
+
+Cada processo monta uma sessão com N vértices (polígonos de K vértices)
+e mede o custo de cada operação isoladamente.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from annotation_session import AnnotationSession
+
+
+class OperationTimer:
+    """Acumula a duração de cada chamada, por nome de operação"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def run(self, name: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples[name].append(time.perf_counter() - start)
+        return result
+
+
+def random_polygon(rng: np.random.Generator, cx: float, cy: float, size: int, radius: float):
+    """Polígono estrelado (simples) com `size` vértices em volta de (cx, cy)"""
+    angles = np.sort(rng.uniform(0, 2 * np.pi, size))
+    radii = rng.uniform(0.5 * radius, radius, size)
+    return np.column_stack((cx + radii * np.cos(angles), cy + radii * np.sin(angles))).round().tolist()
+
+
+def run_session(vertices: int, polygon_size: int, seed: int,
+                width: int = 20000, height: int = 20000) -> Dict[str, List[float]]:
+    """Executa um roteiro de edição em uma sessão e retorna as amostras de tempo (roda em um processo)"""
+    rng = np.random.default_rng(seed)
+    session = AnnotationSession(width, height, image_path=f"bench_{seed}.png")
+    timer = OperationTimer()
+    count = max(1, vertices // polygon_size)
+    radius = 40.0
+
+    centers = rng.uniform(radius, (width - radius, height - radius), (count, 2))
+    for i, (cx, cy) in enumerate(centers):
+        for x, y in random_polygon(rng, cx, cy, polygon_size, radius):
+            timer.run("add_vertex", session.add_vertex, x, y)
+        timer.run("finalize_polygon", session.finalize_polygon, "objeto", i + 1)
+
+    probes = rng.integers(0, count, 200)
+    for p in probes:
+        polygon = session.polygons[int(p)]
+        vx, vy = polygon.points[0].tolist()
+        timer.run("select_at", session.select_at, vx, vy, 5.0)
+        if timer.run("begin_vertex_drag", session.begin_vertex_drag, vx, vy, 5.0):
+            for step in range(10):
+                timer.run("drag_vertex", session.drag_vertex, vx + step, vy + step)
+            timer.run("end_vertex_drag", session.end_vertex_drag)
+
+    for _ in range(50):
+        timer.run("undo", session.undo)
+    for _ in range(50):
+        timer.run("redo", session.redo)
+    for _ in range(20):
+        timer.run("delete_polygon", session.delete_polygon)
+
+    timer.run("centroids", session.polygons.centroids)
+    timer.run("polygons_metadata", session.polygons_metadata)
+    with tempfile.TemporaryDirectory() as tmp:
+        timer.run("save_polygons", session.save_polygons, os.path.join(tmp, "bench.json"))
+    timer.run("clear", session.clear)
+    timer.run("undo_clear", session.undo)
+    return dict(timer.samples)
+
+
+def summarize(samples: Dict[str, List[float]]) -> List[Dict[str, Any]]:
+    """Número de chamadas, média e máximo (em microssegundos) de cada operação"""
+    rows = []
+    for name, values in samples.items():
+        values = np.asarray(values) * 1e6
+        rows.append({"operation": name, "calls": len(values),
+                     "mean_us": float(values.mean()), "max_us": float(values.max())})
+    return rows
+
+
+def run_bench(vertices: int, polygon_size: int, workers: int = 1, seed: int = 0,
+              progress=print) -> List[Dict[str, Any]]:
+    """Roda uma sessão por processo e junta as amostras de todas"""
+    merged: Dict[str, List[float]] = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_session, vertices, polygon_size, seed + i) for i in range(workers)]
+        for future in futures:
+            for name, values in future.result().items():
+                merged[name].extend(values)
+
+    rows = summarize(merged)
+    progress(f"{workers} sessão(ões) de {vertices} vértices (polígonos de {polygon_size})")
+    progress(f"{'operação':<20}{'chamadas':>10}{'média (us)':>14}{'máximo (us)':>14}")
+    for row in rows:
+        progress(f"{row['operation']:<20}{row['calls']:>10}{row['mean_us']:>14.1f}{row['max_us']:>14.1f}")
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ponto de entrada da linha de comando"""
+    parser = argparse.ArgumentParser(
+        prog="main.py bench",
+        description="Mede o custo das operações de anotação sem abrir a interface"
+    )
+    parser.add_argument("--vertices", type=int, default=100000, help="vértices por sessão (padrão: 100000)")
+    parser.add_argument("--polygon-size", type=int, default=20, help="vértices por polígono (padrão: 20)")
+    parser.add_argument("--workers", type=int, default=1, help="sessões em processos paralelos (padrão: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="semente dos dados aleatórios")
+    args = parser.parse_args(argv)
+
+    run_bench(args.vertices, args.polygon_size, args.workers, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
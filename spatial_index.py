@@ -0,0 +1,171 @@
+import itertools
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+Point = Tuple[float, float]
+Cell = Tuple[int, int]
+
+
+class SpatialIndex:
+    """Grade uniforme sobre vértices e caixas delimitadoras dos polígonos
+
+    Os polígonos são endereçados pela posição na lista do editor, mas
+    internamente cada um recebe uma chave estável; assim, remover um
+    polígono não exige renumerar as células da grade.
+    """
+
+    def __init__(self, cell_size: float = 64.0, bbox_cell_size: float = 256.0):
+        self.cell_size = cell_size
+        self.bbox_cell_size = bbox_cell_size
+        self._next_key = itertools.count()
+        self._order: List[int] = []  # posição -> chave
+        self._points: Dict[int, List[Point]] = {}
+        self._bbox: Dict[int, Tuple[float, float, float, float]] = {}
+        self._vertex_cells: Dict[Cell, Set[Tuple[int, int]]] = defaultdict(set)
+        self._bbox_cells: Dict[Cell, Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def rebuild(self, polygons: Iterable[Sequence[Point]]):
+        """Reconstrói o índice a partir da lista completa de polígonos"""
+        self.clear()
+        for points in polygons:
+            self.append(points)
+
+    def clear(self):
+        """Remove todos os polígonos do índice"""
+        self._order.clear()
+        self._points.clear()
+        self._bbox.clear()
+        self._vertex_cells.clear()
+        self._bbox_cells.clear()
+
+    def append(self, points: Sequence[Point]):
+        """Indexa um novo polígono no fim da lista"""
+        self.insert(len(self._order), points)
+
+    def insert(self, position: int, points: Sequence[Point]):
+        """Indexa um polígono na posição dada"""
+        key = next(self._next_key)
+        self._order.insert(position, key)
+        if hasattr(points, "tolist"):  # Arrays NumPy viram listas de floats Python
+            points = points.tolist()
+        self._points[key] = [(x, y) for x, y in points]
+        for v_idx, point in enumerate(self._points[key]):
+            self._vertex_cells[self._cell(point)].add((key, v_idx))
+        self._set_bbox(key)
+
+    def delete(self, position: int):
+        """Remove o polígono da posição dada"""
+        key = self._order.pop(position)
+        for v_idx, point in enumerate(self._points.pop(key)):
+            self._discard(self._vertex_cells, self._cell(point), (key, v_idx))
+        for cell in self._bbox_cell_range(self._bbox.pop(key)):
+            self._discard(self._bbox_cells, cell, key)
+
+    def update(self, position: int, points: Sequence[Point]):
+        """Substitui a geometria de um polígono"""
+        self.delete(position)
+        self.insert(position, points)
+
+    def move_vertex(self, position: int, v_idx: int, point: Point):
+        """Atualiza a posição de um único vértice"""
+        key = self._order[position]
+        points = self._points[key]
+        old_cell, new_cell = self._cell(points[v_idx]), self._cell(point)
+        if old_cell != new_cell:
+            self._discard(self._vertex_cells, old_cell, (key, v_idx))
+            self._vertex_cells[new_cell].add((key, v_idx))
+        points[v_idx] = point
+
+        old_cells = set(self._bbox_cell_range(self._bbox[key]))
+        self._bbox[key] = _bounds(points)
+        new_cells = set(self._bbox_cell_range(self._bbox[key]))
+        for cell in old_cells - new_cells:
+            self._discard(self._bbox_cells, cell, key)
+        for cell in new_cells - old_cells:
+            self._bbox_cells[cell].add(key)
+
+    def nearest_vertex(self, x: float, y: float, radius: float) -> Optional[Tuple[int, int]]:
+        """Vértice mais próximo dentro do raio, como (posição do polígono, índice do vértice)"""
+        cx0, cy0 = self._cell((x - radius, y - radius))
+        cx1, cy1 = self._cell((x + radius, y + radius))
+        best = None
+        best_dist = radius * radius
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for key, v_idx in self._vertex_cells.get((cx, cy), ()):
+                    px, py = self._points[key][v_idx]
+                    dist = (px - x) ** 2 + (py - y) ** 2
+                    if dist <= best_dist:
+                        best, best_dist = (key, v_idx), dist
+        if best is None:
+            return None
+        return self._order.index(best[0]), best[1]
+
+    def polygon_near(self, x: float, y: float, radius: float) -> Optional[int]:
+        """Posição do polígono mais acima (último desenhado) com uma aresta dentro do raio
+
+        Só o contorno conta, como nos polígonos desenhados sem preenchimento:
+        cliques no interior continuam livres para adicionar pontos.
+        """
+        size = self.bbox_cell_size
+        candidates = set()
+        for cx in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for cy in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                candidates.update(self._bbox_cells.get((cx, cy), ()))
+        best = None
+        for key in candidates:
+            x0, y0, x1, y1 = self._bbox[key]
+            if not (x0 - radius <= x <= x1 + radius and y0 - radius <= y <= y1 + radius):
+                continue
+            if distance_to_outline(x, y, self._points[key]) <= radius:
+                position = self._order.index(key)
+                if best is None or position > best:
+                    best = position
+        return best
+
+    def _cell(self, point: Point) -> Cell:
+        return int(point[0] // self.cell_size), int(point[1] // self.cell_size)
+
+    def _set_bbox(self, key: int):
+        self._bbox[key] = _bounds(self._points[key])
+        for cell in self._bbox_cell_range(self._bbox[key]):
+            self._bbox_cells[cell].add(key)
+
+    def _bbox_cell_range(self, bbox: Tuple[float, float, float, float]):
+        size = self.bbox_cell_size
+        x0, y0, x1, y1 = bbox
+        for cx in range(int(x0 // size), int(x1 // size) + 1):
+            for cy in range(int(y0 // size), int(y1 // size) + 1):
+                yield cx, cy
+
+    @staticmethod
+    def _discard(cells: Dict, cell: Cell, entry):
+        bucket = cells.get(cell)
+        if bucket is not None:
+            bucket.discard(entry)
+            if not bucket:
+                del cells[cell]
+
+
+def _bounds(points: Sequence[Point]) -> Tuple[float, float, float, float]:
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def distance_to_outline(x: float, y: float, points: Sequence[Point]) -> float:
+    """Menor distância do ponto às arestas do polígono fechado"""
+    best = float("inf")
+    n = len(points)
+    for i in range(n):
+        ax, ay = points[i - 1]
+        bx, by = points[i]
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length))
+        px, py = ax + t * dx - x, ay + t * dy - y
+        best = min(best, px * px + py * py)
+    return best ** 0.5
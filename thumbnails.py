@@ -0,0 +1,198 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import cv2
+
+from image_io import image_size
+
+DEFAULT_THUMB_DIR = os.environ.get("MAPGEN_THUMB_DIR", os.path.join(os.path.expanduser("~"), ".mapgen", "thumbnails"))
+# Maior lado das miniaturas, em pixels
+THUMB_SIZE = int(os.environ.get("MAPGEN_THUMB_SIZE", "128"))
+# Processos que geram as miniaturas (padrão: número de CPUs)
+DEFAULT_WORKERS = int(os.environ.get("MAPGEN_THUMB_WORKERS", "0")) or None
+
+# Tentativas de uma miniatura quando um processo do pool morre (ele derruba os pedidos na fila)
+MAX_ATTEMPTS = 3
+
+# Decodificação já reduzida (o JPEG é reduzido na própria DCT), do fator maior para o menor
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def thumbnail_path(path: str, size: int = THUMB_SIZE, directory: Optional[str] = None) -> str:
+    """Arquivo da miniatura: hash do caminho, mtime, tamanho do arquivo e lado da miniatura
+
+    Levanta OSError se a imagem não existir. Uma imagem alterada ganha uma
+    miniatura nova; subpastas pelo início do hash evitam pastas enormes.
+    """
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{size}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    return os.path.join(directory or DEFAULT_THUMB_DIR, digest[:2], digest + ".jpg")
+
+
+def decode_reduced(path: str, size: int):
+    """Imagem BGR decodificada na menor redução que ainda tem `size` pixels no maior lado"""
+    dims = image_size(path)
+    flag = cv2.IMREAD_COLOR
+    if dims is not None:
+        for factor, reduced in REDUCED_FLAGS:
+            if max(dims) // factor >= size:
+                flag = reduced
+                break
+    return cv2.imread(path, flag)
+
+
+def make_thumbnail(path: str, out_path: str, size: int = THUMB_SIZE) -> Optional[str]:
+    """Gera e grava a miniatura JPEG de uma imagem (roda em um processo do pool)"""
+    bgr = decode_reduced(path, size)
+    if bgr is None:
+        return None
+    height, width = bgr.shape[:2]
+    scale = size / max(width, height)
+    if scale < 1:
+        bgr = cv2.resize(bgr, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # Grava com outro nome e renomeia: quem lê nunca vê uma miniatura pela metade
+    partial = f"{os.path.splitext(out_path)[0]}.{os.getpid()}.partial.jpg"
+    if not cv2.imwrite(partial, bgr, [cv2.IMWRITE_JPEG_QUALITY, 85]):
+        raise OSError(f"falha ao gravar {out_path}")
+    os.replace(partial, out_path)
+    return out_path
+
+
+class ThumbnailService:
+    """Miniaturas em cache no disco, geradas sob demanda em um pool de processos
+
+    `request` devolve a miniatura se ela já existe ou agenda sua geração;
+    `poll` (na thread do Tk) devolve as que ficaram prontas. `retain`
+    cancela pedidos que deixaram de ser necessários (ex.: células que
+    saíram da tela), então rolar por pastas grandes não enfileira milhares
+    de miniaturas.
+    """
+
+    def __init__(self, directory: Optional[str] = None, size: int = THUMB_SIZE,
+                 workers: Optional[int] = DEFAULT_WORKERS):
+        self.directory = directory or DEFAULT_THUMB_DIR
+        self.size = size
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Tuple[Future, ProcessPoolExecutor]] = {}  # Imagem -> geração e seu pool
+        self._attempts: Dict[str, int] = {}
+        # Pelo arquivo da miniatura, que muda quando a imagem muda
+        self._known: Set[str] = set()  # Miniaturas já existentes
+        self._unreadable: Set[str] = set()  # Versões de imagens que falharam (não são pedidas de novo)
+        self.generated = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        """Miniaturas em geração"""
+        return len(self._jobs)
+
+    def cached(self, path: str) -> Optional[str]:
+        """Miniatura já gerada da versão atual da imagem, ou None"""
+        try:
+            thumb = thumbnail_path(path, self.size, self.directory)
+        except OSError:
+            return None
+        if thumb in self._known:
+            return thumb
+        if not os.path.exists(thumb):
+            return None
+        self._known.add(thumb)
+        return thumb
+
+    def request(self, path: str) -> Optional[str]:
+        """Miniatura da imagem se já existir; senão agenda a geração e retorna None"""
+        try:
+            out_path = thumbnail_path(path, self.size, self.directory)
+        except OSError:
+            return None
+        if out_path in self._known or os.path.exists(out_path):
+            self._known.add(out_path)
+            return out_path
+        if path in self._jobs or out_path in self._unreadable:
+            return None
+        pool = self._executor()
+        try:
+            future = pool.submit(make_thumbnail, path, out_path, self.size)
+        except BrokenProcessPool:
+            self._drop_pool(pool)  # Um processo morreu depois do último pedido: usa um pool novo
+            pool = self._executor()
+            future = pool.submit(make_thumbnail, path, out_path, self.size)
+        self._jobs[path] = (future, pool)
+        self._attempts[path] = self._attempts.get(path, 0) + 1
+        return None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn": os processos não herdam as threads e o estado do Tk do processo principal
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _drop_pool(self, pool: ProcessPoolExecutor):
+        if self._pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def retain(self, paths: Iterable[str]):
+        """Cancela os pedidos de imagens fora de `paths` que ainda não começaram"""
+        keep = set(paths)
+        for path in [p for p in self._jobs if p not in keep]:
+            if self._jobs[path][0].cancel():
+                del self._jobs[path]
+                self._attempts.pop(path, None)
+                self.cancelled += 1
+
+    def poll(self) -> List[Tuple[str, Optional[str]]]:
+        """Gerações concluídas desde a última chamada: (imagem, miniatura ou None se falhou)"""
+        done, retry = [], []
+        for path, (future, pool) in list(self._jobs.items()):
+            if not future.done():
+                continue
+            del self._jobs[path]
+            try:
+                thumb = future.result()
+            except BrokenProcessPool:
+                # O pool quebrou (não necessariamente por esta imagem): pede de novo em um pool novo
+                self._drop_pool(pool)
+                if self._attempts.get(path, 0) < MAX_ATTEMPTS:
+                    retry.append(path)
+                    continue
+                thumb = None
+            except Exception:
+                thumb = None
+            self._attempts.pop(path, None)
+            if thumb is None:
+                self.failed += 1
+                try:
+                    self._unreadable.add(thumbnail_path(path, self.size, self.directory))
+                except OSError:
+                    pass  # A imagem sumiu
+            else:
+                self.generated += 1
+                self._known.add(thumb)
+            done.append((path, thumb))
+        for path in retry:
+            self.request(path)
+        return done
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._jobs), "known": len(self._known), "generated": self.generated,
+                "failed": self.failed, "cancelled": self.cancelled}
+
+    def shutdown(self):
+        """Cancela os pedidos pendentes e encerra os processos"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._jobs.clear()
+        self._attempts.clear()
@@ -0,0 +1,81 @@
+import math
+from typing import List, NamedTuple, Sequence, Tuple
+
+from PIL import Image
+
+
+class Tile(NamedTuple):
+    """Tile visível: nível da pirâmide, posição na grade e caixa no canvas"""
+    level: int
+    col: int
+    row: int
+    box: Tuple[int, int, int, int]  # (x0, y0, x1, y1) em coordenadas do canvas
+
+
+class TilePyramid:
+    """Pirâmide de níveis potência de dois para exibir só a parte visível da imagem
+
+    O nível 0 é a própria imagem (sem cópia); cada nível seguinte tem metade
+    da resolução do anterior e é gerado uma única vez, na primeira vez em que
+    é necessário. O canvas é dividido em tiles de tamanho fixo, de modo que o
+    custo de exibir depende do tamanho da janela e não do tamanho da imagem.
+    """
+
+    def __init__(self, image: Image.Image, tile_size: int = 256, levels: Sequence[Image.Image] = ()):
+        self.tile_size = tile_size
+        self.width, self.height = image.size
+        # `levels`: níveis 1 em diante já prontos (ex.: do cache de decodificação)
+        self.levels: List[Image.Image] = [image, *levels]
+        # Último nível: a imagem inteira cabe em um único tile
+        self.max_level = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+
+    def level_for_scale(self, scale: float) -> int:
+        """Escolhe o nível mais reduzido que ainda tem resolução >= à exibida"""
+        if scale >= 1.0:
+            return 0
+        return min(int(math.floor(math.log2(1.0 / scale))), self.max_level)
+
+    def level(self, index: int) -> Image.Image:
+        """Retorna o nível pedido, gerando os intermediários se necessário"""
+        while len(self.levels) <= index:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[index]
+
+    def canvas_size(self, scale: float) -> Tuple[int, int]:
+        """Tamanho da imagem inteira no canvas para a escala dada"""
+        return max(1, round(self.width * scale)), max(1, round(self.height * scale))
+
+    def visible_tiles(self, scale: float, viewport: Tuple[float, float, float, float]) -> List[Tile]:
+        """Lista os tiles que intersectam a área visível (x0, y0, x1, y1) do canvas"""
+        level = self.level_for_scale(scale)
+        canvas_w, canvas_h = self.canvas_size(scale)
+        size = self.tile_size
+
+        x0, y0, x1, y1 = viewport
+        col0 = max(0, int(x0 // size))
+        row0 = max(0, int(y0 // size))
+        col1 = min(math.ceil(canvas_w / size), math.ceil(x1 / size))
+        row1 = min(math.ceil(canvas_h / size), math.ceil(y1 / size))
+
+        tiles = []
+        for row in range(row0, row1):
+            for col in range(col0, col1):
+                box = (col * size, row * size,
+                       min((col + 1) * size, canvas_w), min((row + 1) * size, canvas_h))
+                tiles.append(Tile(level, col, row, box))
+        return tiles
+
+    def render_tile(self, tile: Tile, scale: float) -> Image.Image:
+        """Gera a imagem de um tile já na escala de exibição"""
+        source = self.level(tile.level)
+        # Razão real entre o nível e a imagem original (reduce arredonda para cima)
+        fx = source.width / self.width
+        fy = source.height / self.height
+
+        x0, y0, x1, y1 = tile.box
+        src_box = (
+            x0 / scale * fx, y0 / scale * fy,
+            min(source.width, x1 / scale * fx), min(source.height, y1 / scale * fy)
+        )
+        resample = Image.BILINEAR if scale * (2 ** tile.level) > 1.0 else Image.LANCZOS
+        return source.resize((x1 - x0, y1 - y0), resample, box=src_box)